@@ -2,16 +2,18 @@ import json
 import os
 import sys
 
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QVBoxLayout, QHBoxLayout, QComboBox, QPushButton, QLabel, QCheckBox, QDesktopWidget, QDialog, QMessageBox, QStatusBar, QLineEdit, QSpacerItem, QSizePolicy, QFileDialog
+from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QVBoxLayout, QHBoxLayout, QComboBox, QPushButton, QLabel, QCheckBox, QDesktopWidget, QDialog, QMessageBox, QStatusBar, QLineEdit, QSpacerItem, QSizePolicy, QFileDialog, QTableWidget, QTableWidgetItem, QHeaderView
 from PyQt5.QtGui import QIntValidator
 
-from lib.Boundary_calculation import Boundary_calculation
+from lib.Ble_service import Ble_service
+from lib.Ble_task import Ble_task
 from lib.Check_status import Check_status
-from lib.Collect_window import Collect_window
+from lib.Fleet_status import Fleet_status
 from lib.Scan import Scan
 
+# The collection windows (matplotlib, pandas) and the boundary calculation (scikit-learn) are
+# imported on their first use, so the main window appears without loading them
+
 
 class MainWindow(QMainWindow):
     '''
@@ -29,6 +31,8 @@ class MainWindow(QMainWindow):
 
         self.init_ui()
 
+        self.init_known_devices()
+
 
     def init_ui(self):
 
@@ -69,6 +73,11 @@ class MainWindow(QMainWindow):
         self.check_status_button.clicked.connect(self.check_status)
         self.check_status_button.setToolTip('Get the selected device status (model, batery, etc.).')
 
+        # Create "Check all devices" button
+        self.check_fleet_button = QPushButton('Check all devices', self)
+        self.check_fleet_button.clicked.connect(self.check_fleet_status)
+        self.check_fleet_button.setToolTip('Get the status (model, batery, etc.) of all the scanned devices at once.')
+
         # Create "Settings" button
 
         self.settings_button = QPushButton('Experiment settings', self)
@@ -81,7 +90,10 @@ class MainWindow(QMainWindow):
         self.start_collecting_button.setToolTip('Starts the data collection.')
 
         # Add additional buttons to the main layout
-        layout.addWidget(self.check_status_button)
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self.check_status_button)
+        status_layout.addWidget(self.check_fleet_button)
+        layout.addLayout(status_layout)
 
         # Add vertical spacer
         spacer = QSpacerItem(20, 5, QSizePolicy.Minimum, QSizePolicy.Expanding)
@@ -111,6 +123,10 @@ class MainWindow(QMainWindow):
         self.collect_ecg_checkbox = QCheckBox('Collect ECG', self)
         self.collect_ecg_checkbox.setToolTip('Also collect ECG during the data collection.')
 
+        # Create "Collect accelerometer" checkbox
+        self.collect_acc_checkbox = QCheckBox('Collect accelerometer', self)
+        self.collect_acc_checkbox.setToolTip('Also collect the accelerometer (X, Y, Z) during the data collection.')
+
         # Create "Save current time" checkbox
         self.save_current_time_checkbox = QCheckBox('Save current time', self)
         self.save_current_time_checkbox.setToolTip('Save current machine time (HH:MM:SS) during the data collection.')
@@ -118,6 +134,7 @@ class MainWindow(QMainWindow):
         # Add checkboxes to the horizontal layout
         checkbox_layout.addWidget(self.display_graph_checkbox)
         checkbox_layout.addWidget(self.collect_ecg_checkbox)
+        checkbox_layout.addWidget(self.collect_acc_checkbox)
         checkbox_layout.addWidget(self.save_current_time_checkbox)
 
         # Add the checkbox layout to the main layout
@@ -134,6 +151,16 @@ class MainWindow(QMainWindow):
         self.tapping_experiment_checkbox.setToolTip('During data collection, when the \'B\' key is pressed, the moment it was pressed will be saved in another file.')
         layout.addWidget(self.tapping_experiment_checkbox)
 
+        # Create "Collect from all devices" checkbox
+        self.multi_device_checkbox = QCheckBox('Collect from all devices', self)
+        self.multi_device_checkbox.setToolTip('Collect at the same time from all the scanned devices. Each device is saved in its own files.')
+        layout.addWidget(self.multi_device_checkbox)
+
+        # Create "Profile session" checkbox
+        self.profile_checkbox = QCheckBox('Profile session', self)
+        self.profile_checkbox.setToolTip('Sample the stacks of all threads and take memory snapshots during the collection. The reports are saved with the output files.')
+        layout.addWidget(self.profile_checkbox)
+
         # Add vertical spacer
         spacer = QSpacerItem(20, 2, QSizePolicy.Minimum, QSizePolicy.Expanding)
         layout.addItem(spacer)
@@ -183,11 +210,36 @@ class MainWindow(QMainWindow):
                 'time_in_state_1': '40',
                 'display_decision_boundary': False,
                 'decision_boundary' : '100',
+                'telemetry_interval': '60',
+                'acc_sample_rate': '50',
             }
 
             self.write_config_file(self.setting_values)
 
 
+    def init_known_devices(self):
+        '''
+        Fill the devices list with the devices found in previous scans
+        '''
+
+        self.devices_dict = {}
+
+        if os.path.isfile('known_devices.json'):
+            with open('known_devices.json', 'r') as openfile:
+                self.devices_dict = json.load(openfile)
+
+        self.devices_dropdown.addItems(list(self.devices_dict.keys()))
+
+
+    def write_known_devices(self):
+        '''
+        Write the devices found until now on a JSON file
+        '''
+
+        with open('known_devices.json', 'w') as outfile:
+            json.dump(self.devices_dict, outfile)
+
+
     def write_config_file(self, dictionary):
         '''
         Write the config on a JSON file
@@ -214,6 +266,7 @@ class MainWindow(QMainWindow):
 
         self.scan_button.setEnabled(False)
         self.check_status_button.setEnabled(False)
+        self.check_fleet_button.setEnabled(False)
         self.start_collecting_button.setEnabled(False)
 
 
@@ -224,6 +277,7 @@ class MainWindow(QMainWindow):
 
         self.scan_button.setEnabled(True)
         self.check_status_button.setEnabled(True)
+        self.check_fleet_button.setEnabled(True)
         self.start_collecting_button.setEnabled(True)
 
 
@@ -233,10 +287,10 @@ class MainWindow(QMainWindow):
         '''
 
         self.disable_all_buttons()
-        self.devices_dict = {}
 
         # Create the worker thread to scan the bluetooth devices without locking the main thread
-        self.worker_thread = Scan()
+        # The scan stops early when all the known devices are found
+        self.worker_thread = Scan(list(self.devices_dict.keys()))
         self.worker_thread.log_signal.connect(self.update_devices_list)
         self.worker_thread.finished_signal.connect(self.scan_finished)
 
@@ -255,6 +309,9 @@ class MainWindow(QMainWindow):
             address (str): MAC address of the device founded
         '''
 
+        if name not in self.devices_dict:
+            self.devices_dropdown.addItem(name)
+
         self.devices_dict[name] = address
 
 
@@ -262,14 +319,10 @@ class MainWindow(QMainWindow):
         '''
         This function are called when the Scan WorkerThread are fineshed.
 
-        Adds the finded devices to the dropdown list
+        Saves the finded devices, so they are listed in the next start
         '''
 
-        # Clear the dropdown before adding new values
-        self.devices_dropdown.clear()
-
-        # Populate the dropdown with sample values
-        self.devices_dropdown.addItems(list(self.devices_dict.keys()))
+        self.write_known_devices()
 
         self.enable_all_buttons()
 
@@ -327,11 +380,79 @@ class MainWindow(QMainWindow):
         self.enable_all_buttons()
 
 
+    def check_fleet_status(self):
+        '''
+        This functions starts a WorkerThread that get the status of all scanned devices at once
+        '''
+
+        if not self.devices_dict:
+            QMessageBox.warning(self, "Error", "No devices found\nScan the devices first.")
+            return
+
+        self.disable_all_buttons()
+
+        # Table filled as the results arrive
+        self.fleet_dialog = QDialog(self)
+        self.fleet_dialog.setWindowTitle("Devices status")
+        self.fleet_dialog.resize(700, 100 + 30 * len(self.devices_dict))
+
+        layout = QVBoxLayout(self.fleet_dialog)
+
+        self.fleet_table = QTableWidget(0, 6, self.fleet_dialog)
+        self.fleet_table.setHorizontalHeaderLabels(['Device', 'Address', 'Status', 'Model', 'Battery', 'Time (s)'])
+        self.fleet_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.fleet_table.verticalHeader().setVisible(False)
+        layout.addWidget(self.fleet_table)
+
+        self.fleet_label = QLabel(f'Checking {len(self.devices_dict)} devices...', self.fleet_dialog)
+        layout.addWidget(self.fleet_label)
+
+        self.fleet_dialog.show()
+
+        # Create the worker thread that checks all devices concurrently
+        self.worker_thread = Fleet_status(dict(self.devices_dict))
+        self.worker_thread.result_signal.connect(self.fleet_status_result)
+        self.worker_thread.finished_signal.connect(self.fleet_status_finished)
+
+        # Start the worker thread
+        self.worker_thread.start()
+
+
+    def fleet_status_result(self, name, address, status, model, battery, elapsed):
+        '''
+        This function are called when the status of one device is ready.
+
+        Adds the device status to the table
+        '''
+
+        row = self.fleet_table.rowCount()
+        self.fleet_table.insertRow(row)
+
+        values = [name, address, 'OK' if not status else 'Error', model, battery, f'{elapsed:.1f}']
+        for column, value in enumerate(values):
+            self.fleet_table.setItem(row, column, QTableWidgetItem(value))
+
+
+    def fleet_status_finished(self, total):
+        '''
+        This function are called when the Fleet_status WorkerThread are fineshed.
+        '''
+
+        self.fleet_label.setText(f'{self.fleet_table.rowCount()} devices checked in {total:.1f} s')
+
+        self.enable_all_buttons()
+
+
     def start_collecting(self):
         '''
         This functions display the Collecting window and starts to collect data
         '''
 
+        # If the collection uses all the scanned devices
+        if self.multi_device_checkbox.isChecked():
+            self.start_multi_collecting()
+            return
+
         # If there is no selected devices
         if self.devices_dropdown.currentText() == '':
             QMessageBox.warning(self, "Error", "No devices selected\nSelect a device first.")
@@ -344,6 +465,8 @@ class MainWindow(QMainWindow):
         
         address = self.devices_dict[self.devices_dropdown.currentText()]
 
+        from lib.Collect_window import Collect_window
+
         self.hide()
         self.collect_window = Collect_window(self,
                                             self.devices_dropdown.currentText(),
@@ -353,7 +476,38 @@ class MainWindow(QMainWindow):
                                             self.save_current_time_checkbox.isChecked(),
                                             self.output_filename_edit.text(),
                                             self.tapping_experiment_checkbox.isChecked(),
-                                            self.setting_values,
+                                            dict(self.setting_values, profile=self.profile_checkbox.isChecked()),
+                                            self.collect_acc_checkbox.isChecked(),
+        )
+        self.collect_window.show()
+
+
+    def start_multi_collecting(self):
+        '''
+        This functions display the multi-device Collecting window and starts to collect data
+        from all the scanned devices
+        '''
+
+        # If there is no scanned devices
+        if self.devices_dropdown.count() == 0:
+            QMessageBox.warning(self, "Error", "No devices found\nScan the devices first.")
+            return
+
+        # If output filename field is empty
+        if self.output_filename_edit.text() == '':
+            QMessageBox.warning(self, "Error", "The field \"Output filename\" is empty.")
+            return
+
+        from lib.Multi_collect_window import Multi_collect_window
+
+        self.hide()
+        self.collect_window = Multi_collect_window(self,
+                                                  dict(self.devices_dict),
+                                                  self.collect_ecg_checkbox.isChecked(),
+                                                  self.save_current_time_checkbox.isChecked(),
+                                                  self.output_filename_edit.text(),
+                                                  dict(self.setting_values, profile=self.profile_checkbox.isChecked()),
+                                                  self.collect_acc_checkbox.isChecked(),
         )
         self.collect_window.show()
 
@@ -361,60 +515,123 @@ class MainWindow(QMainWindow):
     def select_folder(self):
         '''
         '''
-        # Open a folder selection dialog
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select a File", "", "All Files (*);;Text Files (*.txt)")
+        # Open a file selection dialog, one or several sessions are calibrated together
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Select the session files", "", "All Files (*);;CSV Files (*.csv)")
 
-        if file_path:  # If a folder is selected
+        if file_paths:  # If files are selected
             self.ok_button.setEnabled(False)
-            self.find_best_boundary(file_path)
+            self.find_best_boundary(file_paths)
 
 
     def find_best_boundary(self, path):
         '''
-        This function calculate the best boundary from a file.
+        This function calculate the best boundary from one or several files.
 
         It is necessary to set a RR window size to calculate the sdNN correct
         '''
+        from lib.Boundary_calculation import Boundary_calculation
+        from lib import Hrv_features
+
+        # The windows of the candidate features include the one of the sdNN displayed
+        windows = Hrv_features.WINDOWS + [int(self.setting_values['rr_window'])]
+
         # Create the worker thread with the number of steps
-        self.worker_thread = Boundary_calculation(path)
+        self.worker_thread = Boundary_calculation(path, windows)
         self.worker_thread.finished_signal.connect(self.find_best_boundary_finished)
 
         # Start the worker thread
         self.worker_thread.start()
 
 
-    def find_best_boundary_finished(self, best_boundary, std, tmp1):
+    def find_best_boundary_finished(self, result):
         '''
         Function are called when the WorkThread finished.
 
-        This function shows a plot with the data and the best boundary.
+        This function shows the information score of each candidate feature and the values of the
+        best one with its boundary. The boundary of the variable displayed is set in the settings
+        when it was found and fits the decision boundary field.
         '''
 
-        self.threshold_line_textbox.setText(str(best_boundary))
+        import numpy as np
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from lib import Calibration
+        from lib import Hrv_features
+
+        features = {feature['name']: feature for feature in result['features']}
+
+        # Only the boundary of the variable displayed by the collection applies to the settings
+        if self.setting_values['representation_type'] == 1:
+            displayed = f'sdNN {self.setting_values["rr_window"]}'
+            candidates = [displayed, Calibration.FILE_FEATURE]
+        else:
+            displayed = 'HR 1'
+            candidates = [displayed]
+
+        selected = next((name for name in candidates if name in features), None)
+        validator = self.threshold_line_textbox.validator()
+
+        if selected is None:
+            message = f'No boundary of {displayed} (the variable displayed) was found, the settings were not changed.'
+        elif not validator.bottom() <= round(features[selected]['threshold']) <= validator.top():
+            message = (f'The boundary of {selected} ({features[selected]["threshold"]:.1f}) is outside '
+                       f'{validator.bottom()}-{validator.top()}, the settings were not changed.')
+        else:
+            self.threshold_line_textbox.setText(str(round(features[selected]['threshold'])))
+            message = f'Decision boundary set to the boundary of {selected} ({features[selected]["threshold"]:.1f}).'
 
         dialog = QDialog(self)
         dialog.setWindowTitle("Best boundary")
 
         layout = QVBoxLayout(dialog)
 
-        fig, ax = Figure(figsize=(10,8), dpi=100), None
+        fig = Figure(figsize=(12,7), dpi=100)
         canvas = FigureCanvas(fig)
-        canvas_widget = canvas
-        layout.addWidget(canvas_widget)
+        layout.addWidget(canvas)
 
-        # Initial plot
-        ax = fig.add_subplot(111)
-        scatter = ax.scatter(tmp1, std)
-        line, = ax.plot(tmp1, [best_boundary for _ in range(len(tmp1))], color='red')
-        
-        # Set xlabel and ylabel
-        ax.set_xlabel('Window')
-        ax.set_ylabel('sdNN')
+        if result['best'] is not None:
+            # Information score of each feature, by window size
+            ax = fig.add_subplot(121)
+            families = {}
+            for feature in result['features']:
+                family, window = Hrv_features.feature_family(feature['name'])
+                families.setdefault(family, []).append((window or 0, feature['score']))
+
+            for family, points in families.items():
+                points.sort()
+                ax.plot([window for window, _ in points], [score for _, score in points], marker='o', label=family)
+
+            ax.set_xlabel('RR window (beats)')
+            ax.set_ylabel('Mutual information with the real state (nats)')
+            ax.set_title(f'Best: {result["best"]}')
+            ax.legend()
+
+            # Values of the best feature in each state, with the boundary
+            ax = fig.add_subplot(122)
+            values, states = Calibration.feature_values(result, result['best'])
+            bins = np.histogram_bin_edges(values, bins=50)
+
+            for state in np.unique(states):
+                ax.hist(values[states == state], bins=bins, alpha=0.5, label=f'State {state}')
+
+            ax.axvline(result['threshold'], color='red', label=f'Boundary {result["threshold"]:.1f}')
+            ax.set_xlabel(result['best'])
+            ax.set_ylabel('Beats')
+            ax.legend()
+
+        fig.tight_layout()
+
+        # Ranking of the features and agreement of each session
+        report_label = QLabel(result['report'])
+        report_label.setStyleSheet('font-family: monospace')
+        layout.addWidget(report_label)
+
+        layout.addWidget(QLabel(message))
 
         dialog.exec_()  # Use exec_() to display the dialog
         self.ok_button.setEnabled(True)
 
-    
+
     def settings(self):
         '''
         Draw a window to manage collection settings
@@ -461,8 +678,30 @@ class MainWindow(QMainWindow):
         rr_window_size_textbox.setValidator(QIntValidator(1,999))
         rr_window_size_textbox.setToolTip('Set the window size to calculate sdNN. Only used when \"sdNN\" is the representation type.')
 
+        telemetry_interval = QLabel("Telemetry interval (s):")
+        telemetry_interval_textbox = QLineEdit(default_values.get('telemetry_interval', '60'))
+        telemetry_interval_textbox.setValidator(QIntValidator(1,3600))
+        telemetry_interval_textbox.setToolTip('Interval between two readings of the device battery and connection parameters during the collection.')
+
         h_layout.addWidget(rr_window_size)
         h_layout.addWidget(rr_window_size_textbox)
+        h_layout.addWidget(telemetry_interval)
+        h_layout.addWidget(telemetry_interval_textbox)
+        inner_spacer = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Maximum)
+        h_layout.addItem(inner_spacer)
+
+        layout.addLayout(h_layout)
+
+        h_layout = QHBoxLayout()
+
+        acc_sample_rate = QLabel("Accelerometer sample rate (Hz):")
+        acc_sample_rate_dropdown = QComboBox(self)
+        acc_sample_rate_dropdown.addItems(['25', '50', '100', '200'])
+        acc_sample_rate_dropdown.setCurrentText(default_values.get('acc_sample_rate', '50'))
+        acc_sample_rate_dropdown.setToolTip('Sample rate requested for the accelerometer. Only used when \"Collect accelerometer\" is checked.')
+
+        h_layout.addWidget(acc_sample_rate)
+        h_layout.addWidget(acc_sample_rate_dropdown)
         inner_spacer = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Maximum)
         h_layout.addItem(inner_spacer)
 
@@ -559,6 +798,8 @@ class MainWindow(QMainWindow):
             aux.append(time_in_state_1_textbox.text() if time_in_state_1_textbox.text() != '' else self.setting_values['time_in_state_1'])
             aux.append(display_thershold_checkbox.isChecked())
             aux.append(self.threshold_line_textbox.text() if self.threshold_line_textbox.text() != '' else self.setting_values['threshold_line'])
+            aux.append(telemetry_interval_textbox.text() if telemetry_interval_textbox.text() != '' else self.setting_values.get('telemetry_interval', '60'))
+            aux.append(acc_sample_rate_dropdown.currentText())
 
 
             self.setting_values = {
@@ -572,6 +813,8 @@ class MainWindow(QMainWindow):
                 'time_in_state_1': aux[7],
                 'display_decision_boundary': aux[8],
                 'decision_boundary' : aux[9],
+                'telemetry_interval': aux[10],
+                'acc_sample_rate': aux[11],
             }
 
             self.write_config_file(self.setting_values)
@@ -594,7 +837,19 @@ class MainWindow(QMainWindow):
         dialog.exec_()  # Use exec_() to display the dialog
 
 
+def quit_application():
+    '''
+    Stop the collections still running, so their data is saved, then the bluetooth service
+
+    This function is connected to the aboutToQuit signal of the application
+    '''
+
+    Ble_task.stop_all()
+    Ble_service.shutdown()
+
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(quit_application)
     window = MainWindow()
     sys.exit(app.exec_())
@@ -0,0 +1,155 @@
+'''
+Decision boundary search: check of the vectorized mutual information search against the brute
+force reference (one scikit-learn score per threshold) and speed of both across data sizes.
+
+The check runs on random datasets with continuous, rounded (many equal values) and multi-class
+data, and fails (exit code 1) when a threshold or a score differs. The search of the columns of
+a feature matrix (with missing and constant columns) is also checked against the search of each
+feature alone, and timed on all the candidate features of a calibration. The brute force is only timed up to --max-reference values, it is O(n^2).
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_boundary
+    $ python -m benchmarks.bench_boundary --sizes 1000 10000 100000 1000000 --checks 200
+'''
+
+import argparse
+import os
+import sys
+import time as ts
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import Hrv_features
+from lib import Threshold_search
+
+
+# Seed of the random datasets
+SEED = 0
+
+
+def dataset(rng, size, kind='continuous', n_classes=2):
+    '''
+    Return sdNN-like values and their states, the states shift the mean of the values
+    '''
+
+    state = rng.integers(0, n_classes, size)
+    values = rng.normal(40, 10, size) + 15 * state
+
+    if kind == 'rounded':
+        values = np.round(values / 5) * 5
+
+    return values, state
+
+
+def check(n_checks):
+    '''
+    Compare the search with the reference on random datasets
+
+    Returns:
+        number of datasets where they differ
+    '''
+
+    rng = np.random.default_rng(SEED)
+    failures = 0
+
+    for i in range(n_checks):
+        kind = ['continuous', 'rounded'][i % 2]
+        n_classes = 2 if i % 3 else 3
+        values, state = dataset(rng, int(rng.integers(2, 300)), kind, n_classes)
+
+        agree, result, reference = Threshold_search.check_against_reference(values, state)
+
+        if not agree:
+            failures += 1
+            print(f'MISMATCH ({len(values)} {kind} values, {n_classes} classes): '
+                  f'search {result}, reference {reference}')
+
+    return failures
+
+
+def check_columns(n_checks):
+    '''
+    Compare the search of the columns of a matrix, with missing values, with the search of each feature
+
+    Returns:
+        number of features where they differ
+    '''
+
+    rng = np.random.default_rng(SEED + 1)
+    failures = 0
+
+    for i in range(n_checks):
+        values, state = dataset(rng, int(rng.integers(2, 2000)))
+
+        # Continuous, rounded, missing at the start (as the features of a window) and constant
+        matrix = np.column_stack([values, np.round(values / 5) * 5, values ** 2, np.ones(len(values))])
+        matrix[:int(rng.integers(0, len(values))), 2] = np.nan
+
+        thresholds, scores = Threshold_search.best_thresholds(matrix, state)
+
+        for column in range(matrix.shape[1]):
+            valid = ~np.isnan(matrix[:, column])
+            threshold, score = Threshold_search.best_threshold(matrix[valid, column], state[valid])
+
+            same = (threshold is None and np.isnan(thresholds[column])) or \
+                   (threshold == thresholds[column] and abs(score - scores[column]) <= Threshold_search.SCORE_TOLERANCE)
+
+            if not same:
+                failures += 1
+                print(f'MISMATCH column {column} ({len(values)} values): '
+                      f'matrix ({thresholds[column]}, {scores[column]}), single ({threshold}, {score})')
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000], help='numbers of values')
+    parser.add_argument('--checks', type=int, default=100, help='random datasets compared with the reference')
+    parser.add_argument('--max-reference', type=int, default=5000, help='largest size timed with the brute force')
+    args = parser.parse_args()
+
+    failures = check(args.checks)
+    print(f'Check: {args.checks - failures}/{args.checks} datasets agree with the brute force reference')
+
+    column_failures = check_columns(args.checks)
+    print(f'Check: {4 * args.checks - column_failures}/{4 * args.checks} features of the matrix search agree with the single search\n')
+    failures += column_failures
+
+    rng = np.random.default_rng(SEED)
+
+    print(f'{"values":>9} {"search":>10} {"reference":>10} {"speedup":>8}  threshold')
+    for size in args.sizes:
+        values, state = dataset(rng, size)
+
+        t = ts.perf_counter()
+        threshold, score = Threshold_search.best_threshold(values, state)
+        search = ts.perf_counter() - t
+
+        reference = np.nan
+        if size <= args.max_reference:
+            t = ts.perf_counter()
+            Threshold_search.brute_force_threshold(values, state)
+            reference = ts.perf_counter() - t
+
+        timing = f'{1000 * reference:8.0f}ms {reference / search:7.0f}x' if size <= args.max_reference else f'{"-":>10} {"-":>8}'
+
+        print(f'{size:9d} {1000 * search:8.1f}ms {timing}  {threshold:.3f} ({score:.4f} nats)')
+
+    # All the candidate features of the calibration (17 with the default windows)
+    print(f'\n{"beats":>9} {"features":>8} {"search":>10}')
+    for size in args.sizes:
+        rr = rng.normal(850, 60, size)
+        names, matrix = Hrv_features.window_features(rr)
+        state = rng.integers(0, 2, size)
+
+        t = ts.perf_counter()
+        Threshold_search.best_thresholds(matrix, state)
+        search = ts.perf_counter() - t
+
+        print(f'{size:9d} {len(names):8d} {1000 * search:8.1f}ms')
+
+    sys.exit(1 if failures else 0)
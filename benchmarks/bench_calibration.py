@@ -0,0 +1,132 @@
+'''
+Scaling of the multi-session calibration with the number of processes.
+
+Synthetic calibration files (RR intervals and real state) are written in a temporary folder,
+then the folder is calibrated with each number of processes: the files are loaded and all the
+candidate features computed and searched in the processes. The report shows the wall-clock
+time and the speedup over one process, and checks that all of them find the same threshold.
+
+Before, the sdNN of the calibration is checked against the sdNN displayed by the collector
+(its parser fed with the RR intervals of a file with ectopic beats), the run fails (exit
+code 1) when they differ.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_calibration
+    $ python -m benchmarks.bench_calibration --sessions 48 --beats 200000 --workers 1 2 4 8
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import Calibration
+from lib import Hrv_features
+
+
+# Seed of the synthetic sessions
+SEED = 0
+# Fraction of the beats that are ectopic: a short interval followed by a compensatory long one
+ECTOPIC_RATE = 0.01
+
+
+def make_sessions(folder, n_sessions, n_beats):
+    '''
+    Write synthetic calibration files (RR intervals and real state), the heart of each subject is
+    different and some beats are ectopic
+    '''
+
+    rng = np.random.default_rng(SEED)
+    os.makedirs(folder, exist_ok=True)
+
+    for i in range(n_sessions):
+        state = (np.arange(n_beats) // 60) % 2
+        rr = np.where(state == 1, rng.normal(720, 20, n_beats), rng.normal(860 + rng.normal(0, 30), 55, n_beats))
+
+        ectopic = np.flatnonzero(rng.random(n_beats - 1) < ECTOPIC_RATE)
+        rr[ectopic] *= 0.6
+        rr[ectopic + 1] *= 1.4
+
+        pd.DataFrame({'heart rate': np.round(60000 / rr), 'rr interval': np.round(rr), 'real_state': state}).to_csv(
+            os.path.join(folder, f'session{i:03d}.csv'), index=False)
+
+
+def check_live_sdnn(path, windows):
+    '''
+    Compare the sdNN of the calibration of a file with the sdNN the collector displays for its RR intervals
+
+    Returns:
+        number of windows where they differ
+    '''
+
+    from lib.Data_collector import Data_collector
+
+    rr = pd.read_csv(path)[Calibration.RR_COLUMN].to_numpy(dtype=int)
+    session = Calibration.load_session(path, windows)
+    failures = 0
+
+    for window in windows:
+        collector = Data_collector('00:00:00:00:00:00', False, False, False, 'check',
+                                   {'representation_type': 1, 'rr_window': str(window), 'display_states': False})
+        collector.init_data()
+
+        # The parser prints each beat
+        with contextlib.redirect_stdout(io.StringIO()):
+            for value in rr:
+                collector.parse_rr(None, bytearray([0x10, min(255, round(60000 / value))]) + int(value).to_bytes(2, byteorder='little'))
+
+        live = np.array(collector.data_rr.std)[window - 1:]
+        calibrated = session['matrix'][window - 1:, session['names'].index(f'sdNN {window}')]
+
+        if not np.allclose(live, calibrated, rtol=1e-9, atol=1e-9):
+            failures += 1
+            print(f'MISMATCH sdNN {window}: {np.sum(~np.isclose(live, calibrated, rtol=1e-9, atol=1e-9))} of {len(live)} beats differ')
+
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=24, help='number of calibration files')
+    parser.add_argument('--beats', type=int, default=100000, help='beats of each file')
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help='numbers of processes, 1 to the number of CPUs by default')
+    args = parser.parse_args()
+
+    workers = args.workers or sorted({1, 2, 4, 8, os.cpu_count() or 1} & set(range(1, (os.cpu_count() or 1) + 1)))
+
+    with tempfile.TemporaryDirectory() as folder:
+        make_sessions(folder, args.sessions, args.beats)
+
+        # A short file is enough, the collector parses one beat at a time
+        make_sessions(os.path.join(folder, 'check'), 1, 2000)
+        windows = Hrv_features.WINDOWS + [1, 60]
+        failures = check_live_sdnn(os.path.join(folder, 'check', 'session000.csv'), windows)
+        print(f'Check: {len(windows) - failures}/{len(windows)} windows, the calibration sdNN is the sdNN displayed by the collector\n')
+
+        print(f'{args.sessions} sessions of {args.beats} beats, {os.cpu_count()} CPUs')
+        print(f'{"processes":>9} {"time":>8} {"speedup":>8}  threshold')
+
+        reference = None
+        for n in workers:
+            result = Calibration.calibrate(folder, n)
+
+            if reference is None:
+                reference = result
+
+            same = result['threshold'] == reference['threshold']
+
+            print(f'{result["workers"]:9d} {result["duration"]:7.2f}s {reference["duration"] / result["duration"]:7.2f}x  '
+                  f'{result["best"]} {result["threshold"]:.3f}' + ('' if same else '  DIFFERENT'))
+
+        print()
+        print(Calibration.report(reference, top=5).split('\n\nSessions')[0])
+
+    sys.exit(1 if failures else 0)
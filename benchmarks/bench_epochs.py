@@ -0,0 +1,80 @@
+'''
+Time of the extraction of the ECG and HR epochs around the taps of a one hour session.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_epochs
+'''
+
+import time as ts
+
+import numpy as np
+
+from lib import Epoch_extraction
+
+
+# ECG sample rate (Hz), recorded time (s) and number of taps
+ECG_SAMPLE_RATE = 130
+DURATION = 3600
+N_TAPS = 5000
+# Taps used by the row by row reference, its time is extrapolated to all taps
+N_REFERENCE_TAPS = 10
+
+
+def make_session():
+    '''
+    Build a synthetic session: ECG with jittered sample times, a beat every ~0.85 s and random taps
+    '''
+
+    rng = np.random.default_rng(0)
+
+    ecg_times = np.arange(DURATION * ECG_SAMPLE_RATE) / ECG_SAMPLE_RATE + rng.normal(0, 1e-4, DURATION * ECG_SAMPLE_RATE)
+    ecg_times.sort()
+    ecg = rng.normal(0, 100, len(ecg_times))
+
+    rr_times = np.cumsum(rng.normal(0.85, 0.05, int(DURATION / 0.85)))
+    rr = np.stack([60 / np.diff(rr_times, prepend=0), 1000 * np.diff(rr_times, prepend=0)], axis=1)
+
+    taps = np.sort(rng.uniform(10, DURATION - 10, N_TAPS))
+
+    return ecg_times, ecg, rr_times, rr, taps
+
+
+def reference(times, values, events, offsets):
+    '''
+    Row by row extraction, as done in the notebooks
+    '''
+
+    epochs = np.full((len(events), len(offsets)), np.nan)
+
+    for i, event in enumerate(events):
+        for j, offset in enumerate(offsets):
+            before = np.nonzero(times <= event + offset)[0]
+            if len(before) > 0:
+                epochs[i, j] = values[before[-1]]
+
+    return epochs
+
+
+if __name__ == '__main__':
+    ecg_times, ecg, rr_times, rr, taps = make_session()
+
+    t0 = ts.perf_counter()
+    offsets, ecg_epochs = Epoch_extraction.extract_epochs(ecg_times, ecg, taps, step=1 / ECG_SAMPLE_RATE)
+    ecg_mean, _ = Epoch_extraction.average_epochs(ecg_epochs)
+    ecg_elapsed = ts.perf_counter() - t0
+
+    t0 = ts.perf_counter()
+    _, rr_epochs = Epoch_extraction.extract_epochs(rr_times, rr, taps, step=Epoch_extraction.RR_EPOCH_STEP)
+    rr_mean, _ = Epoch_extraction.average_epochs(rr_epochs)
+    rr_elapsed = ts.perf_counter() - t0
+
+    t0 = ts.perf_counter()
+    expected = reference(ecg_times, ecg, taps[:N_REFERENCE_TAPS], offsets)
+    reference_elapsed = (ts.perf_counter() - t0) * N_TAPS / N_REFERENCE_TAPS
+
+    assert np.allclose(expected, ecg_epochs[:N_REFERENCE_TAPS, :, 0], equal_nan=True)
+
+    print(f'ECG: {N_TAPS} taps x {ecg_epochs.shape[1]} samples over {len(ecg)} samples in {1000 * ecg_elapsed:.1f} ms')
+    print(f' RR: {N_TAPS} taps x {rr_epochs.shape[1]} points x {rr_epochs.shape[2]} channels in {1000 * rr_elapsed:.1f} ms')
+    print(f'Row by row reference (extrapolated): {reference_elapsed:.1f} s, {reference_elapsed / ecg_elapsed:.0f}x slower')
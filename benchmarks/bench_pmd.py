@@ -0,0 +1,66 @@
+'''
+Throughput of the PMD frame decoder for the accelerometer stream at 200 Hz x 3 axes.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_pmd
+'''
+
+import time as ts
+
+import numpy as np
+
+from lib import Pmd
+
+
+# Accelerometer sample rate (Hz) and samples in each notification
+SAMPLE_RATE = 200
+SAMPLES_PER_FRAME = 36
+# Recorded time (s) decoded by the benchmark
+DURATION = 3600
+
+
+def make_frames(n_frames, delta):
+    '''
+    Build synthetic accelerometer notifications (a slow movement plus noise, in mG)
+    '''
+
+    rng = np.random.default_rng(0)
+    t = np.arange(n_frames * SAMPLES_PER_FRAME) / SAMPLE_RATE
+    samples = (np.stack([np.sin(t), np.cos(t), np.sin(t / 3)], axis=1) * 1000 + rng.normal(0, 20, (len(t), 3))).astype(np.int64)
+
+    frames = []
+    for i in range(n_frames):
+        block = samples[i * SAMPLES_PER_FRAME : (i + 1) * SAMPLES_PER_FRAME]
+        timestamp = int((i + 1) * SAMPLES_PER_FRAME / SAMPLE_RATE * 1e9)
+
+        if delta:
+            frames.append(Pmd.encode_delta_frame(Pmd.PMD_ACC, timestamp, block))
+        else:
+            frames.append(Pmd.encode_raw_frame(Pmd.PMD_ACC, timestamp, block, 2))
+
+    return frames
+
+
+def run(delta):
+    '''
+    Decode one hour of frames and print the throughput
+    '''
+
+    frames = make_frames(DURATION * SAMPLE_RATE // SAMPLES_PER_FRAME, delta)
+
+    t0 = ts.perf_counter()
+    for frame in frames:
+        Pmd.decode_frame(frame)
+    elapsed = ts.perf_counter() - t0
+
+    samples = len(frames) * SAMPLES_PER_FRAME
+
+    print(f"{'delta' if delta else 'raw':>5} frames: {len(frames) / elapsed:10.0f} frames/s   "
+          f"{samples / elapsed:12.0f} samples/s   {1e6 * elapsed / len(frames):6.1f} us/frame   "
+          f"{samples / elapsed / SAMPLE_RATE:8.0f}x real time")
+
+
+if __name__ == '__main__':
+    run(delta=False)
+    run(delta=True)
@@ -0,0 +1,304 @@
+'''
+Fan-out of the live publication of the samples: many simulated devices publishing to many
+local subscribers.
+
+For each number of devices and subscribers, the devices publish their HR and ECG frames at the
+real rate multiplied by the speed, during the duration. The subscribers run in separate
+processes, decode every frame and check the sequence numbers. The report shows, for each case,
+the publishing cost on the collection loop, the frames delivered, the frames lost and the
+delivery latency. With --slow, one more subscriber never reads, its frames must be dropped
+without delaying the others.
+
+Run from the repository root:
+
+    $ python -m benchmarks.bench_publish
+    $ python -m benchmarks.bench_publish --devices 1 8 32 --subscribers 1 16 64 --speed 20 --transport unix --slow
+'''
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time as ts
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import Publisher
+
+
+# Samples of each ECG frame of the device and its sample rate (Hz)
+ECG_FRAME = 73
+ECG_SAMPLE_RATE = 130
+# Interval (s) between two heart rate frames
+HR_INTERVAL = 1.0
+# Interval (s) between two ticks of the simulated devices
+TICK = 0.005
+# Time (s) the subscribers wait for the last frames after the publication ends
+GRACE = 1.0
+
+
+def free_url(transport, folder):
+    '''
+    Return a publication address of the transport that is not in use
+    '''
+
+    if transport == 'unix':
+        return 'unix://' + os.path.join(folder, 'publish.sock')
+
+    kind = socket.SOCK_STREAM if transport == 'tcp' else socket.SOCK_DGRAM
+    with socket.socket(socket.AF_INET, kind) as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    return f'{transport}://127.0.0.1:{port}'
+
+
+async def subscribe(url, n_subscribers, slow, duration, ready):
+    '''
+    Connect the subscribers of a worker process, receive and check the frames
+
+    Returns:
+        frames received, sequence gaps, delivery latencies (ms)
+    '''
+
+    parsed = urlparse(url)
+    loop = asyncio.get_running_loop()
+    received = [0]
+    gaps = [0]
+    latencies = []
+    sequences = {}
+
+    def handle(subscriber, frames):
+        now = ts.time_ns()
+
+        for stream, device, sequence, time_ns, _ in frames:
+            if stream == Publisher.STREAM_INFO:
+                continue
+
+            key = (subscriber, device, stream)
+            if key in sequences and sequence != sequences[key] + 1:
+                gaps[0] += sequence - sequences[key] - 1
+            sequences[key] = sequence
+
+            received[0] += 1
+            latencies.append((now - time_ns) / 1e6)
+
+    async def stream_subscriber(index):
+        if parsed.scheme == 'unix':
+            reader, writer = await asyncio.open_unix_connection(parsed.path)
+        else:
+            reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port)
+
+        buffer = b''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                frames, buffer = Publisher.decode_frames(buffer + data)
+                handle(index, frames)
+        finally:
+            writer.close()
+
+    class Datagram_subscriber(asyncio.DatagramProtocol):
+        def __init__(self, index):
+            self.index = index
+
+        def datagram_received(self, data, address):
+            handle(self.index, Publisher.decode_frames(data)[0])
+
+    tasks = []
+    transports = []
+
+    for index in range(n_subscribers):
+        if parsed.scheme == 'udp':
+            transport, _ = await loop.create_datagram_endpoint(lambda index=index: Datagram_subscriber(index),
+                                                               remote_addr=(parsed.hostname, parsed.port))
+            transport.sendto(b'SUB')
+            transports.append(transport)
+        else:
+            tasks.append(asyncio.create_task(stream_subscriber(index)))
+
+    # The slow subscriber connects and never reads
+    if slow:
+        if parsed.scheme == 'unix':
+            _, slow_writer = await asyncio.open_unix_connection(parsed.path)
+        else:
+            _, slow_writer = await asyncio.open_connection(parsed.hostname, parsed.port)
+        slow_writer.transport.pause_reading()
+
+    await asyncio.sleep(0.5)
+    ready.set()
+
+    # The UDP subscribers renew their subscription, or they expire
+    end = loop.time() + duration + GRACE
+    while loop.time() < end:
+        await asyncio.sleep(min(Publisher.UDP_SUBSCRIPTION_TIMEOUT / 3, end - loop.time()))
+
+        for transport in transports:
+            transport.sendto(b'SUB')
+
+    for transport in transports:
+        transport.sendto(b'UNSUB')
+        transport.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return received[0], gaps[0], latencies
+
+
+def worker(url, n_subscribers, slow, duration, ready, results):
+    '''
+    Function of the subscriber processes
+    '''
+
+    results.put(asyncio.run(subscribe(url, n_subscribers, slow, duration, ready)))
+
+
+async def publish(n_devices, duration, speed, ready_events):
+    '''
+    Register the devices and publish their frames at the real rate times the speed
+
+    Returns:
+        publisher, frames published, publishing time of each tick (ms), loop lag of each tick (ms)
+    '''
+
+    publishers = [await Publisher.Publisher.register({'address': f'device {i}'}) for i in range(n_devices)]
+    publisher = publishers[0][0]
+
+    loop = asyncio.get_running_loop()
+    for event in ready_events:
+        await loop.run_in_executor(None, event.wait)
+
+    rng = np.random.default_rng(0)
+    ecg = rng.normal(0, 500, (ECG_FRAME, 1)).astype(np.int32)
+
+    ecg_interval = ECG_FRAME / ECG_SAMPLE_RATE / speed
+    hr_interval = HR_INTERVAL / speed
+    next_ecg = np.zeros(n_devices)
+    next_hr = np.zeros(n_devices)
+
+    published = 0
+    costs = []
+    lags = []
+
+    t0 = ts.perf_counter()
+    deadline = t0
+    while ts.perf_counter() - t0 < duration:
+        now = ts.perf_counter() - t0
+        lags.append(1000 * max(0.0, ts.perf_counter() - deadline))
+
+        t = ts.perf_counter()
+        for i, (_, device) in enumerate(publishers):
+            while next_ecg[i] <= now:
+                publisher.publish(device, Publisher.STREAM_ECG, ts.time_ns(), ecg)
+                next_ecg[i] += ecg_interval
+                published += 1
+
+            while next_hr[i] <= now:
+                publisher.publish(device, Publisher.STREAM_HR, ts.time_ns(), [(70, 857)])
+                next_hr[i] += hr_interval
+                published += 1
+        costs.append(1000 * (ts.perf_counter() - t))
+
+        deadline = ts.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+
+    return publishers, published, costs, lags
+
+
+def run_case(transport, n_devices, n_subscribers, n_workers, slow, duration, speed):
+    '''
+    Run one case and return its results
+    '''
+
+    with tempfile.TemporaryDirectory() as folder:
+        url = free_url(transport, folder)
+        os.environ[Publisher.PUBLISH_ENV] = url
+
+        async def main():
+            # The server must listen before the subscribers connect
+            publishers = [await Publisher.Publisher.register({'address': 'probe'})]
+
+            context = multiprocessing.get_context('spawn')
+            results = context.Queue()
+            events = []
+            processes = []
+
+            n_workers_case = max(1, min(n_workers, n_subscribers))
+            for w in range(n_workers_case):
+                count = n_subscribers // n_workers_case + (w < n_subscribers % n_workers_case)
+                event = context.Event()
+                process = context.Process(target=worker, args=(url, count, slow and w == 0, duration, event, results))
+                process.start()
+                events.append(event)
+                processes.append(process)
+
+            devices, published, costs, lags = await publish(n_devices, duration, speed, events)
+            publisher = devices[0][0]
+
+            loop = asyncio.get_running_loop()
+            outcomes = [await loop.run_in_executor(None, results.get) for _ in processes]
+            for process in processes:
+                process.join()
+
+            dropped = publisher.dropped
+            frames = publisher.frames
+
+            for p, device in devices + publishers:
+                p.unregister(device)
+
+            return published, frames, dropped, costs, lags, outcomes
+
+        published, frames, dropped, costs, lags, outcomes = asyncio.run(main())
+
+    received = sum(outcome[0] for outcome in outcomes)
+    gaps = sum(outcome[1] for outcome in outcomes)
+    latencies = np.concatenate([outcome[2] for outcome in outcomes if outcome[2] != []] or [[np.nan]])
+
+    return {'devices': n_devices,
+            'subscribers': n_subscribers,
+            'published': published,
+            'expected': published * n_subscribers,
+            'received': received,
+            'gaps': gaps,
+            'dropped': dropped,
+            'publish_us': 1000 * np.sum(costs) / max(published, 1),
+            'busy': np.sum(costs) / 1000 / duration,
+            'lag_p99': np.percentile(lags, 99),
+            'latency_p50': np.nanpercentile(latencies, 50),
+            'latency_p99': np.nanpercentile(latencies, 99),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 8, 32], help='numbers of devices publishing')
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1, 8, 32], help='numbers of subscribers')
+    parser.add_argument('--transport', choices=['tcp', 'unix', 'udp'], default='tcp', help='transport of the publication')
+    parser.add_argument('--speed', type=float, default=10, help='rate of the devices relative to the real time')
+    parser.add_argument('--duration', type=float, default=3, help='duration (s) of each case')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes of the subscribers')
+    parser.add_argument('--slow', action='store_true', help='add a subscriber that never reads')
+    args = parser.parse_args()
+
+    print(f'Transport {args.transport}, speed {args.speed:g}x, {args.duration:g} s per case, '
+          f'{args.workers} subscriber processes' + (', with a slow subscriber' if args.slow else ''))
+    print(f'{"devices":>8} {"subs":>5} {"frames/s":>9} {"delivered":>10} {"lost":>7} {"dropped":>8} '
+          f'{"us/frame":>9} {"loop busy":>9} {"lag p99":>8} {"lat p50":>8} {"lat p99":>8}')
+
+    for n_devices in args.devices:
+        for n_subscribers in args.subscribers:
+            result = run_case(args.transport, n_devices, n_subscribers, args.workers, args.slow, args.duration, args.speed)
+
+            print(f'{result["devices"]:8d} {result["subscribers"]:5d} {result["published"] / args.duration:9.0f} '
+                  f'{100 * result["received"] / max(result["expected"], 1):9.1f}% {result["gaps"]:7d} {result["dropped"]:8d} '
+                  f'{result["publish_us"]:9.1f} {100 * result["busy"]:8.1f}% {result["lag_p99"]:6.1f}ms '
+                  f'{result["latency_p50"]:6.2f}ms {result["latency_p99"]:6.2f}ms', flush=True)
@@ -0,0 +1,87 @@
+'''
+End-to-end throughput of the collection path (notifications, parsing, features and files),
+replaying a recording at the maximum speed.
+
+Run from the repository root, with the output filename of a recording or without arguments
+to replay a synthetic one hour session:
+
+    $ python -m benchmarks.bench_replay [output filename]
+'''
+
+import os
+import sys
+import tempfile
+import time as ts
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QCoreApplication
+
+
+# ECG sample rate (Hz) and recorded time (s) of the synthetic session
+ECG_SAMPLE_RATE = 130
+DURATION = 3600
+
+
+def make_recording(prefix):
+    '''
+    Write a synthetic session in the format of the collector files
+    '''
+
+    rng = np.random.default_rng(0)
+
+    rr = rng.normal(0.85, 0.05, int(DURATION / 0.85))
+    beats = np.cumsum(rr)
+    pd.DataFrame(data={'time': beats - beats[0],
+                       'heart rate': np.round(60 / rr).astype(int),
+                       'rr interval': np.round(1000 * rr).astype(int),
+    }).to_csv(prefix + '-rr-2000-01-01 00:00:00.csv', sep=',', header=True)
+
+    times = np.arange(DURATION * ECG_SAMPLE_RATE) / ECG_SAMPLE_RATE
+    pd.DataFrame(data={'time': times,
+                       'timestamp': (times * 1e9).astype(np.int64),
+                       'ecg': rng.normal(0, 200, len(times)).astype(int),
+    }).to_csv(prefix + '-ecg-2000-01-01 00:00:00.csv', sep=',', header=True)
+
+
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp()
+
+    if len(sys.argv) > 1:
+        prefix = os.path.abspath(sys.argv[1])
+    else:
+        prefix = os.path.join(folder, 'synthetic')
+        make_recording(prefix)
+
+    # The collection files are written in the temporary folder
+    os.chdir(folder)
+
+    os.environ['HRC_REPLAY'] = prefix
+    os.environ['HRC_REPLAY_SPEED'] = '0'
+
+    from lib.Ble_service import Ble_service
+    from lib.Data_collector import Data_collector
+    from lib.Replay import Replay_device
+
+    app = QCoreApplication([])
+
+    device = Replay_device.all()[0]
+    setting_values = {'representation_type': 0, 'representation_type_value': 'HR', 'display_states': False, 'rr_window': '10'}
+
+    collector = Data_collector(device.address, False, True, False, 'replay', setting_values)
+    collector.start()
+
+    # Wait until all the notifications were delivered
+    while device.active != 0 or device.start is None:
+        ts.sleep(0.1)
+
+    elapsed = ts.perf_counter() - device.start
+
+    collector.stop()
+    while collector.isRunning():
+        ts.sleep(0.1)
+
+    Ble_service.shutdown()
+
+    print(f'Replayed {device.samples} samples ({len(collector.data_rr.time)} beats, {len(collector.data_ecg.ecg)} ECG samples) '
+          f'in {elapsed:.2f} s: {device.samples / elapsed:.0f} samples/s')
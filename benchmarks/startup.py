@@ -0,0 +1,141 @@
+'''
+Cold start of the interface: time from the launch of Python to the main window, and the
+import-time report of the modules loaded until then.
+
+Each run starts a new interpreter with "-X importtime" in an empty folder and builds the main
+window offscreen. The check fails (exit code 1) when the median start time exceeds the budget
+or when one of the deferred dependencies is loaded before the main window.
+
+Run from the repository root:
+
+    $ python -m benchmarks.startup
+    $ python -m benchmarks.startup --budget 1.5 --runs 5 --top 30
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time as ts
+
+import numpy as np
+
+
+# Default budget (s) from the launch to the main window
+STARTUP_BUDGET = 1.0
+# Packages that must only be loaded on their first use
+DEFERRED = ['matplotlib', 'sklearn', 'scipy', 'hrvanalysis', 'pandas', 'pynput']
+
+# Code run by the new interpreter, it prints the time of the main window and the deferred packages loaded
+CHILD = '''
+import sys
+sys.path.insert(0, {root!r})
+
+from PyQt5.QtWidgets import QApplication
+
+qt_app = QApplication(sys.argv)
+
+import app
+
+window = app.MainWindow()
+qt_app.processEvents()
+
+print('READY', flush=True)
+print('LOADED', ' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({deferred!r}))), flush=True)
+'''
+
+
+def run_once(root):
+    '''
+    Start the interface in a new interpreter
+
+    Returns:
+        time (s) to the main window, deferred packages loaded, import times (name, self us, cumulative us, level)
+    '''
+
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    code = CHILD.format(root=root, deferred=DEFERRED)
+
+    # The configuration files of the interface are created in the folder
+    with tempfile.TemporaryDirectory() as folder:
+        start = ts.perf_counter()
+        process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code], cwd=folder, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        ready = None
+        loaded = []
+        for line in process.stdout:
+            if line.startswith('READY'):
+                ready = ts.perf_counter() - start
+            elif line.startswith('LOADED'):
+                loaded = line.split()[1:]
+
+        stderr = process.stderr.read()
+        process.wait()
+
+    if ready is None:
+        raise RuntimeError('The interface did not start:\n' + stderr)
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(own), int(cumulative), (len(name) - len(name.lstrip()) - 1) // 2))
+
+    return ready, loaded, imports
+
+
+def report(imports, top):
+    '''
+    Print the packages imported directly by the interface, by cumulative import time
+    '''
+
+    total = sum(own for _, own, _, _ in imports)
+    print(f'Import time: {total / 1e6:.3f} s in {len(imports)} modules')
+
+    # The packages imported by the application modules (first and second level of the tree)
+    entries = sorted((entry for entry in imports if entry[3] <= 1), key=lambda entry: -entry[2])
+
+    print(f'    {"cumulative":>10} {"self":>10}  module')
+    for name, own, cumulative, level in entries[:top]:
+        print(f'    {cumulative / 1e3:8.1f}ms {own / 1e3:8.1f}ms  {"  " * level}{name}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='maximum median time (s) to the main window')
+    parser.add_argument('--runs', type=int, default=5, help='number of starts measured')
+    parser.add_argument('--top', type=int, default=20, help='modules shown in the import-time report')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    times = []
+    for i in range(args.runs):
+        ready, loaded, imports = run_once(root)
+        times.append(ready)
+        print(f'Run {i + 1}: main window after {ready:.3f} s')
+
+    print()
+    report(imports, args.top)
+
+    median = float(np.median(times))
+    print(f'\nStart time: first {times[0]:.3f} s, median {median:.3f} s, budget {args.budget:.3f} s')
+
+    failed = False
+
+    if loaded != []:
+        print(f'FAIL: deferred packages loaded before the main window: {", ".join(loaded)}')
+        failed = True
+
+    if median > args.budget:
+        print(f'FAIL: the start time exceeds the budget by {median - args.budget:.3f} s')
+        failed = True
+
+    if not failed:
+        print('OK')
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,413 @@
+'''
+Benchmark suite of the hot paths of the collector, across data sizes.
+
+Each case reports the throughput (items/s), the latency percentiles of each call and the
+peak memory allocated. The results are written as JSON and compared with a baseline, the
+run fails when a case is slower than the baseline by more than the tolerance.
+
+Run from the repository root:
+
+    $ python -m benchmarks.suite                      # run and compare with benchmarks/baseline.json
+    $ python -m benchmarks.suite --require-baseline   # also fail when the baseline or a case of it is missing
+    $ python -m benchmarks.suite --save-baseline      # run and store the results as the baseline
+    $ python -m benchmarks.suite --cases parse_rr parse_ecg --output results.json
+    $ python -m benchmarks.suite --recording data/subject01   # use a recording instead of synthetic data
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time as ts
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+# Default baseline file
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Relative slowdown of the throughput (or growth of the p99 latency) reported as a regression
+TOLERANCE = 0.25
+# Seed of the synthetic datasets
+SEED = 0
+
+# Settings of the collection used by the cases
+SETTING_VALUES = {
+    'representation_type': 0,
+    'representation_type_value': 'Heart rate (BPM)',
+    'window_limit_value': 'All data',
+    'rr_window': '5',
+    'display_states': False,
+    'time_in_state_0': '40',
+    'time_in_state_1': '40',
+    'display_decision_boundary': False,
+    'decision_boundary': '100',
+}
+
+
+class Dataset:
+    '''
+    Fixed RR and ECG data used by the cases, synthetic or tiled from a recording.
+    '''
+
+    def __init__(self, recording=None):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            recording (string): output filename of a recording, synthetic data is used when None.
+        '''
+
+        rng = np.random.default_rng(SEED)
+
+        if recording is None:
+            rr = rng.normal(850, 50, 100000)
+            self.rr = np.round(rr).astype(int)
+            self.hr = np.round(60000 / rr).astype(int)
+            self.ecg = (200 * np.sin(np.arange(1000000) / 130 * 2 * np.pi * 1.2) + rng.normal(0, 20, 1000000)).astype(int)
+        else:
+            from lib.Replay import last_file
+
+            rr = pd.read_csv(last_file(recording, '-rr-2*.csv'), index_col=0)
+            self.rr = rr['rr interval'].to_numpy(dtype=int)
+            self.hr = rr['heart rate'].to_numpy(dtype=int)
+
+            ecg_file = last_file(recording, '-ecg-2*.csv')
+            self.ecg = pd.read_csv(ecg_file, index_col=0)['ecg'].to_numpy(dtype=int) if ecg_file else np.zeros(130, dtype=int)
+
+        self.source = recording or 'synthetic'
+
+
+    def take(self, values, n):
+        '''
+        Return the first n values, repeating the data when it is shorter
+        '''
+
+        return np.resize(values, n)
+
+
+def measure(function, n_calls, items_per_call=1):
+    '''
+    Call a function n_calls times and return its throughput, latency and peak memory
+
+    Returns:
+        dictionary with the results of the case
+    '''
+
+    latencies = np.empty(n_calls)
+
+    start = ts.perf_counter()
+
+    for i in range(n_calls):
+        t = ts.perf_counter_ns()
+        function(i)
+        latencies[i] = ts.perf_counter_ns() - t
+
+    elapsed = ts.perf_counter() - start
+
+    # tracemalloc slows the allocations down several times, the peak of one call is measured again apart
+    tracemalloc.start()
+    function(n_calls - 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'calls': n_calls,
+            'items': n_calls * items_per_call,
+            'elapsed': elapsed,
+            'throughput': n_calls * items_per_call / elapsed,
+            'latency_p50_us': float(np.percentile(latencies, 50)) / 1000,
+            'latency_p99_us': float(np.percentile(latencies, 99)) / 1000,
+            'latency_max_us': float(latencies.max()) / 1000,
+            'peak_memory_mb': peak / 2 ** 20,
+    }
+
+
+def new_collector():
+    '''
+    Return a collector ready to parse notifications, without a device
+    '''
+
+    from lib.Data_collector import Data_collector
+
+    collector = Data_collector('00:00:00:00:00:00', False, False, False, 'benchmark', SETTING_VALUES)
+    collector.init_data()
+
+    return collector
+
+
+def bench_parse_rr(dataset, size):
+    '''
+    Parse size heart rate notifications (items: beats)
+    '''
+
+    collector = new_collector()
+    payloads = [bytearray([0x16, hr]) + int(rr).to_bytes(2, byteorder='little')
+                for hr, rr in zip(dataset.take(dataset.hr, size), dataset.take(dataset.rr, size))]
+
+    # The beats are printed by the parser
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        return measure(lambda i: collector.parse_rr(None, payloads[i]), size)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def bench_parse_ecg(dataset, size):
+    '''
+    Parse the ECG notifications of size samples (items: samples)
+    '''
+
+    from lib import Pmd
+
+    collector = new_collector()
+    samples = dataset.take(dataset.ecg, size).reshape(-1, 1)
+    frame = 73
+
+    payloads = [Pmd.encode_raw_frame(Pmd.PMD_ECG, int((start + frame) / 130 * 1e9), samples[start : start + frame], 3)
+                for start in range(0, size - frame + 1, frame)]
+
+    return measure(lambda i: collector.parse_ecg(None, payloads[i]), len(payloads), frame)
+
+
+def bench_save_rr(dataset, size):
+    '''
+    Save size beats with Data_rr.save_raw_data (items: beats)
+    '''
+
+    from lib.Clock_model import Clock_model
+    from lib.Data_rr import Data_rr
+
+    data = Data_rr()
+    data.t0 = 0.0
+    data.time = list(np.cumsum(dataset.take(dataset.rr, size)) / 1000)
+    data.hr_values = list(dataset.take(dataset.hr, size))
+    data.rr_values = list(dataset.take(dataset.rr, size))
+    clock = Clock_model()
+
+    with tempfile.TemporaryDirectory() as folder:
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            return measure(lambda i: data.save_raw_data(os.path.join(folder, f'rr{i}'), True, None, clock), 3, size)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+def bench_save_ecg(dataset, size):
+    '''
+    Save size ECG samples with Data_ecg.save_raw_data (items: samples)
+    '''
+
+    from lib.Clock_model import Clock_model
+    from lib.Data_ecg import Data_ecg
+
+    frame = 73
+    n_frames = size // frame
+
+    data = Data_ecg(130)
+    data.t0 = 0.0
+    data.timestamp = [int((k + 1) * frame / 130 * 1e9) for k in range(n_frames)]
+    data.time = [(k + 1) * frame / 130 for k in range(n_frames)]
+    data.frame_size = [frame] * n_frames
+    data.segment = [0] * n_frames
+    data.ecg = list(dataset.take(dataset.ecg, n_frames * frame))
+
+    clock = Clock_model()
+    for timestamp, t in zip(data.timestamp, data.time):
+        clock.add(timestamp, clock.anchor_host + t + 0.01)
+
+    with tempfile.TemporaryDirectory() as folder:
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            return measure(lambda i: data.save_raw_data(os.path.join(folder, f'ecg{i}'), True, clock), 3, n_frames * frame)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+def bench_update_plot(dataset, size):
+    '''
+    Update and render the plot of the collection window with size points (items: frames)
+    '''
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    from types import SimpleNamespace
+    from PyQt5.QtWidgets import QApplication
+
+    from lib.Collect_window import Collect_window
+    from lib.Data_rr import Data_rr
+
+    class Benchmark_window(Collect_window):
+        '''
+        Collection window without a collector, the data is filled by the benchmark
+        '''
+
+        def start(self):
+            self.worker_thread = SimpleNamespace(data_rr=Data_rr())
+
+    app = QApplication.instance() or QApplication([])
+
+    window = Benchmark_window(None, 'benchmark', '00:00:00:00:00:00', True, False, False, 'benchmark', False, SETTING_VALUES)
+    window.distribution_timer.stop()
+    window.ani.event_source.stop()
+
+    window.x_data = list(np.cumsum(dataset.take(dataset.rr, size)) / 1000)
+    window.y_data = list(dataset.take(dataset.hr, size))
+    window.state = [0] * size
+
+    for hr in window.y_data:
+        window.worker_thread.data_rr.hr_sketch.add(hr)
+
+    def update(i):
+        window.update_plot(i)
+        window.canvas.draw()
+
+    result = measure(update, 10)
+
+    # Closing asks for a confirmation, the window is only deleted
+    window.deleteLater()
+    app.processEvents()
+
+    return result
+
+
+def bench_boundary(dataset, size):
+    '''
+    Search the decision boundary of size sdNN values with Boundary_calculation.run (items: values)
+    '''
+
+    from lib.Boundary_calculation import Boundary_calculation
+
+    rng = np.random.default_rng(SEED)
+    state = rng.integers(0, 2, size)
+    std = rng.normal(40, 10, size) + 15 * state
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'hrv.csv')
+        pd.DataFrame({'std': std, 'real_state': state}).to_csv(path, index=False)
+
+        calculation = Boundary_calculation(path)
+
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            return measure(lambda i: calculation.run(), 1, size)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+# Function and data sizes of each case
+CASES = {
+    'parse_rr': (bench_parse_rr, [1000, 10000]),
+    'parse_ecg': (bench_parse_ecg, [13000, 130000, 1000000]),
+    'save_rr': (bench_save_rr, [1000, 10000, 100000]),
+    'save_ecg': (bench_save_ecg, [13000, 130000, 1000000]),
+    'update_plot': (bench_update_plot, [300, 3000, 30000]),
+    'boundary': (bench_boundary, [1000, 10000, 100000]),
+}
+
+
+def compare(results, baseline, tolerance, require=False):
+    '''
+    Compare the results with the baseline
+
+    Parameters:
+        results (dict): results of each case and size;
+        baseline (dict): results of the baseline;
+        tolerance (float): relative slowdown reported as a regression;
+        require (boolean): flag that decides if a case missing from the baseline is a regression.
+
+    Returns:
+        list of the regressions found
+    '''
+
+    regressions = []
+
+    for case, sizes in results.items():
+        for size, result in sizes.items():
+            reference = baseline.get(case, {}).get(size)
+
+            if reference is None:
+                if require:
+                    regressions.append(f"{case}[{size}]: not in the baseline")
+                continue
+
+            if result['throughput'] < (1 - tolerance) * reference['throughput']:
+                regressions.append(f"{case}[{size}]: throughput {result['throughput']:.0f} < baseline {reference['throughput']:.0f} items/s")
+
+            if result['latency_p99_us'] > (1 + tolerance) * reference['latency_p99_us']:
+                regressions.append(f"{case}[{size}]: p99 latency {result['latency_p99_us']:.1f} > baseline {reference['latency_p99_us']:.1f} us")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite of the collector hot paths')
+    parser.add_argument('--cases', nargs='*', default=list(CASES), choices=list(CASES), help='cases to run')
+    parser.add_argument('--recording', default=None, help='output filename of a recording used as dataset')
+    parser.add_argument('--output', default=None, help='JSON file with the results')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON file with the baseline results')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--require-baseline', action='store_true', help='fail when the baseline or a case of it is missing')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    dataset = Dataset(args.recording)
+    results = {}
+
+    for case in args.cases:
+        function, sizes = CASES[case]
+        results[case] = {}
+
+        for size in sizes:
+            result = function(dataset, size)
+            results[case][str(size)] = result
+
+            print(f"{case:>12} {size:>8}: {result['throughput']:12.0f} items/s   "
+                  f"p50 {result['latency_p50_us']:10.1f} us   p99 {result['latency_p99_us']:10.1f} us   "
+                  f"peak {result['peak_memory_mb']:8.1f} MB", flush=True)
+
+    report = {'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor()},
+              'dataset': dataset.source,
+              'results': results,
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+
+        print(f'Baseline saved in "{args.baseline}"')
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print(f'No baseline in "{args.baseline}", run with --save-baseline to create it')
+        return 1 if args.require_baseline else 0
+
+    with open(args.baseline) as infile:
+        baseline = json.load(infile)
+
+    # The throughput depends on the machine, a baseline of another one only catches large regressions
+    if baseline.get('machine') != report['machine']:
+        print(f"The baseline was measured on another machine ({baseline.get('machine')}), run with --save-baseline to measure this one")
+
+    regressions = compare(results, baseline['results'], args.tolerance, args.require_baseline)
+
+    for regression in regressions:
+        print('Regression: ' + regression)
+
+    print(f'{len(regressions)} regressions against "{args.baseline}"')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
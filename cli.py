@@ -0,0 +1,295 @@
+'''
+Command line interface of the collector, it scans, checks and records the devices without
+Qt or matplotlib, for servers and unattended sessions.
+
+    $ python cli.py scan
+    $ python cli.py status "Polar H10 12345678"
+    $ python cli.py collect "Polar H10 12345678" -o subject01 --ecg --duration 7200
+    $ python cli.py collect all -o session --quiet
+    $ python cli.py collect all -o session --publish tcp://127.0.0.1:8765
+    $ python cli.py calibrate data/calibration --workers 8
+
+The devices are given by name (from the devices already found by a scan, saved in
+known_devices.json), by MAC address, or "all" for every known device. The collection runs
+until the duration ends or the process receives Ctrl+C or SIGTERM, then the files are saved.
+'''
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time as ts
+
+# The bluetooth tasks use plain Python signals instead of Qt, it must be set before importing them
+os.environ['HRC_HEADLESS'] = '1'
+
+
+# Settings used when there is no config.json, the same as the interface
+DEFAULT_SETTINGS = {
+    'representation_type': 0,
+    'representation_type_value': 'Heart rate (BPM)',
+    'window_limit': 0,
+    'window_limit_value': 'All data',
+    'rr_window' : '5',
+    'display_states': False,
+    'time_in_state_0': '40',
+    'time_in_state_1': '40',
+    'display_decision_boundary': False,
+    'decision_boundary' : '100',
+    'telemetry_interval': '60',
+    'acc_sample_rate': '50',
+}
+
+# Default interval (s) between two status lines during a collection
+REPORT_INTERVAL = 60
+
+
+def report(*args):
+    '''
+    Print a line of the interface, on stderr so it is kept with --quiet
+    '''
+
+    print(*args, file=sys.stderr, flush=True)
+
+
+def load_settings(filename, sdnn):
+    '''
+    Load the settings of the interface and adapt them to a collection without display
+
+    Parameters:
+        filename (string): configuration file written by the interface;
+        sdnn (boolean): flag that decides whether the sdNN is computed.
+    '''
+
+    settings = dict(DEFAULT_SETTINGS)
+
+    if os.path.isfile(filename):
+        with open(filename, 'r') as openfile:
+            settings.update(json.load(openfile))
+
+    settings['representation_type'] = 1 if sdnn else 0
+    settings['representation_type_value'] = 'sdNN' if sdnn else 'Heart rate (BPM)'
+
+    return settings
+
+
+def load_known_devices():
+    '''
+    Return the devices found by the previous scans: name -> address
+    '''
+
+    if os.path.isfile('known_devices.json'):
+        with open('known_devices.json', 'r') as openfile:
+            return json.load(openfile)
+
+    return {}
+
+
+def resolve_devices(names):
+    '''
+    Return the devices (name -> address) of a list of names, addresses or "all"
+    '''
+
+    known = load_known_devices()
+
+    if names == ['all']:
+        return known
+
+    devices = {}
+    for name in names:
+        if name in known:
+            devices[name] = known[name]
+        elif name.count(':') == 5:
+            # A MAC address, named after it in the output files
+            address = name
+            name = next((known_name for known_name, known_address in known.items() if known_address == address), address.replace(':', ''))
+            devices[name] = address
+        else:
+            raise SystemExit(f'Unknown device "{name}", run "python cli.py scan" first or give its MAC address')
+
+    return devices
+
+
+def wait_task(task):
+    '''
+    Start a bluetooth task and wait until it is finished
+    '''
+
+    task.start()
+    task.future.result()
+
+
+def scan(args):
+    '''
+    Scan the devices nearby and add them to the known devices
+    '''
+
+    from lib.Scan import Scan
+
+    known = load_known_devices()
+
+    scanner = Scan(expected=args.expect)
+    found = {}
+    scanner.log_signal.connect(lambda name, address: found.__setitem__(name, address))
+
+    wait_task(scanner)
+
+    known.update(found)
+    with open('known_devices.json', 'w') as outfile:
+        json.dump(known, outfile)
+
+    report(f'{len(found)} devices found')
+    for name, address in found.items():
+        report(f'{name}\t{address}')
+
+    return 0 if found else 1
+
+
+def status(args):
+    '''
+    Check the status (model and battery) of the devices, at the same time
+    '''
+
+    from lib.Fleet_status import Fleet_status
+
+    devices = resolve_devices(args.devices)
+    checker = Fleet_status(devices)
+
+    failed = []
+
+    def show(name, address, code, model, battery, duration):
+        if code:
+            failed.append(name)
+            report(f'{name}\t{address}\terror: {model}\t{duration:.1f} s')
+        else:
+            report(f'{name}\t{address}\t{model}\tbattery {battery}\t{duration:.1f} s')
+
+    checker.result_signal.connect(show)
+
+    wait_task(checker)
+
+    return 1 if failed else 0
+
+
+def collect(args):
+    '''
+    Record the devices until the duration ends or the process is interrupted
+    '''
+
+    from lib.Data_collector import Data_collector
+    from lib.Multi_collector import Multi_collector
+
+    devices = resolve_devices(args.devices)
+    if devices == {}:
+        raise SystemExit('No devices to collect from')
+
+    settings = load_settings(args.config, args.sdnn)
+
+    if args.publish != []:
+        os.environ['HRC_PUBLISH'] = ','.join(args.publish)
+
+    if len(devices) == 1:
+        collector = Data_collector(list(devices.values())[0], False, args.ecg, args.current_time, args.output, settings, args.acc)
+        collectors = {list(devices)[0]: collector}
+    else:
+        collector = Multi_collector(devices, args.ecg, args.current_time, args.output, settings, args.acc)
+        collectors = collector.collectors
+
+    stop = threading.Event()
+
+    def interrupt(signum, frame):
+        report('Stopping the collection...')
+        stop.set()
+
+    signal.signal(signal.SIGINT, interrupt)
+    signal.signal(signal.SIGTERM, interrupt)
+
+    collector.start()
+    t0 = ts.perf_counter()
+
+    # The main thread only waits, reports the streams and stops the collection
+    while collector.isRunning() and not stop.is_set():
+        remaining = args.duration - (ts.perf_counter() - t0) if args.duration > 0 else args.report
+        stop.wait(max(0, min(args.report, remaining)))
+
+        if args.duration > 0 and ts.perf_counter() - t0 >= args.duration:
+            stop.set()
+
+        for name, device in collectors.items():
+            streams = [f'{stream.upper()} {stats.summary()}' for stream, stats in getattr(device, 'stream_stats', {}).items() if stats.frames > 0]
+            latency = device.latency.summary() if hasattr(device, 'latency') else []
+
+            report(f'[{ts.perf_counter() - t0:.0f} s] {name}: ' + ('   |   '.join(streams + latency) or 'waiting for data'))
+
+    collector.stop()
+    collector.future.result()
+
+    report(f'Collection finished after {ts.perf_counter() - t0:.0f} s')
+
+    return 0
+
+
+def calibrate(args):
+    '''
+    Calibrate the decision boundary on the sessions of files and folders
+    '''
+
+    from lib import Calibration
+
+    result = Calibration.calibrate(args.paths, args.workers, args.windows)
+
+    report(Calibration.report(result))
+
+    return 0 if result['threshold'] is not None else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Heart rate collector without graphical interface')
+    parser.add_argument('--quiet', action='store_true', help='do not print the received data, only the status lines')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_scan = commands.add_parser('scan', help='scan the devices nearby')
+    parser_scan.add_argument('--expect', nargs='*', default=[], help='names of the devices expected, the scan stops when all are found')
+    parser_scan.set_defaults(function=scan)
+
+    parser_status = commands.add_parser('status', help='check the model and battery of the devices')
+    parser_status.add_argument('devices', nargs='+', help='names, MAC addresses or "all"')
+    parser_status.set_defaults(function=status)
+
+    parser_collect = commands.add_parser('collect', help='record the devices')
+    parser_collect.add_argument('devices', nargs='+', help='names, MAC addresses or "all"')
+    parser_collect.add_argument('-o', '--output', required=True, help='output filename')
+    parser_collect.add_argument('--ecg', action='store_true', help='also collect ECG')
+    parser_collect.add_argument('--acc', action='store_true', help='also collect the accelerometer')
+    parser_collect.add_argument('--sdnn', action='store_true', help='compute and save the sdNN')
+    parser_collect.add_argument('--current-time', action='store_true', help='save the time of day of each sample')
+    parser_collect.add_argument('--duration', type=float, default=0, help='duration (s) of the collection, 0 until interrupted')
+    parser_collect.add_argument('--report', type=float, default=REPORT_INTERVAL, help='interval (s) between two status lines')
+    parser_collect.add_argument('--config', default='config.json', help='settings file of the interface')
+    parser_collect.add_argument('--publish', nargs='+', default=[], metavar='URL',
+                                help='publish the samples to local subscribers: tcp://host:port, udp://host:port or unix:///path')
+    parser_collect.set_defaults(function=collect)
+
+    parser_calibrate = commands.add_parser('calibrate', help='rank the features and calibrate their decision boundary on several sessions')
+    parser_calibrate.add_argument('paths', nargs='+', help='calibration files (rr interval or std, and real_state columns) or folders of them')
+    parser_calibrate.add_argument('--workers', type=int, default=None, help='processes loading the files, by default from their size and the number of CPUs')
+    parser_calibrate.add_argument('--windows', type=int, nargs='+', default=[5, 10, 20, 30], help='sizes (beats) of the RR windows of the features')
+    parser_calibrate.set_defaults(function=calibrate)
+
+    args = parser.parse_args(argv)
+
+    if args.quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+    from lib.Ble_service import Ble_service
+
+    try:
+        return args.function(args)
+    finally:
+        Ble_service.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
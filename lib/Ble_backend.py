@@ -0,0 +1,32 @@
+from bleak import BleakClient, BleakScanner
+
+from lib import Replay
+from lib import Simulator
+
+
+def new_client(address, **kwargs):
+    '''
+    Return the client of a device, a replayed or simulated one when they are enabled
+    '''
+
+    if Replay.is_enabled():
+        return Simulator.Simulated_client(address, device=Replay.Replay_device.get(address), **kwargs)
+
+    if Simulator.is_enabled():
+        return Simulator.Simulated_client(address, **kwargs)
+
+    return BleakClient(address, **kwargs)
+
+
+def new_scanner(**kwargs):
+    '''
+    Return the scanner of the devices, a replayed or simulated one when they are enabled
+    '''
+
+    if Replay.is_enabled():
+        return Simulator.Simulated_scanner(devices=Replay.Replay_device.all(), **kwargs)
+
+    if Simulator.is_enabled():
+        return Simulator.Simulated_scanner(**kwargs)
+
+    return BleakScanner(**kwargs)
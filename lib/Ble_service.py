@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from lib.Connection_manager import Connection_manager
+
+
+class Ble_service(threading.Thread):
+    '''
+    Class responsible for running the event loop shared by all bluetooth tasks.
+
+    A single thread and event loop live for the whole application. Scan, status check and
+    data collection are submitted to it as coroutines, so the loop is created only once
+    and is closed when the application quits. It is a plain thread, so the bluetooth tasks
+    also run without Qt.
+    '''
+
+    # Service shared by the whole application
+    _instance = None
+
+
+    def __init__(self):
+        '''
+        Initialize the class variables
+        '''
+
+        # Name of the thread in the profiling reports
+        super().__init__(name='Bluetooth loop')
+        self.loop = None
+        self.ready = threading.Event()
+
+
+    @classmethod
+    def instance(cls):
+        '''
+        Return the running service, starting it on the first call
+        '''
+
+        if cls._instance is None:
+            cls._instance = cls()
+            cls._instance.start()
+            cls._instance.ready.wait()
+
+        return cls._instance
+
+
+    @classmethod
+    def shutdown(cls):
+        '''
+        Stop the running service, if any, and wait for its loop to be closed.
+
+        This method is connected to the aboutToQuit signal of the application
+        '''
+
+        if cls._instance is None:
+            return
+
+        cls._instance.loop.call_soon_threadsafe(cls._instance.loop.stop)
+        cls._instance.join()
+        cls._instance = None
+
+
+    def run(self):
+        '''
+        Function that are started when this WorkerThread are startd
+
+        This function runs the event loop until the service is shut down
+        '''
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.ready.set()
+
+        try:
+            self.loop.run_forever()
+        finally:
+            # Close the connections kept between tasks
+            self.loop.run_until_complete(Connection_manager.release_all())
+
+            # Cancel what is still running and release the loop resources
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.run_until_complete(self.loop.shutdown_default_executor())
+            self.loop.close()
+
+            print('------ Bluetooth service stopped ------')
+
+
+    def submit(self, coroutine):
+        '''
+        Schedule a coroutine on the service loop from any thread
+
+        Returns:
+            concurrent.futures.Future with the result of the coroutine
+        '''
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+    def call_soon(self, callback, *args):
+        '''
+        Schedule a callback on the service loop from any thread
+        '''
+
+        self.loop.call_soon_threadsafe(callback, *args)
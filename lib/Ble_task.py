@@ -0,0 +1,88 @@
+import concurrent.futures
+
+from lib.Ble_service import Ble_service
+from lib.Signals import Signal_object
+
+
+# Maximum time (s) to wait for the running tasks to save their data when the application quits
+STOP_TIMEOUT = 60.0
+
+
+class Ble_task(Signal_object):
+    '''
+    Base class of the tasks that run on the shared bluetooth event loop.
+
+    Subclasses implement the coroutine run() and talk with the main thread through their
+    pyqtSignals, which are delivered as queued signals because they are emitted from the
+    loop thread. Without Qt (headless mode) the signals call their slots in the loop thread.
+    '''
+
+    # Tasks submitted and not finished yet
+    running = set()
+
+
+    def __init__(self):
+        '''
+        Initialize the class variables
+        '''
+
+        super().__init__()
+        self.future = None
+
+
+    def start(self):
+        '''
+        Submit the task to the bluetooth service
+        '''
+
+        Ble_task.running.add(self)
+
+        self.future = Ble_service.instance().submit(self.run())
+        self.future.add_done_callback(self.task_done)
+
+
+    def isRunning(self):
+        '''
+        Return if the task was submitted and has not finished yet
+        '''
+
+        return self.future is not None and not self.future.done()
+
+
+    async def run(self):
+        '''
+        Coroutine executed on the bluetooth service loop
+        '''
+
+        raise NotImplementedError
+
+
+    def task_done(self, future):
+        '''
+        Report the errors that ended the task
+        '''
+
+        Ble_task.running.discard(self)
+
+        if not future.cancelled() and future.exception() is not None:
+            print(f'Error: {future.exception()!r}')
+
+
+    @classmethod
+    def stop_all(cls, timeout=STOP_TIMEOUT):
+        '''
+        Stop the running tasks that can be stopped (the collections) and wait for them to finish
+
+        The collections save their data when they finish, so this must be called before the
+        bluetooth service is shut down, which cancels whatever is still running.
+
+        Parameters:
+            timeout (float): maximum time (s) to wait for the tasks.
+        '''
+
+        tasks = [task for task in list(cls.running) if callable(getattr(task, 'stop', None))]
+
+        for task in tasks:
+            task.stop()
+
+        concurrent.futures.wait([task.future for task in tasks], timeout)
@@ -1,9 +1,9 @@
-import numpy as np
-from sklearn.metrics import mutual_info_score
-import pandas as pd
 from PyQt5.QtCore import QThread, pyqtSignal
 import warnings
 
+from lib import Calibration
+from lib import Hrv_features
+
 
 def warn(*args, **kwargs):
     '''
@@ -21,19 +21,21 @@ class Boundary_calculation(QThread):
     '''
 
     # Variables that connect this thread with the main thread
-    finished_signal = pyqtSignal(float, list, list)
+    finished_signal = pyqtSignal(dict)
 
 
-    def __init__(self, path):
+    def __init__(self, path, windows=None):
         '''
         Initialize the class variables
 
         Parameters:
-            path (string): path of the file with HRV values
+            path (string or list): file with RR intervals or HRV values, folder of files or list of files and folders;
+            windows (list): sizes (beats) of the RR windows of the candidate features.
 
         '''
         super().__init__()
         self.path = path
+        self.windows = windows or Hrv_features.WINDOWS
 
 
     def run(self):
@@ -41,45 +43,16 @@ class Boundary_calculation(QThread):
         Function that are started when this WorkerThread are startd
 
         This function perform the boundary calculation using Mutual Info Score (MIS)
+        between each candidate feature (HR, sdNN, RMSSD, pNN50 over the RR windows) and the
+        real state, on all the sessions together, and ranks the features
         '''
 
-        # Open the .CSV and remove the NaN values
-        df = pd.read_csv(self.path)
-        df = df.dropna()
-
-        # Getting the HRV and real_state from the dataset
-        std = list(df['std'])
-        real_state = list(df['real_state'])
-
-        # Recreating the dataframe to shuffle all the data
-        df = pd.DataFrame({'std':std, 'real_state':real_state[:len(std)]})
-
-        # Temporary variables to make the plot in the end
-        tmp1 = [i for i in range(len(list(df['std'])))]
-
-        # Turn the data into lists to process the MIS
-        std = list(df['std'])
-        state = list(df['real_state'])
-
-        # Combine and sort based on std values
-        combined = sorted(zip(std, state), key=lambda x: x[0])
-
-        # Calculate midpoints
-        midpoints = [(combined[i][0] + combined[i+1][0]) / 2 for i in range(len(combined) - 1)]
-
-        best_threshold = None
-        best_score = 0
-
-        for midpoint in midpoints:
-            # Compute information gain for the split
-            info_gain = mutual_info_score(std, [1 if value > midpoint else 0 for value in std])
-
-            # Update best threshold if information gain is better
-            if info_gain > best_score:
-                best_score = info_gain
-                best_threshold = midpoint
+        # The sessions are loaded and their features computed in parallel processes
+        result = Calibration.calibrate(self.path, windows=self.windows)
+        result['report'] = Calibration.report(result)
 
-        print("Best division:", best_threshold)
+        print(result['report'])
+        print("Best division:", result['best'], result['threshold'])
 
         # Send a signal to the main thread
-        self.finished_signal.emit(best_threshold, std, tmp1)
\ No newline at end of file
+        self.finished_signal.emit(result)
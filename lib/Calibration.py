@@ -0,0 +1,256 @@
+import concurrent.futures
+import glob
+import itertools
+import multiprocessing
+import os
+import time as ts
+
+import numpy as np
+
+from lib import Hrv_features
+from lib import Threshold_search
+
+
+# Columns of the calibration files: real state of each beat or window, and its RR interval and
+# heart rate (the candidate features are computed from them) or its sdNN (used as it is)
+STATE_COLUMN = 'real_state'
+RR_COLUMN = 'rr interval'
+HR_COLUMN = 'heart rate'
+VALUE_COLUMN = 'std'
+
+# Name of the feature of the files without RR intervals
+FILE_FEATURE = 'sdNN (file)'
+
+# Bytes of files for each process started by default: a process costs a new interpreter with
+# pandas (about 0.7 s), loading a file and searching its features about 1.1 s per MB
+BYTES_PER_PROCESS = 2 ** 20
+
+
+def session_files(paths):
+    '''
+    Return the calibration files of a list of files and folders, the CSV files of each folder
+
+    Parameters:
+        paths (string or list): file, folder or list of them.
+    '''
+
+    if isinstance(paths, str):
+        paths = [paths]
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.csv')))
+        else:
+            files.append(path)
+
+    return files
+
+
+def load_session(path, windows=Hrv_features.WINDOWS):
+    '''
+    Load a calibration file, compute its features and search their thresholds, run in the worker processes
+
+    Parameters:
+        path (string): calibration file;
+        windows (list): sizes (beats) of the RR windows of the features.
+
+    Returns:
+        dict with the path, the names of the features, the features and state of each beat,
+        the threshold and score of each feature, or with the error when the file cannot be used
+    '''
+
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(path, usecols=lambda column: column in (STATE_COLUMN, RR_COLUMN, HR_COLUMN, VALUE_COLUMN))
+    except (OSError, ValueError) as e:
+        return {'path': path, 'error': str(e)}
+
+    if STATE_COLUMN not in df.columns:
+        return {'path': path, 'error': f'no "{STATE_COLUMN}" column'}
+
+    if RR_COLUMN in df.columns:
+        df = df.dropna(subset=[STATE_COLUMN, RR_COLUMN])
+        hr = df[HR_COLUMN].to_numpy(dtype=float) if HR_COLUMN in df.columns else None
+
+        names, matrix = Hrv_features.window_features(df[RR_COLUMN].to_numpy(dtype=float), windows, hr)
+    elif VALUE_COLUMN in df.columns:
+        df = df.dropna(subset=[STATE_COLUMN, VALUE_COLUMN])
+
+        names, matrix = [FILE_FEATURE], df[[VALUE_COLUMN]].to_numpy(dtype=float)
+    else:
+        return {'path': path, 'error': f'no "{RR_COLUMN}" or "{VALUE_COLUMN}" column'}
+
+    labels = df[STATE_COLUMN].to_numpy()
+
+    thresholds, scores = Threshold_search.best_thresholds(matrix, labels)
+
+    return {'path': path, 'names': names, 'matrix': matrix, 'labels': labels, 'thresholds': thresholds, 'scores': scores}
+
+
+def calibrate(paths, workers=None, windows=Hrv_features.WINDOWS):
+    '''
+    Calibrate the decision boundary of every candidate feature on several sessions
+
+    The files are loaded, their features computed and searched in a process pool, one file per
+    task, then the pooled threshold of all the features is searched on the beats of all the
+    sessions and the features are ranked by their information score.
+
+    The agreement is the fraction of the beats whose side of a threshold predicts their real
+    state, the state of each side being its most frequent state in all the sessions. Each
+    session reports it for the best feature, with its own threshold and with the pooled one.
+
+    Parameters:
+        paths (string or list): calibration files and folders;
+        workers (int): number of processes, by default one for each BYTES_PER_PROCESS of files, up to the number of CPUs;
+        windows (list): sizes (beats) of the RR windows of the features.
+
+    Returns:
+        dict with the features ranked (name, threshold, score, agreement), the best one, the
+        pooled features and states, and the result of each session
+    '''
+
+    files = session_files(paths)
+
+    if workers is None:
+        # Small calibrations are faster in this process than with the start of new ones
+        size = sum(os.path.getsize(path) for path in files if os.path.isfile(path))
+        workers = min(os.cpu_count() or 1, size // BYTES_PER_PROCESS + 1)
+
+    workers = max(1, min(workers, len(files)))
+
+    t = ts.perf_counter()
+
+    # A single file does not pay the start of the processes
+    if workers == 1:
+        sessions = [load_session(path, windows) for path in files]
+    else:
+        # New interpreters, the interface threads must not be forked
+        context = multiprocessing.get_context('spawn')
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            sessions = list(executor.map(load_session, files, itertools.repeat(windows)))
+
+    errors = [session for session in sessions if 'error' in session]
+    sessions = [session for session in sessions if 'error' not in session and len(session['labels']) > 0]
+
+    for session in errors:
+        print(f'------ Skip \"{session["path"]}\": {session["error"]} ------')
+
+    # Features of all the sessions, NaN where a session does not have one
+    names = list(dict.fromkeys(itertools.chain.from_iterable(session['names'] for session in sessions)))
+    matrix = np.full((sum(len(session['labels']) for session in sessions), len(names)), np.nan)
+    labels = np.concatenate([session['labels'] for session in sessions]) if sessions else np.array([])
+
+    row = 0
+    for session in sessions:
+        columns = [names.index(name) for name in session['names']]
+        matrix[row : row + len(session['labels']), columns] = session['matrix']
+        row += len(session['labels'])
+
+    thresholds, scores = Threshold_search.best_thresholds(matrix, labels)
+
+    features = []
+    for column in np.argsort(-scores, kind='stable'):
+        if np.isnan(thresholds[column]):
+            continue
+
+        values, states = column_values(matrix, labels, column)
+        sides = Threshold_search.side_states(values, states, thresholds[column])
+
+        features.append({'name': names[column],
+                         'threshold': float(thresholds[column]),
+                         'score': float(scores[column]),
+                         'agreement': Threshold_search.agreement(values, states, thresholds[column], sides),
+                         'sides': sides,
+        })
+
+    result = {'features': features,
+              'best': features[0]['name'] if features else None,
+              'threshold': features[0]['threshold'] if features else None,
+              'score': features[0]['score'] if features else 0.0,
+              'agreement': features[0]['agreement'] if features else None,
+              'names': names,
+              'matrix': matrix,
+              'labels': labels,
+              'sessions': sessions,
+              'errors': [(session['path'], session['error']) for session in errors],
+              'workers': workers,
+              'duration': ts.perf_counter() - t,
+    }
+
+    # Agreement of each session on the best feature
+    for session in sessions:
+        if result['best'] not in session['names']:
+            continue
+
+        column = session['names'].index(result['best'])
+        values, states = column_values(session['matrix'], session['labels'], column)
+
+        session['threshold'] = None if np.isnan(session['thresholds'][column]) else float(session['thresholds'][column])
+        session['score'] = float(session['scores'][column])
+        session['windows'] = len(values)
+        session['agreement'] = Threshold_search.agreement(values, states, result['threshold'], features[0]['sides'])
+
+        if session['threshold'] is not None:
+            own_sides = Threshold_search.side_states(values, states, session['threshold'])
+            session['own_agreement'] = Threshold_search.agreement(values, states, session['threshold'], own_sides)
+
+    return result
+
+
+def column_values(matrix, labels, column):
+    '''
+    Return the values of a feature and their states, without the beats where it is missing
+    '''
+
+    valid = ~np.isnan(matrix[:, column])
+
+    return matrix[valid, column], labels[valid]
+
+
+def feature_values(result, name):
+    '''
+    Return the pooled values of a feature of a calibration and their states
+    '''
+
+    return column_values(result['matrix'], result['labels'], result['names'].index(name))
+
+
+def report(result, top=10):
+    '''
+    Return the text report of a calibration: the ranking of the features and the result of each session on the best one
+    '''
+
+    lines = [f'{len(result["sessions"])} sessions, {len(result["labels"])} beats, {len(result["names"])} features, '
+             f'{result["workers"]} processes, {result["duration"]:.2f} s']
+
+    if result['best'] is None:
+        return '\n'.join(lines + ['No threshold: the values cannot be split'])
+
+    lines.append('')
+    lines.append(f'{"rank":>4} {"feature":<12} {"threshold":>10} {"score":>7} {"agreement":>9}')
+
+    for rank, feature in enumerate(result['features'][:top], 1):
+        lines.append(f'{rank:4d} {feature["name"]:<12} {feature["threshold"]:10.3f} {feature["score"]:7.4f} {100 * feature["agreement"]:8.1f}%')
+
+    lines.append('')
+    lines.append(f'Sessions on {result["best"]} (pooled threshold {result["threshold"]:.3f}):')
+    lines.append(f'{"windows":>8} {"threshold":>10} {"score":>7} {"own":>7} {"pooled":>7}  session')
+
+    for session in result['sessions']:
+        if 'agreement' not in session:
+            lines.append(f'{"-":>8} {"-":>10} {"-":>7} {"-":>7} {"-":>7}  {os.path.basename(session["path"])}')
+            continue
+
+        own = f'{100 * session["own_agreement"]:6.1f}%' if 'own_agreement' in session else f'{"-":>7}'
+        threshold = f'{session["threshold"]:10.3f}' if session['threshold'] is not None else f'{"-":>10}'
+
+        lines.append(f'{session["windows"]:8d} {threshold} {session["score"]:7.4f} {own} '
+                     f'{100 * session["agreement"]:6.1f}%  {os.path.basename(session["path"])}')
+
+    for path, error in result['errors']:
+        lines.append(f'Skipped {os.path.basename(path)}: {error}')
+
+    return '\n'.join(lines)
@@ -1,54 +1,56 @@
 import asyncio
 
-from bleak import BleakClient
-from PyQt5.QtCore import QThread, pyqtSignal
+from lib.Ble_task import Ble_task
+from lib.Connection_manager import Connection_manager
+from lib.Signals import Signal
 
-# UUID for model number
-MODEL_NBR_UUID = '00002a24-0000-1000-8000-00805f9b34fb'
-# UUID for manufacturer name
-MANUFACTURER_NAME_UUID = '00002a29-0000-1000-8000-00805f9b34fb'
 # UUID for battery level
 BATTERY_LEVEL_UUID = '00002a19-0000-1000-8000-00805f9b34fb'
 
 
-class Check_status(QThread):
+class Check_status(Ble_task):
     '''
     Class responsible for performing check status task.
     '''
 
     # Variable that connect this thread with the main thread
-    finished_signal = pyqtSignal(int, str, str, str)
+    finished_signal = Signal(int, str, str, str)
 
-    def __init__(self, address):
+    def __init__(self, address, keep_connection=True):
         '''
         Initialize the class variables
 
         Parameters:
-            address (str): MAC address of the device
+            address (str): MAC address of the device;
+            keep_connection (boolean): flag that decides if the verified connection is kept for the data collection.
         '''
 
         super().__init__()
         self.address = address
+        self.keep_connection = keep_connection
+        self.statusString = []
+        self.model = ''
+        self.battery = ''
 
 
-    def run(self):
+    async def run(self):
         '''
-        Function that are started when this WorkerThread are startd
+        Coroutine that are started on the bluetooth service when this task are started
 
         This function perform the check status task
         '''
 
         self.statusString = []
+        status = 1
 
-        # Run the events
-        loop = asyncio.new_event_loop()
-
-        status = loop.run_until_complete(self.connect())
-
-        if not status:
-            self.finished_signal.emit(status, self.statusString[0], self.statusString[1], self.statusString[2])
-        else:
-            self.finished_signal.emit(status, self.statusString[0], '', '')
+        try:
+            status = await self.connect()
+        finally:
+            # The result is sent even when the check fails or is interrupted, the window waits for it
+            if status == 0 and len(self.statusString) == 3:
+                self.finished_signal.emit(status, self.statusString[0], self.statusString[1], self.statusString[2])
+            else:
+                self.finished_signal.emit(1, self.statusString[0] if self.statusString else 'Error: The status check was interrupted', '', '')
 
 
     async def check_connection(self, client):
@@ -62,14 +64,14 @@ class Check_status(QThread):
         if client.is_connected:
             # Retrieve device characteristics
 
-            model_number = await client.read_gatt_char(MODEL_NBR_UUID)
-            self.statusString.append("Model Number: {0}".format("".join(map(chr, model_number))))
-
-            manufacturer_name = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
-            self.statusString.append("Manufacturer Name: {0}".format("".join(map(chr, manufacturer_name))))
+            device_info = await Connection_manager.read_device_info(self.address, client)
+            self.model = device_info['model']
+            self.statusString.append("Model Number: {0}".format(device_info['model']))
+            self.statusString.append("Manufacturer Name: {0}".format(device_info['manufacturer']))
 
             battery_level = await client.read_gatt_char(BATTERY_LEVEL_UUID)
-            self.statusString.append("Battery Level: {0}%".format(int(battery_level[0])))
+            self.battery = "{0}%".format(int(battery_level[0]))
+            self.statusString.append("Battery Level: {0}".format(self.battery))
 
         else:
             self.statusString.append('Error: Unable to connect to the device')
@@ -78,23 +80,48 @@ class Check_status(QThread):
     async def connect(self):
         '''
         Connected to the device
+
+        The verified client is kept alive in the Connection_manager, so the data collection
+        can reuse it, unless keep_connection is False. A client already kept by a previous
+        check is used and then given back, it belongs to the collection that follows that check.
         '''
 
         print('------ Connecting to the Polar H10 ------\n\n')
 
-        try:
-            async with BleakClient(self.address) as client:
+        client = Connection_manager.take(self.address)
+        was_kept = client is not None
 
-                # Check the connected
-                task = asyncio.create_task(self.check_connection(client))
+        try:
+            if client is None:
+                client = Connection_manager.new_client(self.address)
+                await client.connect()
 
-                await asyncio.gather(task)
+            # Check the connected
+            task = asyncio.create_task(self.check_connection(client))
 
-                await client.disconnect()
+            await asyncio.gather(task)
 
         except Exception as e:
             print(e)
             self.statusString= [str(e)]
+
+            if client is not None:
+                await Connection_manager.disconnect(client)
+
             return 1
 
+        except asyncio.CancelledError:
+            # The check was cancelled (e.g. timeout), the link it opened must not stay open
+            if was_kept:
+                Connection_manager.keep(self.address, client)
+            elif client is not None:
+                await Connection_manager.disconnect(client)
+
+            raise
+
+        if self.keep_connection or was_kept:
+            Connection_manager.keep(self.address, client)
+        else:
+            await Connection_manager.disconnect(client)
+
         return 0
@@ -0,0 +1,206 @@
+import datetime
+import time as ts
+
+import numpy as np
+import pandas as pd
+
+
+# Number of frames used in each fit of the sensor clock
+CLOCK_WINDOW = 512
+# Number of frames between two fits
+CLOCK_REFIT_INTERVAL = 32
+# Fraction of the nominal sample interval accepted when measuring it from consecutive frames
+SAMPLE_INTERVAL_TOLERANCE = 0.1
+
+
+def sample_timestamps(frame_timestamps, frame_sizes, sample_rate):
+    '''
+    Reconstruct the sensor timestamp of every sample from the timestamps of the frames
+
+    The timestamp of a PMD frame is the one of its last sample. The sample interval is measured
+    between consecutive frames, the nominal one is used for the first frame and after a gap.
+
+    Parameters:
+        frame_timestamps (list): sensor timestamp (ns) of each frame;
+        frame_sizes (list): number of samples of each frame;
+        sample_rate (float): nominal sample rate (Hz).
+
+    Returns:
+        numpy.ndarray of int64 with the sensor timestamp (ns) of each sample
+    '''
+
+    frame_timestamps = np.asarray(frame_timestamps, dtype=np.int64)
+    frame_sizes = np.asarray(frame_sizes, dtype=np.int64)
+
+    nominal = 1e9 / sample_rate
+    interval = np.full(len(frame_timestamps), nominal)
+
+    if len(frame_timestamps) > 1:
+        measured = np.diff(frame_timestamps) / np.maximum(frame_sizes[1:], 1)
+        valid = np.abs(measured / nominal - 1) < SAMPLE_INTERVAL_TOLERANCE
+        interval[1:][valid] = measured[valid]
+
+    # Number of samples between each sample and the last one of its frame
+    frame = np.repeat(np.arange(len(frame_sizes)), frame_sizes)
+    last = np.cumsum(frame_sizes) - 1
+    back = last[frame] - np.arange(len(frame))
+
+    return np.repeat(frame_timestamps, frame_sizes) - np.round(back * interval[frame]).astype(np.int64)
+
+
+class Clock_model:
+    '''
+    Online model of the sensor clock in the host monotonic time (time.perf_counter).
+
+    The model is a linear fit of the host arrival time on the sensor timestamp of the PMD
+    frames, over a sliding window. The radio latency only delays the arrivals, so the fit
+    follows the lower envelope of the points: the slope is fitted on the frames with less
+    delay than the median and the offset is moved to the 5th percentile of their residuals.
+
+    Each fit is kept with the sensor time where it was made, so the samples are converted with
+    the fit of their own part of the session and the drift is corrected.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize the class variables
+        '''
+
+        # Wall clock and host clock read together, used to convert the host time to the time of day
+        self.anchor_wall = ts.time()
+        self.anchor_host = ts.perf_counter()
+
+        self.sensor = np.zeros(CLOCK_WINDOW, dtype=np.int64)
+        self.host = np.zeros(CLOCK_WINDOW)
+        self.n_points = 0
+        self.since_fit = 0
+
+        # Reference of the sensor time, keeps the fit well conditioned
+        self.sensor_ref = None
+
+        # Sensor time (ns) of each fit, its slope (host s per sensor s) and offset (host s at sensor_ref)
+        self.fit_end = []
+        self.slope = []
+        self.offset = []
+        self.residual = []
+
+
+    def add(self, sensor_timestamp, host_time):
+        '''
+        Add the sensor timestamp and the host arrival time of a frame
+
+        Parameters:
+            sensor_timestamp (int): sensor timestamp (ns) of the last sample of the frame;
+            host_time (float): host arrival time (s, time.perf_counter).
+        '''
+
+        if self.sensor_ref is None:
+            self.sensor_ref = sensor_timestamp
+
+        index = self.n_points % CLOCK_WINDOW
+        self.sensor[index] = sensor_timestamp
+        self.host[index] = host_time
+
+        self.n_points += 1
+        self.since_fit += 1
+
+        if self.since_fit >= CLOCK_REFIT_INTERVAL:
+            self.fit()
+
+
+    def fit(self):
+        '''
+        Fit the model on the frames of the window
+        '''
+
+        n = min(self.n_points, CLOCK_WINDOW)
+
+        if n < 2 or self.since_fit == 0:
+            return
+
+        x = (self.sensor[:n] - self.sensor_ref) / 1e9
+        y = self.host[:n]
+
+        slope, offset = np.polyfit(x, y, 1)
+        residuals = y - (offset + slope * x)
+
+        lower = residuals <= np.median(residuals)
+        if lower.sum() >= 2 and np.ptp(x[lower]) > 0:
+            slope, offset = np.polyfit(x[lower], y[lower], 1)
+
+        residuals = y - (offset + slope * x)
+        offset += np.percentile(residuals[lower], 5)
+
+        self.fit_end.append(int(self.sensor[:n].max()))
+        self.slope.append(slope)
+        self.offset.append(offset)
+        self.residual.append(float(np.percentile(residuals, 95) - np.percentile(residuals, 5)))
+
+        self.since_fit = 0
+
+
+    def drift(self):
+        '''
+        Return the drift (ppm) of the sensor clock relative to the host clock in the last fit
+        '''
+
+        if self.slope == []:
+            return float('nan')
+
+        return (self.slope[-1] - 1) * 1e6
+
+
+    def to_host(self, sensor_timestamps):
+        '''
+        Convert sensor timestamps (ns) to host time (s, time.perf_counter)
+
+        Each timestamp uses the first fit made after it, the last fit is used after the end.
+        Before the first fit only the offset of the first frame is known.
+        '''
+
+        self.fit()
+
+        sensor_timestamps = np.asarray(sensor_timestamps, dtype=np.int64)
+
+        if self.slope == []:
+            if self.n_points == 0:
+                return np.full(sensor_timestamps.shape, np.nan)
+
+            return self.host[0] + (sensor_timestamps - self.sensor[0]) / 1e9
+
+        fit = np.minimum(np.searchsorted(self.fit_end, sensor_timestamps), len(self.fit_end) - 1)
+        x = (sensor_timestamps - self.sensor_ref) / 1e9
+
+        return np.asarray(self.offset)[fit] + np.asarray(self.slope)[fit] * x
+
+
+    def wall_time(self, host_times):
+        '''
+        Convert host times (s, time.perf_counter) to the local time of day (datetime.time)
+        '''
+
+        if np.ndim(host_times) == 0:
+            return datetime.datetime.fromtimestamp(self.anchor_wall + host_times - self.anchor_host).time()
+
+        anchor = pd.Timestamp(datetime.datetime.fromtimestamp(self.anchor_wall))
+        offsets = pd.to_timedelta(np.asarray(host_times, dtype=float) - self.anchor_host, unit='s')
+
+        return (anchor + offsets).time
+
+
+    def to_dict(self):
+        '''
+        Return the model as a JSON serializable dictionary
+        '''
+
+        self.fit()
+
+        return {'frames': self.n_points,
+                'fits': len(self.slope),
+                'drift_ppm': None if self.slope == [] else self.drift(),
+                'drift_ppm_min': None if self.slope == [] else (min(self.slope) - 1) * 1e6,
+                'drift_ppm_max': None if self.slope == [] else (max(self.slope) - 1) * 1e6,
+                'residual_p5_p95': None if self.residual == [] else float(np.median(self.residual)),
+                'anchor_wall': self.anchor_wall,
+                'anchor_host': self.anchor_host,
+        }
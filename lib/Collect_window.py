@@ -1,13 +1,11 @@
 import datetime
+import math
 
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QPushButton, QLabel, QMessageBox, QDesktopWidget, QHBoxLayout
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.animation as animation
-import matplotlib.pyplot as plt
+import numpy as np
 
 from lib.Data_collector import Data_collector
-from lib.Tapping_thread import Tapping_thread
 
 
 WINDOW_LIMIT = {'All data': None, '1 minute': 60, '2 minutes': 120, '3 minutes': 180, '4 minutes': 240, '5 minutes': 300, '10 minutes': 600}
@@ -17,7 +15,7 @@ class Collect_window(QMainWindow):
     Class responsible for building and implementing the data collection interface functionalities.
     '''
 
-    def __init__(self, app_window, name, address, display_graph, capture_ecg, save_current_time, output_filename, tapping_flag, setting_values):
+    def __init__(self, app_window, name, address, display_graph, capture_ecg, save_current_time, output_filename, tapping_flag, setting_values, capture_acc=False):
         '''
         Initialize the data collection UI
 
@@ -30,7 +28,8 @@ class Collect_window(QMainWindow):
             save_current_time (boolean): flag that decides if the current PC time will be saved;
             output_filename (string): filename of the output files;
             tapping_flag (boolean): flag thta decides if the tapping experiment will occur.
-            setting_values (dict): aditional settings for the experiment
+            setting_values (dict): aditional settings for the experiment;
+            capture_acc (boolean): flag that decides whether the accelerometer will be captured with the RR.
         '''
 
         super(Collect_window, self).__init__()
@@ -39,6 +38,7 @@ class Collect_window(QMainWindow):
         self.address = address
         self.display_graph = display_graph
         self.capture_ecg = capture_ecg
+        self.capture_acc = capture_acc
         self.save_current_time = save_current_time
         self.output_filename = output_filename
         self.tapping_flag = tapping_flag
@@ -50,19 +50,42 @@ class Collect_window(QMainWindow):
         self.central_layout = QVBoxLayout(self.central_widget)
 
         connecting2_label = QLabel('Connection to: ' + name, self)
-        collecting_label = QLabel('Collecting: HR' + (', RR and ECG' if self.capture_ecg else ' and RR'), self)
+        collecting_label = QLabel('Collecting: HR, RR' + (', ECG' if self.capture_ecg else '') + (', accelerometer' if self.capture_acc else ''), self)
+
+        # Running distribution of HR and sdNN
+        self.distribution_label = QLabel('Distribution: waiting for data', self)
+
+        # Device status polled during the collection
+        self.telemetry_label = QLabel('Device: waiting for data', self)
+
+        # Rate, gaps and jitter of the notification streams
+        self.stream_stats_label = QLabel('Streams: waiting for data', self)
+
+        # Latency from the arrival of the notifications, queue of the plot and samples dropped
+        self.latency_label = QLabel('Latency: waiting for data', self)
 
         self.central_layout.addWidget(connecting2_label)
         self.central_layout.addWidget(collecting_label)
+        self.central_layout.addWidget(self.distribution_label)
+        self.central_layout.addWidget(self.telemetry_label)
+        self.central_layout.addWidget(self.stream_stats_label)
+        self.central_layout.addWidget(self.latency_label)
 
         if self.display_graph:
+            # matplotlib is loaded only when the graph is displayed
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+            import matplotlib.animation as animation
+            from matplotlib.collections import LineCollection
+
             self.figure, self.ax = Figure(figsize=(14,8), dpi=100), None
             self.canvas = FigureCanvas(self.figure)
             self.canvas_widget = self.canvas
             self.central_layout.addWidget(self.canvas_widget)
 
             # Initial plot
-            self.ax = self.figure.add_subplot(111)
+            grid = self.figure.add_gridspec(1, 2, width_ratios=[4, 1])
+            self.ax = self.figure.add_subplot(grid[0])
             self.x_data, self.y_data, self.state = [], [], []
             self.line, = self.ax.plot(self.x_data, self.y_data)
             if self.setting_values['display_decision_boundary']:
@@ -73,13 +96,30 @@ class Collect_window(QMainWindow):
                 self.len_state_sign = 0
                 self.state_points = []
 
+            # Taps of the tapping experiment, vertical lines over the whole height of the plot
+            self.tap_times = []
+            self.tap_lines = LineCollection([], colors='green', linewidths=1, alpha=0.6, transform=self.ax.get_xaxis_transform())
+            self.ax.add_collection(self.tap_lines, autolim=False)
+
             # Set xlabel and ylabel
             self.ax.set_xlabel('Time (s)' if not self.save_current_time else 'Index')
             self.ax.set_ylabel(self.setting_values['representation_type_value'])
 
+            # Distribution panel, a histogram with fixed bins aligned with the y axis of the plot
+            self.dist_ax = self.figure.add_subplot(grid[1])
+            self.dist_hist = None
+            self.dist_lines = [self.dist_ax.axhline(0, color=color, linestyle=style, visible=False)
+                               for color, style in [('gray', '--'), ('black', '-'), ('gray', '--')]]
+            self.dist_ax.set_xlabel('Count')
+            self.dist_ax.tick_params(labelleft=False)
+
             # Animation
             self.ani = animation.FuncAnimation(self.figure, self.update_plot, interval=1000, save_count=10)
 
+            # Points delivered to the plot in its last update, they are on the screen once it is drawn
+            self.plotted_points = 0
+            self.canvas.mpl_connect('draw_event', self.plot_rendered)
+
             # Save graph button
             self.save_button = QPushButton('Save graph', self)
             self.save_button.clicked.connect(self.save_graph)
@@ -107,6 +147,13 @@ class Collect_window(QMainWindow):
         self.is_processing = True
         self.tapping_is_processing = True
 
+        # Refresh the distribution summary once a second
+        self.distribution_timer = QTimer(self)
+        self.distribution_timer.timeout.connect(self.update_distribution)
+        self.distribution_timer.timeout.connect(self.update_stream_stats)
+        self.distribution_timer.timeout.connect(self.update_latency)
+        self.distribution_timer.start(1000)
+
         # Center the window on the screen
         self.center_window()
 
@@ -188,6 +235,7 @@ class Collect_window(QMainWindow):
 
         # Update the plot
         self.line.set_data(x, y)
+        self.plotted_points = len(self.x_data)
 
         # Add a boundary line
         if self.setting_values['display_decision_boundary']:
@@ -207,10 +255,137 @@ class Collect_window(QMainWindow):
                     x_state, y_state = zip(*self.state_points)
                     self.state_sign.set_offsets(list(zip(x_state, y_state)))
 
+        # Add the taps inside the plotted interval
+        if self.tapping_flag and self.tap_times != [] and x != []:
+            taps = self.tap_x()
+            taps = taps[(taps >= x[0]) & (taps <= x[-1])]
+            self.tap_lines.set_segments([[(tap, 0), (tap, 1)] for tap in taps])
+
         # Adjust plot limits if needed
         self.ax.relim()
         self.ax.autoscale_view()
 
+        # Update the distribution panel
+        self.update_distribution_plot()
+
+
+    def get_sketches(self):
+        '''
+        Return the (HR, sdNN) sketches of the running collection, or None before it starts
+        '''
+
+        data_rr = getattr(self.worker_thread, 'data_rr', None)
+
+        if data_rr is None:
+            return None
+
+        return data_rr.hr_sketch, data_rr.std_sketch
+
+
+    def update_distribution(self):
+        '''
+        This function updates the distribution summary (median, p5 and p95) of HR and sdNN.
+
+        Each query only walks the fixed bins of the sketches, so it does not depend on the
+        amount of data collected.
+        '''
+
+        sketches = self.get_sketches()
+
+        if sketches is None or sketches[0].count == 0:
+            return
+
+        text = []
+        for name, unit, sketch in zip(['HR', 'sdNN'], ['bpm', 'ms'], sketches):
+            if sketch.count > 0:
+                text.append(f'{name}: median {sketch.quantile(0.5):.1f} {unit} '
+                            f'(p5 {sketch.quantile(0.05):.1f}, p95 {sketch.quantile(0.95):.1f})')
+
+        self.distribution_label.setText('Distribution: ' + '   |   '.join(text))
+
+        if not self.is_processing:
+            self.distribution_timer.stop()
+
+
+    def update_stream_stats(self):
+        '''
+        This function shows the effective rate, gaps and jitter of each notification stream
+        '''
+
+        stream_stats = getattr(self.worker_thread, 'stream_stats', None)
+
+        if stream_stats is None:
+            return
+
+        text = [f'{name.upper()}: {stats.summary()}' for name, stats in stream_stats.items() if stats.frames > 0]
+
+        # Drift of the sensor clock, known once the PMD streams have enough frames
+        drift = self.worker_thread.clock.drift()
+        if not math.isnan(drift):
+            text.append(f'Clock drift: {drift:.1f} ppm')
+
+        if text != []:
+            self.stream_stats_label.setText('Streams: ' + '   |   '.join(text))
+
+
+    def update_latency(self):
+        '''
+        This function shows the current p50/p99 latency of each stream, the plot queue and the samples dropped
+        '''
+
+        latency = getattr(self.worker_thread, 'latency', None)
+
+        if latency is None:
+            return
+
+        text = latency.summary()
+
+        drops = sum(stats.missing for stats in self.worker_thread.stream_stats.values())
+        text.append(f'dropped {drops} samples')
+
+        if len(text) > 1:
+            self.latency_label.setText('Latency: ' + '   |   '.join(text))
+
+
+    def plot_rendered(self, _):
+        '''
+        This function records the latency of the points on the screen, after each draw of the plot
+        '''
+
+        latency = getattr(self.worker_thread, 'latency', None)
+
+        if latency is not None:
+            latency.render('hr', self.plotted_points)
+
+
+    def update_distribution_plot(self):
+        '''
+        This function redraws the histogram of the displayed variable from its sketch
+        '''
+
+        sketches = self.get_sketches()
+
+        if sketches is None:
+            return
+
+        sketch = sketches[self.setting_values['representation_type']]
+
+        if sketch.count == 0:
+            return
+
+        if self.dist_hist is None:
+            self.dist_hist = self.dist_ax.stairs(sketch.counts, sketch.edges(), orientation='horizontal', fill=True, alpha=0.5)
+        else:
+            self.dist_hist.set_data(values=sketch.counts)
+
+        for line, q in zip(self.dist_lines, [0.05, 0.5, 0.95]):
+            value = sketch.quantile(q)
+            line.set_ydata([value, value])
+            line.set_visible(not math.isnan(value))
+
+        self.dist_ax.set_xlim(0, max(1, sketch.counts.max()) * 1.1)
+        self.dist_ax.set_ylim(self.ax.get_ylim())
+
 
     def save_graph(self):
         '''
@@ -219,6 +394,8 @@ class Collect_window(QMainWindow):
         Just saves the graph generated by the data
         '''
 
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(14,8), dpi=100)
         plt.xlabel('Time (s)' if not self.save_current_time else 'Index')
         plt.ylabel(self.setting_values['representation_type_value'])
@@ -236,6 +413,9 @@ class Collect_window(QMainWindow):
 
             plt.scatter(x_state, y_state, color='red', marker='X', s=100)
 
+        if self.tapping_flag and self.tap_times != []:
+            plt.vlines(self.tap_x(), 0, 1, transform=plt.gca().get_xaxis_transform(), colors='green', linewidths=1, alpha=0.6)
+
         current_time = datetime.datetime.now()
 
         filename = self.output_filename + '-graph-' + str(current_time) + '.svg'
@@ -256,21 +436,30 @@ class Collect_window(QMainWindow):
                                             self.save_current_time,
                                             self.output_filename,
                                             self.setting_values,
+                                            self.capture_acc,
         )
 
         self.worker_thread.finished_signal.connect(self.collection_finished)
         self.worker_thread.start_collecting.connect(self.start_collecting_signal)
         self.worker_thread.plot_signal.connect(self.att_plot)
+        self.worker_thread.telemetry_signal.connect(self.update_telemetry)
         self.worker_thread.stop_signal.connect(self.worker_thread.stop)
 
         if self.tapping_flag:
+            # pynput is loaded only for the tapping experiment, it needs the display server
+            from lib.Tapping_thread import Tapping_thread
+
             self.tapping_experiment_thread = Tapping_thread(self.save_current_time,
                                                             self.output_filename,
+                                                            self.worker_thread,
             )
 
             self.tapping_experiment_thread.stop_signal.connect(self.tapping_experiment_thread.stop)
             self.tapping_experiment_thread.finished_signal.connect(self.tapping_thread_finished)
 
+            if self.display_graph:
+                self.tapping_experiment_thread.tap_signal.connect(self.add_tap)
+
         # Start the worker thread
         self.worker_thread.start()
 
@@ -290,6 +479,42 @@ class Collect_window(QMainWindow):
         self.state.append(state)
 
 
+    def add_tap(self, host_time):
+        '''
+        This function stores a tap of the tapping experiment, it is drawn in the next update of the plot
+
+        Parameters:
+            host_time (float): time of the tap (s, time.perf_counter)
+        '''
+
+        self.tap_times.append(host_time)
+
+
+    def tap_x(self):
+        '''
+        Return the position of the taps in the x axis of the plot
+        '''
+
+        data_rr = self.worker_thread.data_rr
+        taps = np.array(self.tap_times) - data_rr.t0
+
+        # The plot uses the index of the beats instead of the time
+        if self.save_current_time:
+            return np.interp(taps, data_rr.time, np.arange(len(data_rr.time)))
+
+        return taps
+
+
+    def update_telemetry(self, battery, rssi, mtu):
+        '''
+        This function shows the last device status polled by the WorkerThread
+        '''
+
+        self.telemetry_label.setText(f'Device: battery {battery}%   '
+                                     + (f'RSSI {rssi:.0f} dBm   ' if not math.isnan(rssi) else '')
+                                     + f'MTU {mtu}')
+
+
     def collection_finished(self):
         '''
         This function are called when the WorkerThread are finished
@@ -0,0 +1,191 @@
+import asyncio
+
+from lib import Ble_backend
+
+
+# UUID for model number
+MODEL_NBR_UUID = '00002a24-0000-1000-8000-00805f9b34fb'
+# UUID for manufacturer name
+MANUFACTURER_NAME_UUID = '00002a29-0000-1000-8000-00805f9b34fb'
+
+# Time (s) a kept client stays connected when no task takes it
+IDLE_TIMEOUT = 60.0
+
+
+class Connection_manager:
+    '''
+    Class responsible for keeping the verified connections alive between tasks.
+
+    The status check leaves its connected client here, so the data collection can start
+    streaming without connecting again. The static characteristics of each device (model
+    and manufacturer) are also cached, they never change for the same address.
+
+    All the methods must be called from the bluetooth service loop.
+    '''
+
+    # Connected clients by address
+    clients = {}
+
+    # Timers that release the kept clients not taken in time, by address
+    idle_timers = {}
+
+    # Static device characteristics by address
+    device_info = {}
+
+    # RSSI (dBm) of the last advertisement received by the scan, by address
+    advertised_rssi = {}
+
+    # Functions called when the link to a device is lost, by address
+    disconnect_callbacks = {}
+
+
+    @classmethod
+    def new_client(cls, address):
+        '''
+        Create a client that reports its link losses to the callback registered with on_disconnect
+        '''
+
+        return Ble_backend.new_client(address, disconnected_callback=lambda client: cls.disconnected(address))
+
+
+    @classmethod
+    def on_disconnect(cls, address, callback):
+        '''
+        Register the function called when the link to a device is lost (None to remove it)
+        '''
+
+        if callback is None:
+            cls.disconnect_callbacks.pop(address, None)
+        else:
+            cls.disconnect_callbacks[address] = callback
+
+
+    @classmethod
+    def disconnected(cls, address):
+        '''
+        Function called by the clients when the link to a device is lost
+        '''
+
+        callback = cls.disconnect_callbacks.get(address)
+
+        if callback is not None:
+            callback()
+
+
+    @classmethod
+    def keep(cls, address, client, timeout=IDLE_TIMEOUT):
+        '''
+        Store a connected client to be reused by the next task
+
+        The client is disconnected when no task takes it within the timeout, so the link does
+        not stay open when no collection follows the status check.
+
+        Parameters:
+            address (str): MAC address of the device;
+            client (BleakClient): Client connected to the device;
+            timeout (float): time (s) before the client is released, None to keep it until taken.
+        '''
+
+        cls.cancel_idle_timer(address)
+        cls.clients[address] = client
+
+        if timeout is not None:
+            cls.idle_timers[address] = asyncio.get_running_loop().call_later(timeout, cls.release_idle, address)
+
+
+    @classmethod
+    def cancel_idle_timer(cls, address):
+        '''
+        Cancel the release of the kept client of a device
+        '''
+
+        timer = cls.idle_timers.pop(address, None)
+
+        if timer is not None:
+            timer.cancel()
+
+
+    @classmethod
+    def release_idle(cls, address):
+        '''
+        Disconnect the kept client of a device that no task has taken
+        '''
+
+        cls.idle_timers.pop(address, None)
+        client = cls.clients.pop(address, None)
+
+        if client is not None:
+            print(f'------ Release the idle connection of {address} ------')
+            asyncio.ensure_future(cls.disconnect(client))
+
+
+    @classmethod
+    async def disconnect(cls, client):
+        '''
+        Disconnect a client, the errors are only reported
+
+        Returns:
+            True if the client was disconnected without error
+        '''
+
+        try:
+            await client.disconnect()
+        except Exception as e:
+            print(e)
+            return False
+
+        return True
+
+
+    @classmethod
+    def take(cls, address):
+        '''
+        Remove and return the stored client of a device
+
+        Returns:
+            BleakClient or None if there is no client still connected
+        '''
+
+        cls.cancel_idle_timer(address)
+        client = cls.clients.pop(address, None)
+
+        if client is not None and not client.is_connected:
+            return None
+
+        return client
+
+
+    @classmethod
+    async def read_device_info(cls, address, client):
+        '''
+        Return the model and manufacturer of a device, reading them only once
+
+        Parameters:
+            address (str): MAC address of the device;
+            client (BleakClient): Client connected to the device.
+        '''
+
+        if address not in cls.device_info:
+            model_number = await client.read_gatt_char(MODEL_NBR_UUID)
+            manufacturer_name = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
+
+            cls.device_info[address] = {'model': "".join(map(chr, model_number)),
+                                        'manufacturer': "".join(map(chr, manufacturer_name)),
+            }
+
+        return cls.device_info[address]
+
+
+    @classmethod
+    async def release_all(cls):
+        '''
+        Disconnect all the stored clients
+        '''
+
+        for address in list(cls.idle_timers):
+            cls.cancel_idle_timer(address)
+
+        while cls.clients:
+            address, client = cls.clients.popitem()
+
+            await cls.disconnect(client)
@@ -12,6 +12,20 @@ class Data:
         self.t0 = TIME_UNINITIALIZED
         self.time = []
 
+        # Index of the connection that received each sample, it changes after each gap
+        self.segment = []
+        self.current_segment = 0
+        self.gaps = []
+
+
+    def add_gap(self, start, end):
+        '''
+        Register an interval without data, the next samples belong to a new segment
+        '''
+
+        self.gaps.append((start, end))
+        self.current_segment += 1
+
 
     def get_time(self):
         current_time = datetime.datetime.now()
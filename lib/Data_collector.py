@@ -1,24 +1,29 @@
 import asyncio
 import datetime
+import json
 import time as ts
 
-from bleak import BleakClient
-from hrvanalysis import get_nn_intervals
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from PyQt5.QtCore import QThread, pyqtSignal
 
 
-from lib.Data import Data
+from lib.Ble_service import Ble_service
+from lib.Ble_task import Ble_task
+from lib.Clock_model import Clock_model
+from lib.Connection_manager import Connection_manager
+from lib.Data_acc import Data_acc
 from lib.Data_ecg import Data_ecg
 from lib.Data_rr import Data_rr
+from lib.Data_telemetry import Data_telemetry
+from lib import Hrv_features
+from lib.Latency_monitor import Latency_monitor
+from lib.Profiler import Profiler
+from lib import Publisher
+from lib.Signals import Signal
+from lib import Pmd
+from lib.Stream_stats import Stream_stats
 
 
-# UUID for model number
-MODEL_NBR_UUID = '00002a24-0000-1000-8000-00805f9b34fb'
-# UUID for manufacturer name
-MANUFACTURER_NAME_UUID = '00002a29-0000-1000-8000-00805f9b34fb'
 # UUID for battery level
 BATTERY_LEVEL_UUID = '00002a19-0000-1000-8000-00805f9b34fb'
 # UUID for Heart Rate Measurement
@@ -31,21 +36,43 @@ PMD_CONTROL = 'FB005C81-02E7-F387-1CAD-8ACD2D8DF0C8'
 PMD_DATA = 'FB005C82-02E7-F387-1CAD-8ACD2D8DF0C8'
 # UUID for request ECG stream
 ECG_WRITE = bytearray([0x02, 0x00, 0x00, 0x01, 0x82, 0x00, 0x01, 0x01, 0x0E, 0x00])
-
-
-class Data_collector(QThread):
+# ECG sample rate (Hz) requested by ECG_WRITE
+ECG_SAMPLE_RATE = 130
+# Default accelerometer sample rate (Hz), the closest rate supported by the device is used
+ACC_SAMPLE_RATE = 50
+# Interval (s) between two heart rate notifications
+HR_NOTIFICATION_INTERVAL = 1.0
+# Maximum time (s) to wait for a response of the PMD control point
+PMD_RESPONSE_TIMEOUT = 5.0
+
+# Delay (s) before the first reconnection attempt, doubled after each failure
+RECONNECT_BASE_DELAY = 1.0
+# Maximum delay (s) between two reconnection attempts
+RECONNECT_MAX_DELAY = 30.0
+
+# Default interval (s) between two polls of the device telemetry
+TELEMETRY_INTERVAL = 60
+
+# Time (s) without a new notification after which the buffers are considered drained at the stop
+DRAIN_QUIET_TIME = 0.05
+# Maximum time (s) spent draining the notifications at the stop
+DRAIN_TIMEOUT = 1.0
+
+
+class Data_collector(Ble_task):
     '''
     Class responsible for performing data collection.
     '''
 
     # Variables that connect this thread with the main thread
-    start_collecting = pyqtSignal()
-    plot_signal = pyqtSignal(float, float, int)
-    stop_signal = pyqtSignal()
-    finished_signal = pyqtSignal()
+    start_collecting = Signal()
+    plot_signal = Signal(float, float, int)
+    telemetry_signal = Signal(int, float, int)
+    stop_signal = Signal()
+    finished_signal = Signal()
 
 
-    def __init__(self, address, display_graph, capture_ecg, save_current_time, output_filename, setting_values):
+    def __init__(self, address, display_graph, capture_ecg, save_current_time, output_filename, setting_values, capture_acc=False):
         '''
         Initialize the class variables
 
@@ -55,59 +82,165 @@ class Data_collector(QThread):
             capture_ecg (boolean): flag that decides whether ECG will be captured with the RR;
             save_current_time (boolean): flag that decides if the current PC time will be saved;
             output_filename (string): filename of the ouput file;
-            setting_values (dict): aditional settings for the experiment.
+            setting_values (dict): aditional settings for the experiment;
+            capture_acc (boolean): flag that decides whether the accelerometer will be captured with the RR.
         '''
 
         super().__init__()
         self.address = address
         self.display_graph = display_graph
         self.capture_ecg = capture_ecg
+        self.capture_acc = capture_acc
         self.save_current_time = save_current_time
         self.output_filename = output_filename
         self.setting_values = setting_values
 
+        # Created here, so the collection can be stopped before its coroutine starts
+        self.interrupt_flag = False
+        self.stop_requested_at = None
+
+        # Set when the collection must stop, it wakes up all the waiting coroutines at once
+        self.stop_event = asyncio.Event()
 
-    def run(self):
+
+    async def run(self):
         '''
-        Function that are started when this WorkerThread are startd
+        Coroutine that are started on the bluetooth service when this task are started
 
         This function perform the data collection
         '''
 
-        self.interrupt_flag = False
+        self.init_data()
+
+        # Profile the session when it is enabled by the environment or the settings
+        profiler = Profiler.start_session(self.output_filename, self.setting_values)
+
+        await self.connect()
+
+        # Write the files outside the event loop, so other tasks keep running
+        loop = asyncio.get_running_loop()
+
+        if profiler is None:
+            await loop.run_in_executor(None, self.save)
+        else:
+            await loop.run_in_executor(None, profiler.call, self.save, 'Save')
+
+            profiler.disable_thread()
+            await loop.run_in_executor(None, profiler.stop)
+
+        # Send a signal to the main thread
+        self.finished_signal.emit()
+
+
+    def init_data(self):
+        '''
+        Create the objects that will store the data of a new collection
+        '''
+
+        # Duration (s) of each stage of the shutdown
+        self.shutdown_timing = {}
+
+        # Host time base of the collection and model of the sensor clock
+        self.clock = Clock_model()
 
         # This object stores the ECG recorded
-        self.data_ecg = Data_ecg()
+        self.data_ecg = Data_ecg(ECG_SAMPLE_RATE)
 
         # This object stores the ECG recorded
         self.data_rr = Data_rr()
 
-        # Run the events
-        loop = asyncio.new_event_loop()
+        # This object stores the accelerometer recorded
+        self.data_acc = Data_acc()
+        self.acc_settings = {}
+
+        # Rate, gaps and jitter of each notification stream
+        self.stream_stats = {'hr': Stream_stats(nominal_interval=HR_NOTIFICATION_INTERVAL),
+                             'ecg': Stream_stats(sample_rate=ECG_SAMPLE_RATE),
+                             'acc': Stream_stats(),
+        }
+
+        # Latency of each stage of the collection path, from the arrival of the notifications
+        self.latency = Latency_monitor()
+
+        # Publisher of the decoded samples to local subscribers, when it is enabled
+        self.publisher = None
+        self.publish_device = None
+        # Offset (ns) from the host time to the time since the epoch, used to timestamp the published frames
+        self.wall_offset = round((self.clock.anchor_wall - self.clock.anchor_host) * 1e9)
+
+        # This object stores the device status polled during the collection
+        self.data_telemetry = Data_telemetry()
 
-        loop.run_until_complete(self.connect())
+        # Link losses and the time spent to recover from each one
+        self.reconnections = []
+
+
+    def save(self):
+        '''
+        Save all the data collected in the output files
+        '''
+
+        t = ts.perf_counter()
 
         if self.data_ecg.time != []:
             # Saving the Raw data (time, timestamp, ecg)
-            self.data_ecg.save_raw_data(self.output_filename + '-ecg', self.save_current_time)
+            self.data_ecg.save_raw_data(self.output_filename + '-ecg', self.save_current_time, self.clock)
+
+        if self.data_acc.time != []:
+            # Saving the Raw data (time, timestamp, x, y, z)
+            self.data_acc.save_raw_data(self.output_filename + '-acc', self.save_current_time, self.clock)
 
         if self.data_rr.time != []:
             # Saving the Raw data (time, hr, rr)
-            self.data_rr.save_raw_data(self.output_filename + '-rr', self.save_current_time, self.setting_values['representation_type_value'])
+            self.data_rr.save_raw_data(self.output_filename + '-rr', self.save_current_time, self.setting_values['representation_type_value'], self.clock)
+
+        if self.data_telemetry.time != []:
+            # Saving the telemetry (time, battery, rssi, mtu)
+            self.data_telemetry.save_raw_data(self.output_filename + '-telemetry')
 
         self.save_config()
 
-        # Send a signal to the main thread
-        self.finished_signal.emit()
+        self.shutdown_timing['save'] = ts.perf_counter() - t
+
+        if self.stop_requested_at is not None:
+            self.shutdown_timing['stop_to_saved'] = ts.perf_counter() - self.stop_requested_at
+
+        print('Shutdown timing: ' + ', '.join(f'{stage} {1000 * value:.1f} ms' for stage, value in self.shutdown_timing.items()))
+
+        self.save_session()
+
+        self.latency.save(self.output_filename + '-metrics-' + self.data_rr.get_time() + '.json',
+                          {name: stats.missing for name, stats in self.stream_stats.items() if stats.frames > 0})
 
 
     def stop(self):
         '''
         This function stop the data collection
+
+        It can be called from any thread, the collection coroutines are woken up immediately.
         '''
 
         # This method will be connected to the stop_signal
         self.interrupt_flag = True
+        self.stop_requested_at = ts.perf_counter()
+
+        Ble_service.instance().call_soon(self.stop_event.set)
+
+
+    async def wait_stop(self, timeout=None):
+        '''
+        Wait until the collection is stopped or the timeout (s) expires
+
+        Returns:
+            True if the collection was stopped
+        '''
+
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        return self.stop_event.is_set()
 
 
     def parse_rr(self, sender, data):
@@ -128,43 +261,44 @@ class Data_collector(QThread):
                 Byte 2..5 - UINT16 RR intervals
         '''
 
+        # The only clock read of the notification, the time of day is derived from it when needed
+        received = ts.perf_counter_ns()
+        arrival = received / 1e9
+
+        self.stream_stats['hr'].add_frame(arrival, 1, len(data))
+
         # If the 4th bit of the bytearray is 1 then RR reads were sent
         if data[0] & 0b00010000 == 0b00010000:
 
-            if self.save_current_time:
-                cur_t = datetime.datetime.now().time()
-                self.data_rr.current_time.append(cur_t)
-
             if self.data_rr.time == []:
                 # Sets t0 to current time
-                self.data_rr.t0 = ts.time()
+                self.data_rr.t0 = arrival
                 t = 0
             else:
-                t = ts.time() - self.data_rr.t0
+                t = arrival - self.data_rr.t0
 
             self.data_rr.time.append(t)
+            self.data_rr.segment.append(self.data_rr.current_segment)
 
             # data[1] is the HR read
             hr = data[1]
             self.data_rr.hr_values.append(hr)
+            self.data_rr.hr_sketch.add(hr)
 
             # data[2:4] is the RR interval
             # Convert the bytes in UINT16
             rr = int.from_bytes(data[2:4], byteorder='little', signed=False)
             self.data_rr.rr_values.append(rr)
 
+            self.latency.record('hr', 'decoded', received)
+
             # Calculate the sdNN if necessary
             if self.setting_values['representation_type'] == 1:
-                rr_window = int(self.setting_values['rr_window'])
-
-                nn_intervals = get_nn_intervals(self.data_rr.rr_values, verbose=False)
-
-                if len(nn_intervals) < rr_window:
-                    std = np.std(nn_intervals)
-                else:
-                    std = np.std(nn_intervals[-rr_window:])
+                # The same sdNN of the NN intervals as the calibration of the decision boundary
+                std = Hrv_features.live_sdnn(self.data_rr.rr_values, int(self.setting_values['rr_window']))
 
                 self.data_rr.std.append(std)
+                self.data_rr.std_sketch.add(std)
 
             # Calculate the state based on time, if necessary
             if self.setting_values['display_states']:
@@ -179,6 +313,8 @@ class Data_collector(QThread):
 
                     self.data_rr.current_state = 1 if target_state == 0 else 0
 
+            self.latency.record('hr', 'feature', received)
+
             if self.display_graph:
                 # Plot the HR values list
                 if self.setting_values['representation_type'] == 0:
@@ -186,7 +322,27 @@ class Data_collector(QThread):
                 elif self.setting_values['representation_type'] == 1:
                     self.plot_signal.emit(t if not self.save_current_time else len(self.data_rr.time)-1, std, self.data_rr.state[-1])
 
-            print(f'Time: {t} s,' + (f'   Current_time: {cur_t}' if self.save_current_time else '') + f'   Heart rate: {hr} bpm,       RR-interval: {rr} ms')
+                self.latency.emit('hr', received)
+
+            if self.publisher is not None:
+                self.publisher.publish(self.publish_device, Publisher.STREAM_HR, received + self.wall_offset, [(hr, rr)])
+                self.latency.record('hr', 'published', received)
+
+            print(f'Time: {t} s,' + (f'   Current_time: {self.clock.wall_time(arrival)}' if self.save_current_time else '') + f'   Heart rate: {hr} bpm,       RR-interval: {rr} ms')
+
+
+    def parse_pmd(self, sender, data):
+        '''
+        Send each notification of the PMD data characteristic to the parser of its measurement type
+
+        Parameters:
+            data (bytearray): PMD measurement received from the device
+        '''
+
+        if data[0] == Pmd.PMD_ECG:
+            self.parse_ecg(sender, data)
+        elif data[0] == Pmd.PMD_ACC:
+            self.parse_acc(sender, data)
 
 
     def parse_ecg(self, sender, data):
@@ -198,51 +354,80 @@ class Data_collector(QThread):
             data (bytearray): ECG measurement received from the device
         '''
 
-        if data[0] == 0x00:
-            if self.save_current_time:
-                cur_t = datetime.datetime.now().time()
-                
-            if self.data_ecg.time == []:
-                # Sets t0 to current time
-                self.data_ecg.t0 = ts.time()
-                t = 0.0
-            else:
-                t = ts.time() - self.data_ecg.t0
+        received = ts.perf_counter_ns()
+        arrival = received / 1e9
+
+        _, timestamp, samples = Pmd.decode_frame(data)
+        n = len(samples)
+
+        self.latency.record('ecg', 'decoded', received)
 
-            timestamp = self.convert_to_unsigned_long(data, 1, 8)
-            step = 3
-            samples = data[10:]
-            offset = 0
+        self.stream_stats['ecg'].add_frame(arrival, n, len(data), timestamp)
+        self.clock.add(timestamp, arrival)
 
-            while offset < len(samples):
-                ecg = self.convert_array_to_signed_int(samples, offset, step)
-                offset += step
-                self.data_ecg.time.extend([t])
-                self.data_ecg.timestamp.extend([timestamp])
-                self.data_ecg.ecg.extend([ecg])
+        self.store_frame(self.data_ecg, arrival, timestamp, n)
+        self.data_ecg.ecg.extend(samples[:, 0].tolist())
 
-                if self.save_current_time:
-                    self.data_ecg.current_time.extend([cur_t])
+        self.latency.record('ecg', 'stored', received)
 
+        if self.publisher is not None:
+            self.publisher.publish(self.publish_device, Publisher.STREAM_ECG, received + self.wall_offset, samples)
+            self.latency.record('ecg', 'published', received)
 
-    def convert_array_to_signed_int(self, data, offset, length):
+
+    def parse_acc(self, sender, data):
         '''
-        This function convert a bytearray in a signed int
+        Parse the accelerometer data receive from the device into numeric values (mG) and
+        stores it in a Data object.
+
+        Parameters:
+            data (bytearray): accelerometer measurement received from the device, raw or delta compressed
         '''
 
-        return int.from_bytes(
-            bytearray(data[offset : offset + length]), byteorder='little', signed=True,
-        )
+        received = ts.perf_counter_ns()
+        arrival = received / 1e9
+
+        _, timestamp, samples = Pmd.decode_frame(data, self.acc_settings.get(Pmd.PMD_RESOLUTION, 16))
+        n = len(samples)
+
+        self.latency.record('acc', 'decoded', received)
+
+        self.stream_stats['acc'].add_frame(arrival, n, len(data), timestamp)
+        self.clock.add(timestamp, arrival)
 
+        self.store_frame(self.data_acc, arrival, timestamp, n)
+        self.data_acc.x.extend(samples[:, 0].tolist())
+        self.data_acc.y.extend(samples[:, 1].tolist())
+        self.data_acc.z.extend(samples[:, 2].tolist())
 
-    def convert_to_unsigned_long(self, data, offset, length):
+        self.latency.record('acc', 'stored', received)
+
+        if self.publisher is not None:
+            self.publisher.publish(self.publish_device, Publisher.STREAM_ACC, received + self.wall_offset, samples)
+            self.latency.record('acc', 'published', received)
+
+
+    def store_frame(self, data, arrival, timestamp, n):
         '''
-        This function convert to a unsigned long
+        Store the arrival time, sensor timestamp and size of a PMD frame
+
+        The time of each sample is reconstructed from them when the data is saved.
+
+        Parameters:
+            data (Data): object that stores the stream;
+            arrival (float): host arrival time (s, time.perf_counter);
+            timestamp (int): sensor timestamp (ns) of the last sample of the frame;
+            n (int): number of samples of the frame.
         '''
 
-        return int.from_bytes(
-            bytearray(data[offset : offset + length]), byteorder='little', signed=False,
-        )
+        if data.time == []:
+            # Sets t0 to the estimated host time of the first sample
+            data.t0 = arrival - (n - 1) / data.sample_rate
+
+        data.time.append(arrival - data.t0)
+        data.timestamp.append(timestamp)
+        data.frame_size.append(n)
+        data.segment.append(data.current_segment)
 
 
     async def check_connection(self, client):
@@ -258,11 +443,9 @@ class Data_collector(QThread):
 
             # Retrieve device characteristics
 
-            model_number = await client.read_gatt_char(MODEL_NBR_UUID)
-            print("Model Number: {0}".format("".join(map(chr, model_number))))
-
-            manufacturer_name = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
-            print("Manufacturer Name: {0}".format("".join(map(chr, manufacturer_name))))
+            device_info = await Connection_manager.read_device_info(self.address, client)
+            print("Model Number: {0}".format(device_info['model']))
+            print("Manufacturer Name: {0}".format(device_info['manufacturer']))
 
             battery_level = await client.read_gatt_char(BATTERY_LEVEL_UUID)
             print("Battery Level: {0}%".format(int(battery_level[0])))
@@ -271,55 +454,271 @@ class Data_collector(QThread):
             print('Error: Unable to connect to the device')
 
 
+    async def telemetry(self, client):
+        '''
+        Poll the battery level and connection parameters while the data is recorded
+
+        The poll rate is low and the reads are awaited, so the notifications keep being
+        handled between them. A failed read is skipped until the next poll.
+
+        Parameters:
+            client (BleakClient): Client connected to the device
+        '''
+
+        interval = float(self.setting_values.get('telemetry_interval', TELEMETRY_INTERVAL))
+
+        while not self.stop_event.is_set():
+            try:
+                battery_level = await client.read_gatt_char(BATTERY_LEVEL_UUID)
+
+                battery = int(battery_level[0])
+                # Bleak has no public API for the RSSI of a connection, the advertised one is in the session file
+                rssi = float('nan')
+                mtu = client.mtu_size
+
+                self.data_telemetry.time.append(self.elapsed_time(self.data_rr))
+                self.data_telemetry.battery.append(battery)
+                self.data_telemetry.rssi.append(rssi)
+                self.data_telemetry.mtu.append(mtu)
+
+                self.telemetry_signal.emit(battery, rssi, mtu)
+
+            except Exception as e:
+                print(f'Error: Unable to read the device telemetry ({e})')
+
+            await self.wait_stop(interval)
+
+
+    async def start_acc(self, client):
+        '''
+        Negotiate the accelerometer settings with the device and request the stream
+
+        The settings available are read from the PMD control point, the sample rate closest
+        to the "acc_sample_rate" setting and the largest resolution and range are requested.
+
+        Parameters:
+            client (BleakClient): Client connected to the device
+        '''
+
+        responses = asyncio.Queue()
+
+        await client.start_notify(PMD_CONTROL, lambda sender, data: responses.put_nowait(bytearray(data)))
+
+        try:
+            await client.write_gatt_char(PMD_CONTROL, Pmd.settings_request(Pmd.PMD_ACC), response=True)
+            _, _, error, available = Pmd.parse_control_response(await asyncio.wait_for(responses.get(), PMD_RESPONSE_TIMEOUT))
+
+            if error:
+                print(f'Error: Unable to read the accelerometer settings (error {error})')
+                return
+
+            settings = Pmd.choose_settings(available, int(self.setting_values.get('acc_sample_rate', ACC_SAMPLE_RATE)))
+
+            await client.write_gatt_char(PMD_CONTROL, Pmd.start_request(Pmd.PMD_ACC, settings), response=True)
+            _, _, error, _ = Pmd.parse_control_response(await asyncio.wait_for(responses.get(), PMD_RESPONSE_TIMEOUT))
+
+            if error:
+                print(f'Error: Unable to start the accelerometer stream (error {error})')
+                return
+
+            self.acc_settings = settings
+            self.data_acc.sample_rate = settings.get(Pmd.PMD_SAMPLE_RATE, ACC_SAMPLE_RATE)
+            self.stream_stats['acc'].sample_rate = settings.get(Pmd.PMD_SAMPLE_RATE)
+            print(f"Accelerometer: {settings.get(Pmd.PMD_SAMPLE_RATE)} Hz, {settings.get(Pmd.PMD_RESOLUTION)} bits, {settings.get(Pmd.PMD_RANGE)} G")
+
+        finally:
+            await client.stop_notify(PMD_CONTROL)
+
+
     async def process(self, client):
         '''
         This function will record the data receive from the device
 
+        The recording lasts until the collection is stopped or the link to the device is lost.
+
         Parameters:
             client (BleakClient): Client connected to the device
         '''
 
         if client.is_connected:
 
-            if self.capture_ecg:
+            if self.capture_ecg or self.capture_acc:
                 att_read = await client.read_gatt_char(PMD_CONTROL)
 
+            if self.capture_ecg:
                 await client.write_gatt_char(PMD_CONTROL, ECG_WRITE)
 
-                # Start receiving ecg data
-                await client.start_notify(PMD_DATA, self.parse_ecg)
+            if self.capture_acc:
+                self.acc_settings = {}
+
+                if Pmd.PMD_ACC in Pmd.parse_features(att_read):
+                    await self.start_acc(client)
+                else:
+                    print('Error: The device does not support the accelerometer stream')
+
+            if self.capture_ecg or self.acc_settings:
+                # Start receiving ecg and accelerometer data
+                await client.start_notify(PMD_DATA, self.parse_pmd)
 
             # Start receiving data
             await client.start_notify(HEART_RATE, self.parse_rr)
 
-            self.start_collecting.emit()
+            # The signal is sent only once, the reconnections continue the same collection
+            if not self.is_streaming:
+                self.is_streaming = True
+                self.start_collecting.emit()
+
+            # Poll the device status in the background
+            telemetry = asyncio.create_task(self.telemetry(client))
+
+            # Wait until the collection is stopped or the link is lost
+            stop = asyncio.ensure_future(self.stop_event.wait())
+            lost = asyncio.ensure_future(self.disconnected_event.wait())
 
-            while not self.interrupt_flag:
-                await asyncio.sleep(1)
+            await asyncio.wait([stop, lost], return_when=asyncio.FIRST_COMPLETED)
+
+            stop.cancel()
+            lost.cancel()
+            telemetry.cancel()
+
+            if not client.is_connected:
+                print('Error: The connection to the device was lost')
+                return
+
+            t = ts.perf_counter()
 
             # Stop receiving data
             await client.stop_notify(HEART_RATE)
 
-            if self.capture_ecg:
+            if self.capture_ecg or self.acc_settings:
                 await client.stop_notify(PMD_DATA)
+
+            self.shutdown_timing['stop_notify'] = ts.perf_counter() - t
+            t = ts.perf_counter()
+
+            await self.drain()
+
+            self.shutdown_timing['drain'] = ts.perf_counter() - t
         else:
             print('Error: Unable to connect to the device')
 
 
+    async def drain(self):
+        '''
+        Wait until the notifications already received are parsed
+
+        The notifications sent before the stop may still be queued in the loop or in the
+        backend, so the buffers are drained when no frame arrived for DRAIN_QUIET_TIME.
+        '''
+
+        deadline = ts.perf_counter() + DRAIN_TIMEOUT
+        frames = -1
+
+        while ts.perf_counter() < deadline:
+            received = sum(stats.frames for stats in self.stream_stats.values())
+
+            if received == frames:
+                break
+
+            frames = received
+            await asyncio.sleep(DRAIN_QUIET_TIME)
+
+
+    def elapsed_time(self, data):
+        '''
+        Return the time since the first sample of a stream, using the same time base as the samples
+        '''
+
+        return ts.perf_counter() - data.t0 if data.time != [] else 0.0
+
+
+    def start_gap(self):
+        '''
+        Register the moment the link to the device was lost
+        '''
+
+        self.gap_start = {'rr': self.elapsed_time(self.data_rr), 'ecg': self.elapsed_time(self.data_ecg), 'acc': self.elapsed_time(self.data_acc)}
+        self.gap_host_start = ts.perf_counter()
+
+        # Break the line of the plot during the gap
+        if self.display_graph and self.data_rr.time != []:
+            self.plot_signal.emit(self.gap_start['rr'] if not self.save_current_time else len(self.data_rr.time)-1, float('nan'), self.data_rr.state[-1])
+            self.latency.emit('hr', ts.perf_counter_ns())
+
+
+    def end_gap(self, attempts):
+        '''
+        Register the end of a gap in every stream and the reconnection metrics
+
+        Parameters:
+            attempts (int): number of connection attempts needed to recover the link
+        '''
+
+        duration = ts.perf_counter() - self.gap_host_start
+
+        self.data_rr.add_gap(self.gap_start['rr'], self.elapsed_time(self.data_rr))
+
+        if self.capture_ecg:
+            self.data_ecg.add_gap(self.gap_start['ecg'], self.elapsed_time(self.data_ecg))
+
+        if self.acc_settings:
+            self.data_acc.add_gap(self.gap_start['acc'], self.elapsed_time(self.data_acc))
+
+        # Estimate the data lost from the mean heart rate and the ECG sample rate
+        mean_hr = np.mean(self.data_rr.hr_values) if self.data_rr.hr_values != [] else 0
+        lost_beats = int(round(duration * mean_hr / 60))
+        lost_ecg = int(round(duration * ECG_SAMPLE_RATE)) if self.capture_ecg else 0
+
+        self.reconnections.append({'start': self.gap_start['rr'],
+                                   'reconnect_time': duration,
+                                   'attempts': attempts,
+                                   'lost_beats': lost_beats,
+                                   'lost_ecg_samples': lost_ecg,
+        })
+
+        print(f'------ Reconnected after {duration:.1f} s ({attempts} attempts), ~{lost_beats} beats and ~{lost_ecg} ECG samples lost ------')
+
+
     async def connect(self):
         '''
         Connected to the device
+
+        If the status check left a connected client, it is reused instead of connecting again.
+        When the link is lost during the collection, the connection is re-established with an
+        exponential backoff and the notifications are restarted on the same collection.
         '''
 
         print('------ Connecting to the Polar H10 ------\n\n')
 
-        try:
-            async with BleakClient(self.address) as client:
+        await self.start_publishing()
 
-                # Check the connected
-                task = asyncio.create_task(self.check_connection(client))
+        self.is_streaming = False
+        attempts = 0
 
-                await asyncio.gather(task)
+        client = Connection_manager.take(self.address)
+
+        # Wake up the recording as soon as the link is lost
+        self.disconnected_event = asyncio.Event()
+        Connection_manager.on_disconnect(self.address, self.disconnected_event.set)
+
+        while not self.interrupt_flag:
+            self.disconnected_event.clear()
+
+            try:
+                if client is None:
+                    client = Connection_manager.new_client(self.address)
+                    await client.connect()
+                elif not self.is_streaming:
+                    print('------ Reusing the connection of the status check ------')
+
+                if attempts > 0:
+                    self.end_gap(attempts)
+                    attempts = 0
+                else:
+                    # Check the connected
+                    task = asyncio.create_task(self.check_connection(client))
+
+                    await asyncio.gather(task)
 
                 print('------ Start to recording data ------')
 
@@ -327,13 +726,66 @@ class Data_collector(QThread):
                 task = asyncio.create_task(self.process(client))
 
                 await asyncio.gather(task)
-                print('------ Recording stopped  ------\n\n')
 
-                await client.disconnect()
+            except Exception as e:
+                print(e)
+
+            finally:
+                t = ts.perf_counter()
 
+                if client is not None:
+                    try:
+                        await client.disconnect()
+                    except Exception as e:
+                        print(e)
+
+                client = None
+
+                # Only the teardown of the stop, not the disconnections of the link losses
+                if self.interrupt_flag:
+                    self.shutdown_timing['disconnect'] = ts.perf_counter() - t
+
+            # Without a first successful start there is nothing to resume
+            if self.interrupt_flag or not self.is_streaming:
+                break
+
+            if attempts == 0:
+                self.start_gap()
+
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempts)
+            attempts += 1
+
+            print(f'------ Reconnecting in {delay:.1f} s (attempt {attempts}) ------')
+
+            await self.wait_stop(delay)
+
+        Connection_manager.on_disconnect(self.address, None)
+
+        if self.publisher is not None:
+            self.publisher.unregister(self.publish_device)
+            self.publisher = None
+
+        print('------ Recording stopped  ------\n\n')
+
+
+    async def start_publishing(self):
+        '''
+        Register the device in the publisher of the samples, when the publication is enabled
+
+        A publisher that cannot be started (as an address already in use) does not stop the collection.
+        '''
+
+        info = {'address': self.address,
+                'output': self.output_filename,
+                'ecg_sample_rate': ECG_SAMPLE_RATE if self.capture_ecg else None,
+                'acc_sample_rate': int(self.setting_values.get('acc_sample_rate', ACC_SAMPLE_RATE)) if self.capture_acc else None,
+        }
+
+        try:
+            self.publisher, self.publish_device = await Publisher.Publisher.register(info)
         except Exception as e:
-            print(e)
-    
+            print(f'------ The samples will not be published: {e} ------')
+
 
     def save_config(self):
         '''
@@ -344,4 +796,42 @@ class Data_collector(QThread):
 
         df.to_csv(filename, sep=',', header=True)
 
-        print (f'------ Save config in \"{filename}\" ------\n\n')
\ No newline at end of file
+        print (f'------ Save config in \"{filename}\" ------\n\n')
+
+
+    def save_session(self):
+        '''
+        Save the session summary (settings and HR/sdNN distributions) in a JSON file.
+        '''
+
+        session = {
+            'settings': self.setting_values,
+            'distribution': {
+                'hr': self.data_rr.hr_sketch.to_dict(),
+                'sdNN': self.data_rr.std_sketch.to_dict(),
+            },
+            'gaps': {
+                'rr': self.data_rr.gaps,
+                'ecg': self.data_ecg.gaps,
+                'acc': self.data_acc.gaps,
+            },
+            'acc_settings': {'sample_rate': self.acc_settings.get(Pmd.PMD_SAMPLE_RATE),
+                             'resolution': self.acc_settings.get(Pmd.PMD_RESOLUTION),
+                             'range': self.acc_settings.get(Pmd.PMD_RANGE),
+            },
+            'reconnections': self.reconnections,
+            'shutdown_timing': self.shutdown_timing,
+            'clock': self.clock.to_dict(),
+            # RSSI (dBm) of the last advertisement received by the scan before the connection, null when not scanned
+            'advertised_rssi': Connection_manager.advertised_rssi.get(self.address),
+            # Host time (s, time.perf_counter) of the time 0 of each stream, it aligns them with the taps
+            'time_origin': {name: data.t0 for name, data in [('rr', self.data_rr), ('ecg', self.data_ecg), ('acc', self.data_acc)] if data.time != []},
+            'stream_stats': {name: stats.to_dict() for name, stats in self.stream_stats.items() if stats.frames > 0},
+        }
+
+        filename = self.output_filename + '-session-' + self.data_rr.get_time() + '.json'
+
+        with open(filename, 'w') as outfile:
+            json.dump(session, outfile)
+
+        print (f'------ Save session in \"{filename}\" ------\n\n')
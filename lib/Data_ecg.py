@@ -1,40 +1,56 @@
+import numpy as np
 import pandas as pd
 
+from lib.Clock_model import sample_timestamps
 from lib.Data import Data
 
 
 class Data_ecg(Data):
     '''
     Data objects will stores the data received from the device.
+
+    The time, timestamp and segment lists have one value per frame, the time of each
+    sample is only reconstructed when the data is saved.
     '''
 
-    def __init__(self):
+    def __init__(self, sample_rate=None):
         super().__init__()
 
+        self.sample_rate = sample_rate
         self.timestamp = []
+        self.frame_size = []
         self.ecg = []
-        self.current_time = []
 
 
-    def save_raw_data(self, filename=None, save_current_time=False):
+    def save_raw_data(self, filename=None, save_current_time=False, clock=None):
         '''
         Save the all triples (time, timestamp, ECG) received from the Polar H10.
+
+        Parameters:
+            clock (Clock_model): model of the sensor clock, used to place each sample in the host time.
         '''
 
         filename = filename + '-' + self.get_time() + '.csv'
 
         print (f'------ Save raw data in \"{filename}\" ------\n\n')
 
+        timestamp = sample_timestamps(self.timestamp, self.frame_size, self.sample_rate)
+        host_time = clock.to_host(timestamp)
+
         if not save_current_time:
-            df = pd.DataFrame(data={'time': self.time,
-                                    'timestamp': self.timestamp,
+            df = pd.DataFrame(data={'time': host_time - self.t0,
+                                    'timestamp': timestamp,
                                     'ecg': self.ecg
             })
         else:
-            df = pd.DataFrame(data={'time': self.time,
-                                    'current_time': self.current_time,
-                                    'timestamp': self.timestamp,
+            df = pd.DataFrame(data={'time': host_time - self.t0,
+                                    'current_time': clock.wall_time(host_time),
+                                    'timestamp': timestamp,
                                     'ecg': self.ecg
             })
 
+        # Mark the samples received after each reconnection
+        if self.gaps != []:
+            df['segment'] = np.repeat(self.segment, self.frame_size)
+
         df.to_csv(filename, sep=',', header=True)
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 
 from lib.Data import Data
+from lib.Quantile_sketch import Quantile_sketch
 
 
 class Data_rr(Data):
@@ -13,17 +15,23 @@ class Data_rr(Data):
 
         self.hr_values = []
         self.rr_values = []
-        self.current_time = []
         self.std = []
 
         self.state = [0]
         self.current_state = 0
         self.count_state = 0
 
+        # Running distribution of the HR (bpm) and sdNN (ms) values
+        self.hr_sketch = Quantile_sketch(0, 250, 1)
+        self.std_sketch = Quantile_sketch(0, 500, 2)
 
-    def save_raw_data(self, filename=None, save_current_time=False, additional_var=None):
+
+    def save_raw_data(self, filename=None, save_current_time=False, additional_var=None, clock=None):
         '''
         Save the all triples (time, hr, rr) received from the Polar H10.
+
+        Parameters:
+            clock (Clock_model): model of the host clock, used to convert the time to the time of day.
         '''
 
         filename = filename + '-' + self.get_time() + '.csv'
@@ -34,13 +42,19 @@ class Data_rr(Data):
         data_columns_names = ['time', 'heart rate', 'rr interval']
 
         if save_current_time:
-            data_columns = [self.time, self.current_time, self.hr_values, self.rr_values]
+            current_time = clock.wall_time(self.t0 + np.array(self.time))
+            data_columns = [self.time, current_time, self.hr_values, self.rr_values]
             data_columns_names = ['time', 'current_time', 'heart rate', 'rr interval']
 
         if additional_var == 'sdNN':
             data_columns.append(self.std)
             data_columns_names.append('sdNN')
 
+        # Mark the samples received after each reconnection
+        if self.gaps != []:
+            data_columns.append(self.segment)
+            data_columns_names.append('segment')
+
         df = pd.DataFrame(data=data_columns)
         df = df.T
         df.columns = data_columns_names
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from lib.Data import Data
+
+
+class Data_telemetry(Data):
+    '''
+    Data objects will stores the device status polled during the collection.
+    '''
+
+    def __init__(self):
+        super().__init__()
+
+        self.battery = []
+        self.rssi = []
+        self.mtu = []
+
+
+    def save_raw_data(self, filename=None):
+        '''
+        Save the all quadruples (time, battery, rssi, mtu) polled from the Polar H10.
+        '''
+
+        filename = filename + '-' + self.get_time() + '.csv'
+
+        print (f'------ Save telemetry in \"{filename}\" ------\n\n')
+
+        df = pd.DataFrame(data={'time': self.time,
+                                'battery': self.battery,
+                                'rssi': self.rssi,
+                                'mtu': self.mtu,
+        })
+
+        df.to_csv(filename, sep=',', header=True)
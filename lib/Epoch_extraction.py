@@ -0,0 +1,169 @@
+import glob
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Default window (s) around each tap
+EPOCH_BEFORE = 2.0
+EPOCH_AFTER = 5.0
+# Step (s) of the epochs of the RR stream, it has one value per beat
+RR_EPOCH_STEP = 0.1
+
+
+def asof_indices(times, query, tolerance=None):
+    '''
+    Return, for each query time, the index of the last sample at or before it (an as-of join)
+
+    Parameters:
+        times (numpy.ndarray): sorted time of the samples;
+        query (numpy.ndarray): query times, of any shape;
+        tolerance (float): maximum distance (s) to the sample, farther queries get -1.
+
+    Returns:
+        numpy.ndarray of int64 with the shape of query, -1 where there is no sample
+    '''
+
+    index = np.searchsorted(times, query, side='right') - 1
+
+    if tolerance is not None:
+        too_far = query - times[np.maximum(index, 0)] > tolerance
+        index[too_far] = -1
+
+    return index
+
+
+def extract_epochs(times, values, events, before=EPOCH_BEFORE, after=EPOCH_AFTER, step=None, tolerance=None):
+    '''
+    Extract a fixed window of samples around every event in one vectorized pass
+
+    Each epoch is sampled on the same grid of offsets, every point takes the last sample at
+    or before it. The points without a sample (before the first one, in gaps or farther than
+    the tolerance) are NaN.
+
+    Parameters:
+        times (array): sorted time (s) of the samples;
+        values (array): (n_samples,) or (n_samples, n_channels) values of the samples;
+        events (array): time (s) of the events, in the time base of the samples;
+        before (float): length (s) of the window before each event;
+        after (float): length (s) of the window after each event;
+        step (float): step (s) of the grid, the median sample interval by default;
+        tolerance (float): maximum distance (s) between a point of the grid and its sample.
+
+    Returns:
+        tuple (offsets, epochs), the offsets (s) of the grid and the
+        numpy.ndarray (n_events, n_offsets, n_channels) of the epochs
+    '''
+
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    events = np.asarray(events, dtype=float)
+
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+
+    if step is None:
+        step = float(np.median(np.diff(times))) if len(times) > 1 else 1.0
+
+    offsets = np.arange(-round(before / step), round(after / step) + 1) * step
+
+    # One row of grid points per event, all joined at once
+    index = asof_indices(times, events[:, np.newaxis] + offsets[np.newaxis, :], tolerance)
+
+    epochs = values[np.maximum(index, 0)]
+    epochs[index < 0] = np.nan
+
+    return offsets, epochs
+
+
+def average_epochs(epochs, baseline=None, offsets=None):
+    '''
+    Return the event-locked average and standard deviation of the epochs
+
+    Parameters:
+        epochs (numpy.ndarray): (n_events, n_offsets, n_channels) epochs;
+        baseline (tuple): interval (s) of the offsets whose mean is subtracted from each epoch;
+        offsets (numpy.ndarray): offsets (s) of the epochs, required by the baseline.
+
+    Returns:
+        tuple (mean, std), numpy.ndarray (n_offsets, n_channels) each
+    '''
+
+    if baseline is not None:
+        window = (offsets >= baseline[0]) & (offsets <= baseline[1])
+        epochs = epochs - np.nanmean(epochs[:, window], axis=1, keepdims=True)
+
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(epochs, axis=0), np.nanstd(epochs, axis=0)
+
+
+def load_session(prefix):
+    '''
+    Load the RR, ECG and tapping files of a session, with the taps in the time base of each stream
+
+    Parameters:
+        prefix (string): output filename of the collection, the files of the last session with it are used.
+
+    Returns:
+        dictionary with the "rr", "ecg" and "tapping" DataFrames (None when missing) and the
+        tap times (s) in the time base of the RR ("taps_rr") and ECG ("taps_ecg") streams
+    '''
+
+    def last(pattern):
+        files = sorted(glob.glob(glob.escape(prefix) + pattern))
+        return files[-1] if files != [] else None
+
+    session_file = last('-session-*.json')
+    if session_file is None:
+        raise FileNotFoundError(f'No session file for "{prefix}"')
+
+    with open(session_file) as infile:
+        session = json.load(infile)
+
+    files = {name: last(f'-{name}-2*.csv') for name in ['rr', 'ecg', 'tapping']}
+    session_data = {name: pd.read_csv(filename, index_col=0) if filename else None for name, filename in files.items()}
+
+    # The taps are stamped in the host time (ns) and each stream starts at its own time origin
+    origin = session.get('time_origin', {})
+    taps = session_data['tapping']['host_ns'].to_numpy() / 1e9 if session_data['tapping'] is not None else np.array([])
+
+    for name in ['rr', 'ecg']:
+        session_data['taps_' + name] = taps - origin[name] if name in origin else None
+
+    session_data['session'] = session
+
+    return session_data
+
+
+def tap_epochs(session_data, before=EPOCH_BEFORE, after=EPOCH_AFTER):
+    '''
+    Extract the HR, RR and ECG epochs around every tap of a session loaded by load_session
+
+    The HR and RR values hold until the next beat, the ECG epochs use its own sample grid.
+
+    Returns:
+        dictionary with (offsets, epochs, mean) of the "rr" epochs (channels: heart rate and
+        RR interval) and of the "ecg" epochs, when the stream was recorded
+    '''
+
+    result = {}
+
+    rr = session_data['rr']
+    if rr is not None and session_data['taps_rr'] is not None:
+        # A beat is valid until the next one, so the tolerance is the longest plausible RR interval
+        offsets, epochs = extract_epochs(rr['time'].to_numpy(dtype=float),
+                                         rr[['heart rate', 'rr interval']].to_numpy(dtype=float),
+                                         session_data['taps_rr'], before, after, RR_EPOCH_STEP, tolerance=2.0)
+        result['rr'] = (offsets, epochs, average_epochs(epochs)[0])
+
+    ecg = session_data['ecg']
+    if ecg is not None and session_data['taps_ecg'] is not None:
+        times = ecg['time'].to_numpy(dtype=float)
+        step = float(np.median(np.diff(times)))
+
+        offsets, epochs = extract_epochs(times, ecg['ecg'].to_numpy(dtype=float),
+                                         session_data['taps_ecg'], before, after, step, tolerance=2 * step)
+        result['ecg'] = (offsets, epochs, average_epochs(epochs)[0])
+
+    return result
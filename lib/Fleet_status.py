@@ -0,0 +1,89 @@
+import asyncio
+import time as ts
+
+from lib.Ble_task import Ble_task
+from lib.Check_status import Check_status
+from lib.Signals import Signal
+
+
+# Maximum duration (s) of the check of one device
+FLEET_CHECK_TIMEOUT = 20.0
+
+
+class Fleet_status(Ble_task):
+    '''
+    Class responsible for checking the status of several devices at once.
+
+    Every device is checked by a concurrent, time-bounded task, so the whole check takes
+    about as long as the slowest device.
+    '''
+
+    # Variables that connect this thread with the main thread
+    result_signal = Signal(str, str, int, str, str, float)
+    finished_signal = Signal(float)
+
+
+    def __init__(self, devices, timeout=FLEET_CHECK_TIMEOUT):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            devices (dict): name and MAC address of each device;
+            timeout (float): maximum duration (s) of the check of one device.
+        '''
+
+        super().__init__()
+        self.devices = devices
+        self.timeout = timeout
+
+
+    async def run(self):
+        '''
+        Coroutine that are started on the bluetooth service when this task are started
+
+        This function checks all devices and sends each result as soon as it is ready
+        '''
+
+        t0 = ts.perf_counter()
+
+        tasks = [asyncio.create_task(self.check(name, address)) for name, address in self.devices.items()]
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                self.result_signal.emit(*await task)
+        finally:
+            total = ts.perf_counter() - t0
+
+            print(f'------ Checked {len(tasks)} devices in {total:.1f} s ------')
+
+            # The window enables its buttons again when it receives this signal
+            self.finished_signal.emit(total)
+
+
+    async def check(self, name, address):
+        '''
+        Check the status of one device
+
+        The errors are reported as the result of the device, so they do not stop the check of the others.
+
+        Returns:
+            tuple (name, address, status, model or error message, battery, duration in seconds)
+        '''
+
+        t0 = ts.perf_counter()
+
+        checker = Check_status(address, keep_connection=False)
+
+        try:
+            status = await asyncio.wait_for(checker.connect(), self.timeout)
+        except asyncio.TimeoutError:
+            status = 1
+            checker.statusString = [f'Timeout after {self.timeout:.0f} s']
+        except Exception as e:
+            status = 1
+            checker.statusString = [f'{type(e).__name__}: {e}']
+
+        if status:
+            return name, address, status, checker.statusString[0] if checker.statusString else 'Unknown error', '', ts.perf_counter() - t0
+
+        return name, address, status, checker.model, checker.battery, ts.perf_counter() - t0
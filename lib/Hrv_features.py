@@ -0,0 +1,213 @@
+import numpy as np
+
+
+# Candidate features of the decision boundary
+FEATURES = ['HR', 'sdNN', 'RMSSD', 'pNN50']
+# Default sizes (beats) of the RR windows of the features
+WINDOWS = [5, 10, 20, 30]
+# Difference (ms) between successive NN intervals counted by pNN50
+NN50 = 50
+
+# Plausible RR intervals (ms), the others are replaced as in hrvanalysis.get_nn_intervals
+LOW_RRI = 300
+HIGH_RRI = 2000
+# Beats before a window cleaned with it, so an ectopic beat at the start of the window is detected
+NN_CONTEXT = 10
+# Elements (beats x window) of the NN intervals cleaned at once by window_features
+BATCH_ELEMENTS = 2 ** 20
+
+
+def trailing_sum(values, window):
+    '''
+    Sum of the last window values at each beat, NaN before the first complete window
+    '''
+
+    sums = np.full(len(values), np.nan)
+
+    if 0 < window <= len(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        sums[window - 1:] = cumulative[window:] - cumulative[:-window]
+
+    return sums
+
+
+def interpolate_rows(values):
+    '''
+    Replace the NaN of each row as hrvanalysis.interpolate_nan_values (linear): the leading ones by
+    the first value, the inner ones by linear interpolation and the trailing ones by the last value
+    '''
+
+    valid = ~np.isnan(values)
+
+    # Most of the rows have nothing to replace
+    missing = np.flatnonzero(~valid.all(axis=1))
+    if len(missing) == 0:
+        return values
+
+    subset, valid = values[missing], valid[missing]
+    n = values.shape[1]
+    positions = np.broadcast_to(np.arange(n), subset.shape)
+    rows = np.arange(len(subset))[:, None]
+
+    # Previous and next valid value of each position
+    previous = np.maximum.accumulate(np.where(valid, positions, -1), axis=1)
+    following = np.minimum.accumulate(np.where(valid, positions, n)[:, ::-1], axis=1)[:, ::-1]
+
+    before = subset[rows, np.maximum(previous, 0)]
+    after = subset[rows, np.minimum(following, n - 1)]
+
+    # Same operations as numpy.interp, used by pandas
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (after - before) / (following - previous)
+        inner = slope * (positions - previous) + before
+
+    result = values.copy()
+    result[missing] = np.where(valid, subset, np.where(previous < 0, after, np.where(following >= n, before, inner)))
+
+    return result
+
+
+def nn_intervals(rr):
+    '''
+    Compute the NN intervals of each row of RR intervals, as hrvanalysis.get_nn_intervals with its defaults
+
+    The RR intervals outside LOW_RRI-HIGH_RRI are interpolated, then the ectopic beats (Kamath
+    rule: more than 32.5% longer or 24.5% shorter than the previous interval, the beat after one
+    is kept) are interpolated. The rows are cleaned together, the only loop is over the beats
+    of a row.
+
+    Parameters:
+        rr (array): RR intervals (ms), one window per row.
+
+    Returns:
+        numpy.ndarray with the NN intervals, NaN in the rows without a plausible interval
+    '''
+
+    rr = np.atleast_2d(np.asarray(rr, dtype=float))
+
+    if rr.shape[1] == 0:
+        return rr.copy()
+
+    with np.errstate(invalid='ignore'):
+        values = interpolate_rows(np.where((rr >= LOW_RRI) & (rr <= HIGH_RRI), rr, np.nan))
+
+        change = values[:, 1:] - values[:, :-1]
+        within = ((change >= 0) & (change <= 0.325 * values[:, :-1])) | ((change <= 0) & (-change <= 0.245 * values[:, :-1]))
+
+        # Only the beat after an outlier depends on the previous decision
+        accepted = np.ones(values.shape, dtype=bool)
+        for i in range(values.shape[1] - 1):
+            accepted[:, i + 1] = within[:, i] | ~accepted[:, i]
+
+        return interpolate_rows(np.where(accepted, values, np.nan))
+
+
+def live_sdnn(rr, window):
+    '''
+    Return the sdNN displayed during the collection, from the RR intervals received so far
+
+    The last window + NN_CONTEXT intervals are cleaned by nn_intervals, so each beat costs the
+    same all along the collection, and window_features computes the same value for each beat
+    of a calibration file. Before window beats, the sdNN of all the beats is returned.
+
+    Parameters:
+        rr (list): RR intervals (ms) received;
+        window (int): size (beats) of the window.
+    '''
+
+    nn = nn_intervals(np.asarray(rr[-(window + NN_CONTEXT):], dtype=float))[0]
+
+    return float(np.std(nn[-window:]))
+
+
+def nn_window_features(rr, window):
+    '''
+    Compute the sdNN, RMSSD and pNN50 of the NN intervals of the trailing window of each beat
+
+    Each beat cleans its own last window + NN_CONTEXT intervals, as live_sdnn during the
+    collection (the first beats are padded with NaN, which are filled as the leading outliers).
+    The beats are cleaned in batches of BATCH_ELEMENTS.
+
+    Returns:
+        numpy.ndarray for each feature, NaN before the first complete window
+    '''
+
+    n = len(rr)
+    length = window + NN_CONTEXT
+
+    sdnn, rmssd, pnn50 = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+
+    if window > n:
+        return sdnn, rmssd, pnn50
+
+    padded = np.concatenate([np.full(length - 1, np.nan), rr])
+    rows = np.lib.stride_tricks.sliding_window_view(padded, length)
+
+    batch = max(1, BATCH_ELEMENTS // length)
+
+    for start in range(window - 1, n, batch):
+        beats = slice(start, min(start + batch, n))
+        nn = nn_intervals(rows[beats])[:, -window:]
+
+        sdnn[beats] = np.std(nn, axis=1)
+
+        # The differences of a window are the ones of its beats after the first
+        if window > 1:
+            differences = np.diff(nn, axis=1)
+            rmssd[beats] = np.sqrt(np.mean(differences ** 2, axis=1))
+            pnn50[beats] = 100 * np.mean(np.abs(differences) > NN50, axis=1)
+
+    return sdnn, rmssd, pnn50
+
+
+def window_features(rr, windows=WINDOWS, hr=None):
+    '''
+    Compute the candidate features at each beat over the trailing RR windows
+
+    The features of each window are:
+        HR: mean heart rate (bpm) of the window, from running sums, the window of 1 beat is the heart rate displayed;
+        sdNN: standard deviation of the NN intervals (ms) of the window, the value displayed by the collector (live_sdnn);
+        RMSSD: root mean square of the successive differences (ms) of the NN intervals inside the window;
+        pNN50: percentage of the successive differences of the NN intervals inside the window above NN50 ms.
+
+    The beats before the first complete window of a feature are NaN.
+
+    Parameters:
+        rr (array): RR intervals (ms) of each beat;
+        windows (list): sizes (beats) of the windows;
+        hr (array): heart rate of each beat, 60000 / RR when not given.
+
+    Returns:
+        list with the name of each feature ("sdNN 10"), numpy.ndarray beats x features
+    '''
+
+    rr = np.asarray(rr, dtype=float)
+    hr = 60000 / rr if hr is None else np.asarray(hr, dtype=float)
+
+    names = ['HR 1']
+    columns = [hr]
+
+    for window in sorted(set(windows)):
+        sdnn, rmssd, pnn50 = nn_window_features(rr, window)
+
+        names += [f'HR {window}', f'sdNN {window}']
+        columns += [trailing_sum(hr, window) / window, sdnn]
+
+        if window > 1:
+            names += [f'RMSSD {window}', f'pNN50 {window}']
+            columns += [rmssd, pnn50]
+
+    # Drop a repeated window of 1 beat
+    unique = {name: column for name, column in zip(names, columns)}
+
+    return list(unique), np.column_stack(list(unique.values())) if len(rr) > 0 else np.empty((0, len(unique)))
+
+
+def feature_family(name):
+    '''
+    Return the feature of a name and its window: "sdNN 10" -> ("sdNN", 10)
+    '''
+
+    feature, _, window = name.rpartition(' ')
+
+    return (feature, int(window)) if window.isdigit() else (name, None)
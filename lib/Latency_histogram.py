@@ -0,0 +1,149 @@
+import math
+
+import numpy as np
+
+
+# Bits of the sub-buckets in each power of two, the relative error of a value is below 2 ** -(SUB_BUCKET_BITS - 1)
+SUB_BUCKET_BITS = 8
+# Largest latency (ns) recorded in the buckets, larger values are counted as overflow
+MAX_LATENCY = 60 * 10 ** 9
+
+
+class Latency_histogram:
+    '''
+    Log-linear histogram of latencies in the style of HDR histograms.
+
+    Values below 2 ** SUB_BUCKET_BITS ns have their own bucket, larger ones are grouped in
+    buckets whose width doubles with each power of two. The precision is relative to the value
+    (under 1%), from microseconds to a minute, with a few thousand counters. Adding a value
+    is a couple of integer operations.
+    '''
+
+    def __init__(self, max_latency=MAX_LATENCY):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            max_latency (int): largest latency (ns) kept in the buckets.
+        '''
+
+        self.half = 1 << (SUB_BUCKET_BITS - 1)
+        self.max_latency = max_latency
+        self.n_buckets = self.index(max_latency) + 1
+
+        self.counts = np.zeros(self.n_buckets, dtype=np.int64)
+        self.overflow = 0
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def index(self, value):
+        '''
+        Return the bucket of a latency (ns)
+        '''
+
+        shift = value.bit_length() - SUB_BUCKET_BITS
+
+        if shift <= 0:
+            return value
+
+        return shift * self.half + (value >> shift)
+
+
+    def bucket_range(self, index):
+        '''
+        Return the lower edge and the width (ns) of a bucket
+        '''
+
+        if index < 2 * self.half:
+            return index, 1
+
+        shift = index // self.half - 1
+
+        return (index - shift * self.half) << shift, 1 << shift
+
+
+    def add(self, value):
+        '''
+        Add a latency (ns) to the histogram, negative values are counted as 0
+        '''
+
+        value = max(0, int(value))
+
+        if value > self.max_latency:
+            self.overflow += 1
+        else:
+            self.counts[self.index(value)] += 1
+
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+    def merge(self, other):
+        '''
+        Add the counters of another histogram with the same range to this one.
+        '''
+
+        if self.max_latency != other.max_latency:
+            raise ValueError('Only histograms with the same range can be merged')
+
+        self.counts += other.counts
+        self.overflow += other.overflow
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    def quantile(self, q):
+        '''
+        Estimate the q-th quantile (0 <= q <= 1) in ns, the middle of its bucket.
+
+        Returns NaN when the histogram is empty.
+        '''
+
+        if self.count == 0:
+            return math.nan
+
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, max(1, math.ceil(q * self.count))))
+
+        if index >= self.n_buckets:
+            return self.max
+
+        lower, width = self.bucket_range(index)
+
+        return min(max(lower + (width - 1) / 2, self.min), self.max)
+
+
+    def mean(self):
+        '''
+        Return the mean latency (ns), NaN when the histogram is empty
+        '''
+
+        return self.total / self.count if self.count else math.nan
+
+
+    def to_dict(self):
+        '''
+        Return the histogram as a JSON serializable dictionary, with its non-empty buckets only
+        '''
+
+        buckets = np.flatnonzero(self.counts)
+
+        return {'unit': 'ns',
+                'count': self.count,
+                'overflow': self.overflow,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None,
+                'mean': self.mean() if self.count else None,
+                'p50': self.quantile(0.5) if self.count else None,
+                'p90': self.quantile(0.9) if self.count else None,
+                'p99': self.quantile(0.99) if self.count else None,
+                'p999': self.quantile(0.999) if self.count else None,
+                'buckets': {int(self.bucket_range(i)[0]): int(self.counts[i]) for i in buckets},
+        }
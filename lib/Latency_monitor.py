@@ -0,0 +1,170 @@
+import collections
+import json
+import time as ts
+
+from lib.Latency_histogram import Latency_histogram
+
+
+# Stage of each stream shown in the interface, the last one of its path
+DISPLAY_STAGE = {'hr': ['rendered', 'published', 'emitted', 'feature', 'decoded'], 'ecg': ['published', 'stored'], 'acc': ['published', 'stored']}
+
+
+class Latency_monitor:
+    '''
+    Latency of each stage of the collection path, from the arrival of a notification.
+
+    Each notification is stamped when it is received (time.perf_counter_ns) and every later
+    stage (decoded, feature computed, signal emitted, published to the subscribers, rendered on
+    the screen) records its delay since then in a histogram of its stream. A second set of
+    histograms is renewed at each read of the interface, so it shows the current latency
+    instead of the whole session.
+
+    The stages are recorded by the bluetooth loop, except the rendering, recorded by the
+    main thread when the plot is drawn. The points emitted to the plot wait in a queue
+    until they are drawn, its depth is the backlog of the interface.
+    '''
+
+    def __init__(self):
+        '''
+        Initialize the class variables
+        '''
+
+        # Histograms of the session and of the current interval, by (stream, stage)
+        self.histograms = {}
+        self.recent = {}
+
+        # Reception time (ns) of the points emitted to the plot and not drawn yet
+        self.pending = collections.deque()
+        self.emitted = 0
+        self.rendered = 0
+        self.max_queue_depth = 0
+
+
+    def record(self, stream, stage, received):
+        '''
+        Record the delay of a stage since the notification was received
+
+        Parameters:
+            stream (string): name of the stream ('hr', 'ecg' or 'acc');
+            stage (string): name of the stage;
+            received (int): reception time of the notification (ns, time.perf_counter_ns).
+        '''
+
+        latency = ts.perf_counter_ns() - received
+        key = (stream, stage)
+
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Latency_histogram()
+
+        # The interval histograms are renewed by the main thread
+        recent = self.recent.get(key)
+        if recent is None:
+            recent = self.recent[key] = Latency_histogram()
+
+        histogram.add(latency)
+        recent.add(latency)
+
+
+    def emit(self, stream, received):
+        '''
+        Record a point emitted to the plot, it waits in the queue until it is rendered
+        '''
+
+        self.record(stream, 'emitted', received)
+
+        self.pending.append(received)
+        self.emitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth())
+
+
+    def render(self, stream, points):
+        '''
+        Record the rendering of the plot, called by the main thread after it is drawn
+
+        Parameters:
+            stream (string): name of the plotted stream;
+            points (int): number of points emitted that were delivered to the plot when it was updated.
+        '''
+
+        while self.rendered < points and self.pending:
+            self.record(stream, 'rendered', self.pending.popleft())
+            self.rendered += 1
+
+
+    def queue_depth(self):
+        '''
+        Return the number of points emitted and not rendered yet
+        '''
+
+        return self.emitted - self.rendered
+
+
+    def current(self):
+        '''
+        Return the histograms of the interval since the last call, and start a new interval
+        '''
+
+        recent = self.recent
+        self.recent = {key: Latency_histogram() for key in list(recent)}
+
+        return recent
+
+
+    def summary(self):
+        '''
+        Return the current p50/p99 latency of each stream and the plot queue for the interface
+        '''
+
+        recent = self.current()
+
+        text = []
+        for stream, stages in DISPLAY_STAGE.items():
+            for stage in stages:
+                histogram = recent.get((stream, stage))
+
+                if histogram is not None and histogram.count > 0:
+                    text.append(f'{stream.upper()} {stage} p50 {histogram.quantile(0.5) / 1e6:.1f} ms, '
+                                f'p99 {histogram.quantile(0.99) / 1e6:.1f} ms')
+                    break
+
+        if self.emitted > 0:
+            text.append(f'plot queue {self.queue_depth()} (max {self.max_queue_depth})')
+
+        return text
+
+
+    def to_dict(self):
+        '''
+        Return the latency histograms and the plot queue as a JSON serializable dictionary
+        '''
+
+        stages = {}
+        for (stream, stage), histogram in self.histograms.items():
+            stages.setdefault(stream, {})[stage] = histogram.to_dict()
+
+        return {'stages': stages,
+                'plot_queue': {'emitted': self.emitted,
+                               'rendered': self.rendered,
+                               'depth': self.queue_depth(),
+                               'max_depth': self.max_queue_depth,
+                },
+        }
+
+
+    def save(self, filename, drops=None):
+        '''
+        Save the latency metrics in a JSON file
+
+        Parameters:
+            filename (string): name of the output file;
+            drops (dict): samples lost by each stream, saved with the metrics.
+        '''
+
+        metrics = self.to_dict()
+        metrics['drops'] = drops or {}
+
+        with open(filename, 'w') as outfile:
+            json.dump(metrics, outfile)
+
+        print (f'------ Save latency metrics in \"{filename}\" ------\n\n')
@@ -0,0 +1,210 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QPushButton, QLabel, QMessageBox, QDesktopWidget, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView
+
+from lib.Multi_collector import Multi_collector
+
+
+TABLE_COLUMNS = ['Device', 'Status', 'HR (bpm)', 'RR (ms)', 'Beats', 'ECG samples', 'Gaps', 'Missing samples', 'Jitter (ms)']
+
+
+class Multi_collect_window(QMainWindow):
+    '''
+    Class responsible for building the interface of a collection with several devices.
+    '''
+
+    def __init__(self, app_window, devices, capture_ecg, save_current_time, output_filename, setting_values, capture_acc=False):
+        '''
+        Initialize the multi-device data collection UI
+
+        Paramesters:
+            app_window (MainWindow): reference to the main interface;
+            devices (dict): name and MAC address of each device;
+            capture_ecg (boolean): flag that decides whether ECG will be captured with the RR;
+            save_current_time (boolean): flag that decides if the current PC time will be saved;
+            output_filename (string): prefix of the output files;
+            setting_values (dict): aditional settings for the experiment;
+            capture_acc (boolean): flag that decides whether the accelerometer will be captured with the RR.
+        '''
+
+        super(Multi_collect_window, self).__init__()
+
+        self.app_window = app_window
+        self.devices = devices
+        self.capture_ecg = capture_ecg
+        self.capture_acc = capture_acc
+        self.save_current_time = save_current_time
+        self.output_filename = output_filename
+        self.setting_values = setting_values
+
+        self.central_widget = QWidget(self)
+        self.setCentralWidget(self.central_widget)
+
+        self.central_layout = QVBoxLayout(self.central_widget)
+
+        collecting_label = QLabel(f'Collecting from {len(devices)} devices: HR, RR' + (', ECG' if self.capture_ecg else '') + (', accelerometer' if self.capture_acc else ''), self)
+        self.central_layout.addWidget(collecting_label)
+
+        # One row per device
+        self.table = QTableWidget(len(devices), len(TABLE_COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(TABLE_COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+
+        self.rows = {}
+        for row, name in enumerate(devices):
+            self.rows[name] = row
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            self.table.setItem(row, 1, QTableWidgetItem('Connecting'))
+
+        self.central_layout.addWidget(self.table)
+
+        # Throughput and latency of the shared event loop
+        self.metrics_label = QLabel('Throughput: -   Loop lag p50/p99: -', self)
+        self.central_layout.addWidget(self.metrics_label)
+
+        # Stop button
+        self.stop_button = QPushButton('Stop', self)
+        self.stop_button.clicked.connect(self.stop_collecting)
+        self.stop_button.setFixedSize(200, 70)
+        self.stop_button.setEnabled(False)
+
+        h_stop_button_layout = QHBoxLayout()
+        h_stop_button_layout.addStretch(1)
+        h_stop_button_layout.addWidget(self.stop_button)
+        h_stop_button_layout.addStretch(1)
+        self.central_layout.addLayout(h_stop_button_layout)
+
+        self.is_processing = True
+
+        # Refresh the table once a second
+        self.table_timer = QTimer(self)
+        self.table_timer.timeout.connect(self.update_table)
+
+        self.resize(800, 150 + 30 * len(devices))
+
+        # Center the window on the screen
+        self.center_window()
+
+        # Set window properties
+        self.setWindowTitle('Collector')
+
+        self.start()
+
+
+    def closeEvent(self, event):
+        '''
+        This function change the closeEvent of this UI. The new event will return to the main UI
+        '''
+
+        if self.is_processing:
+            QMessageBox.warning(self, "Error", "You need to stop the processing first.")
+            event.ignore()
+            return
+
+        self.close()
+        self.app_window.show()
+
+
+    def center_window(self):
+        '''
+        This function moves the window to the center
+        '''
+
+        frame_geometry = self.frameGeometry()
+        center_point = QDesktopWidget().availableGeometry().center()
+        frame_geometry.moveCenter(center_point)
+        self.move(frame_geometry.topLeft())
+
+
+    def start(self):
+        '''
+        This functions starts a WorkerThread to run the data collection of all devices
+        '''
+
+        self.worker_thread = Multi_collector(self.devices,
+                                             self.capture_ecg,
+                                             self.save_current_time,
+                                             self.output_filename,
+                                             self.setting_values,
+                                             self.capture_acc,
+        )
+
+        self.worker_thread.finished_signal.connect(self.collection_finished)
+        self.worker_thread.metrics_signal.connect(self.update_metrics)
+
+        for collector in self.worker_thread.collectors.values():
+            collector.start_collecting.connect(self.device_started)
+
+        # Start the worker thread
+        self.worker_thread.start()
+        self.table_timer.start(1000)
+
+
+    def stop_collecting(self):
+        '''
+        This function send a signal to the WorkerThread to stop the data collecting
+        '''
+
+        self.worker_thread.stop()
+        self.stop_button.setEnabled(False)
+
+
+    def device_started(self):
+        '''
+        This function are called when a device starts to send data
+        '''
+
+        name = next(name for name, collector in self.worker_thread.collectors.items() if collector is self.sender())
+
+        self.table.item(self.rows[name], 1).setText('Collecting')
+        self.stop_button.setEnabled(True)
+
+
+    def update_table(self):
+        '''
+        This function shows the last values received from each device
+        '''
+
+        for name, collector in self.worker_thread.collectors.items():
+            data_rr = getattr(collector, 'data_rr', None)
+
+            if data_rr is None or data_rr.time == []:
+                continue
+
+            row = self.rows[name]
+            stream_stats = collector.stream_stats.values()
+
+            # The jitter of the fastest stream shows the radio congestion first
+            fastest = max(stream_stats, key=lambda stats: stats.frames)
+
+            values = [data_rr.hr_values[-1], data_rr.rr_values[-1], len(data_rr.time), len(collector.data_ecg.ecg),
+                      sum(stats.gaps for stats in stream_stats),
+                      sum(stats.missing for stats in stream_stats),
+                      f'{1000 * fastest.jitter():.1f}',
+            ]
+
+            for column, value in enumerate(values, start=2):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+
+
+    def update_metrics(self, rate, lag_p50, lag_p99):
+        '''
+        This function shows the throughput and event loop latency of the collection
+        '''
+
+        self.metrics_label.setText(f'Throughput: {rate:.1f} samples/s   Loop lag p50/p99: {lag_p50:.2f}/{lag_p99:.2f} ms')
+
+
+    def collection_finished(self):
+        '''
+        This function are called when the WorkerThread are finished
+        '''
+
+        self.is_processing = False
+        self.table_timer.stop()
+        self.update_table()
+
+        for row in self.rows.values():
+            self.table.item(row, 1).setText('Finished')
+
+        QMessageBox.about(self, "Process complete", "The processing is complete. All data are saved in .csv files.")
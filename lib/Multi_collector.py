@@ -0,0 +1,189 @@
+import asyncio
+import time as ts
+
+import numpy as np
+import pandas as pd
+
+from lib.Ble_task import Ble_task
+from lib.Data import Data
+from lib.Data_collector import Data_collector
+from lib.Profiler import Profiler
+from lib.Signals import Signal
+
+
+# Interval (s) between two throughput/latency measurements
+METRICS_INTERVAL = 1.0
+# Interval (s) used to probe the event loop scheduling latency
+LAG_PROBE_INTERVAL = 0.1
+
+
+class Multi_collector(Ble_task):
+    '''
+    Class responsible for performing the data collection of several devices at once.
+
+    All the devices share the bluetooth service event loop, each connection runs as a
+    concurrent task and keeps its own buffers and output files.
+    '''
+
+    # Variables that connect this thread with the main thread
+    metrics_signal = Signal(float, float, float)
+    finished_signal = Signal()
+
+
+    def __init__(self, devices, capture_ecg, save_current_time, output_filename, setting_values, capture_acc=False):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            devices (dict): name and MAC address of each device;
+            capture_ecg (boolean): flag that decides whether ECG will be captured with the RR;
+            save_current_time (boolean): flag that decides if the current PC time will be saved;
+            output_filename (string): prefix of the ouput files, the device name is appended to it;
+            setting_values (dict): aditional settings for the experiment;
+            capture_acc (boolean): flag that decides whether the accelerometer will be captured with the RR.
+        '''
+
+        super().__init__()
+        self.output_filename = output_filename
+        self.setting_values = setting_values
+
+        # One collector per device. They are not started as tasks, only their coroutines are used
+        self.collectors = {}
+        for name, address in devices.items():
+            self.collectors[name] = Data_collector(address,
+                                                   False,
+                                                   capture_ecg,
+                                                   save_current_time,
+                                                   output_filename + '-' + name.replace(' ', '_'),
+                                                   setting_values,
+                                                   capture_acc,
+            )
+
+
+    async def run(self):
+        '''
+        Coroutine that are started on the bluetooth service when this task are started
+
+        This function perform the data collection of all devices
+        '''
+
+        for collector in self.collectors.values():
+            collector.init_data()
+
+        self.metrics = {'time': [], 'devices': [], 'samples_per_second': [], 'loop_lag_p50': [], 'loop_lag_p99': [], 'loop_lag_max': []}
+
+        # Profile the session when it is enabled by the environment or the settings
+        profiler = Profiler.start_session(self.output_filename, self.setting_values)
+
+        await self.connect()
+
+        # Write the files outside the event loop, so other tasks keep running
+        loop = asyncio.get_running_loop()
+        for collector in self.collectors.values():
+            if profiler is None:
+                await loop.run_in_executor(None, collector.save)
+            else:
+                await loop.run_in_executor(None, profiler.call, collector.save, 'Save')
+
+        await loop.run_in_executor(None, self.save_metrics)
+
+        if profiler is not None:
+            profiler.disable_thread()
+            await loop.run_in_executor(None, profiler.stop)
+
+        # Send a signal to the main thread
+        self.finished_signal.emit()
+
+
+    def stop(self):
+        '''
+        This function stop the data collection of all devices
+
+        This method will be connected to the stop_signal of the window
+        '''
+
+        for collector in self.collectors.values():
+            collector.stop()
+
+
+    def count_samples(self):
+        '''
+        Return the number of samples (RR, ECG and accelerometer) received by all devices
+        '''
+
+        return sum(len(c.data_rr.time) + len(c.data_ecg.ecg) + len(c.data_acc.x) for c in self.collectors.values())
+
+
+    async def monitor(self):
+        '''
+        Measure the throughput and the scheduling latency of the event loop while the
+        devices are collecting.
+
+        The latency is the delay between the moment a sleeping task should wake up and the
+        moment it actually runs, so it grows when the notification callbacks saturate the loop.
+        '''
+
+        t0 = ts.perf_counter()
+        last_t, last_samples = t0, 0
+        lags = []
+
+        while not all(c.interrupt_flag for c in self.collectors.values()):
+            before = ts.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            now = ts.perf_counter()
+            lags.append(now - before - LAG_PROBE_INTERVAL)
+
+            if now - last_t < METRICS_INTERVAL:
+                continue
+
+            samples = self.count_samples()
+            rate = (samples - last_samples) / (now - last_t)
+            lags_ms = np.array(lags) * 1000
+
+            self.metrics['time'].append(now - t0)
+            self.metrics['devices'].append(sum(len(c.data_rr.time) > 0 for c in self.collectors.values()))
+            self.metrics['samples_per_second'].append(rate)
+            self.metrics['loop_lag_p50'].append(np.percentile(lags_ms, 50))
+            self.metrics['loop_lag_p99'].append(np.percentile(lags_ms, 99))
+            self.metrics['loop_lag_max'].append(lags_ms.max())
+
+            self.metrics_signal.emit(rate, self.metrics['loop_lag_p50'][-1], self.metrics['loop_lag_p99'][-1])
+
+            last_t, last_samples = now, samples
+            lags = []
+
+
+    async def connect(self):
+        '''
+        Connect to all devices concurrently and record their data until stopped
+        '''
+
+        print(f'------ Connecting to {len(self.collectors)} devices ------\n\n')
+
+        tasks = [asyncio.create_task(c.connect()) for c in self.collectors.values()]
+        monitor = asyncio.create_task(self.monitor())
+
+        await asyncio.gather(*tasks)
+
+        # Devices that failed to connect never stop by themselves
+        self.stop()
+        await monitor
+
+
+    def save_metrics(self):
+        '''
+        Save the throughput and event loop latency measured during the collection.
+        '''
+
+        filename = self.output_filename + '-multi-metrics-' + Data().get_time() + '.csv'
+
+        print (f'------ Save metrics in \"{filename}\" ------\n\n')
+
+        df = pd.DataFrame(data=self.metrics)
+
+        df.to_csv(filename, sep=',', header=True)
+
+        if len(df) > 0:
+            print(f'Devices: {df["devices"].max()}   '
+                  f'Mean throughput: {df["samples_per_second"].mean():.1f} samples/s   '
+                  f'Loop lag p50/p99/max: {df["loop_lag_p50"].median():.2f}/{df["loop_lag_p99"].max():.2f}/{df["loop_lag_max"].max():.2f} ms')
@@ -0,0 +1,267 @@
+import numpy as np
+
+
+# Measurement types of the Polar Measurement Data (PMD) service
+PMD_ECG = 0x00
+PMD_ACC = 0x02
+
+# Operation codes of the PMD control point
+PMD_GET_SETTINGS = 0x01
+PMD_START_MEASUREMENT = 0x02
+PMD_CONTROL_RESPONSE = 0xF0
+
+# Setting types and the size (bytes) of their values
+PMD_SAMPLE_RATE = 0x00
+PMD_RESOLUTION = 0x01
+PMD_RANGE = 0x02
+PMD_SETTING_SIZE = {0x00: 2, 0x01: 2, 0x02: 2, 0x03: 4, 0x04: 1}
+
+# Bit of the frame type that marks delta compressed frames
+PMD_DELTA_FRAME = 0x80
+
+# Number of channels of each measurement type
+PMD_CHANNELS = {PMD_ECG: 1, PMD_ACC: 3}
+
+# Size (bytes) of one value in the raw (uncompressed) frames, by frame type
+ECG_RAW_SIZE = {0x00: 3}
+ACC_RAW_SIZE = {0x00: 1, 0x01: 2, 0x02: 3}
+
+
+def parse_features(data):
+    '''
+    Return the measurement types supported by the device, from the read of the PMD control point
+
+    Parameters:
+        data (bytearray): value read from the PMD control point, 0x0F followed by a bitmask
+    '''
+
+    if len(data) < 2 or data[0] != 0x0F:
+        return set()
+
+    mask = int.from_bytes(data[1:], byteorder='little')
+
+    return {bit for bit in range(8 * (len(data) - 1)) if mask & (1 << bit)}
+
+
+def settings_request(measurement):
+    '''
+    Return the request of the settings available for a measurement type
+    '''
+
+    return bytearray([PMD_GET_SETTINGS, measurement])
+
+
+def start_request(measurement, settings):
+    '''
+    Return the request that starts a measurement stream
+
+    Parameters:
+        measurement (int): measurement type;
+        settings (dict): setting type -> value.
+    '''
+
+    request = bytearray([PMD_START_MEASUREMENT, measurement])
+
+    for setting, value in settings.items():
+        request += bytearray([setting, 0x01]) + value.to_bytes(PMD_SETTING_SIZE[setting], byteorder='little')
+
+    return request
+
+
+def parse_control_response(data):
+    '''
+    Parse a response of the PMD control point
+
+    Returns:
+        tuple (op code, measurement type, error code, settings), where settings maps each
+        setting type to the list of values available
+    '''
+
+    if len(data) < 4 or data[0] != PMD_CONTROL_RESPONSE:
+        raise ValueError('Not a PMD control point response')
+
+    op_code, measurement, error = data[1], data[2], data[3]
+
+    settings = {}
+    offset = 5
+
+    while op_code == PMD_GET_SETTINGS and offset + 1 < len(data):
+        setting, count = data[offset], data[offset + 1]
+        size = PMD_SETTING_SIZE[setting]
+        offset += 2
+
+        settings[setting] = [int.from_bytes(data[offset + i * size : offset + (i + 1) * size], byteorder='little') for i in range(count)]
+        offset += count * size
+
+    return op_code, measurement, error, settings
+
+
+def choose_settings(available, sample_rate):
+    '''
+    Choose the settings of a measurement from the ones available on the device
+
+    The sample rate closest to the requested one and the largest resolution and range are used.
+    '''
+
+    settings = {}
+
+    for setting, values in available.items():
+        if setting == PMD_SAMPLE_RATE:
+            settings[setting] = min(values, key=lambda value: abs(value - sample_rate))
+        elif setting in (PMD_RESOLUTION, PMD_RANGE):
+            settings[setting] = max(values)
+
+    return settings
+
+
+def decode_raw(payload, channels, size):
+    '''
+    Decode the samples of an uncompressed frame
+
+    Returns:
+        numpy.ndarray (n_samples, channels) of int32
+    '''
+
+    n = len(payload) // (size * channels)
+    raw = np.frombuffer(bytes(payload[: n * size * channels]), dtype=np.uint8).reshape(-1, size)
+
+    # Little endian bytes of signed values, sign-extended to 32 bits
+    values = np.zeros(len(raw), dtype=np.int64)
+    for i in range(size):
+        values |= raw[:, i].astype(np.int64) << (8 * i)
+
+    values = np.where(values >= 1 << (8 * size - 1), values - (1 << (8 * size)), values)
+
+    return values.astype(np.int32).reshape(n, channels)
+
+
+def decode_delta(payload, channels, resolution):
+    '''
+    Decode the samples of a delta compressed frame
+
+    The frame starts with a reference sample, followed by blocks of deltas. Each block has
+    the bit width of the deltas, the number of samples and the deltas packed LSB first.
+
+    Returns:
+        numpy.ndarray (n_samples, channels) of int32
+    '''
+
+    size = (resolution + 7) // 8
+    reference = decode_raw(payload[: size * channels], channels, size)
+
+    blocks = []
+    offset = size * channels
+
+    while offset + 2 <= len(payload):
+        width, count = payload[offset], payload[offset + 1]
+        offset += 2
+
+        n_bits = width * count * channels
+        n_bytes = (n_bits + 7) // 8
+
+        if width == 0 or count == 0:
+            continue
+
+        bits = np.unpackbits(np.frombuffer(bytes(payload[offset : offset + n_bytes]), dtype=np.uint8), bitorder='little')[:n_bits]
+        offset += n_bytes
+
+        # Each delta is a two's complement integer of "width" bits
+        deltas = bits.reshape(-1, width).astype(np.int64) @ (1 << np.arange(width, dtype=np.int64))
+        deltas = np.where(deltas >= 1 << (width - 1), deltas - (1 << width), deltas)
+
+        blocks.append(deltas.reshape(count, channels))
+
+    if blocks == []:
+        return reference
+
+    samples = np.cumsum(np.vstack([reference] + blocks), axis=0)
+
+    return samples.astype(np.int32)
+
+
+def decode_frame(data, resolution=16):
+    '''
+    Decode a notification of the PMD data characteristic
+
+    Parameters:
+        data (bytearray): measurement type, sensor timestamp (ns, 8 bytes), frame type and samples;
+        resolution (int): resolution (bits) of the samples, used by the delta compressed frames.
+
+    Returns:
+        tuple (measurement type, sensor timestamp, numpy.ndarray (n_samples, channels))
+    '''
+
+    measurement = data[0]
+    timestamp = int.from_bytes(data[1:9], byteorder='little', signed=False)
+    frame_type = data[9]
+    payload = data[10:]
+    channels = PMD_CHANNELS[measurement]
+
+    if frame_type & PMD_DELTA_FRAME:
+        samples = decode_delta(payload, channels, resolution)
+    elif measurement == PMD_ECG:
+        samples = decode_raw(payload, channels, ECG_RAW_SIZE[frame_type])
+    else:
+        samples = decode_raw(payload, channels, ACC_RAW_SIZE[frame_type])
+
+    return measurement, timestamp, samples
+
+
+def encode_delta_frame(measurement, timestamp, samples, resolution=16):
+    '''
+    Encode samples as a delta compressed notification of the PMD data characteristic
+
+    This is the inverse of decode_frame, it is used to build synthetic frames.
+
+    Parameters:
+        measurement (int): measurement type;
+        timestamp (int): sensor timestamp (ns);
+        samples (numpy.ndarray): (n_samples, channels) integer samples;
+        resolution (int): resolution (bits) of the reference sample.
+    '''
+
+    samples = np.asarray(samples, dtype=np.int64)
+    size = (resolution + 7) // 8
+
+    frame = bytearray([measurement]) + timestamp.to_bytes(8, byteorder='little')
+    frame.append(PMD_DELTA_FRAME | (size - 1))
+
+    for value in samples[0]:
+        frame += int(value).to_bytes(size, byteorder='little', signed=True)
+
+    deltas = np.diff(samples, axis=0)
+
+    if len(deltas) > 0:
+        largest = int(np.abs(deltas).max())
+        width = max(2, largest.bit_length() + 1)
+
+        # Two's complement bits, LSB first
+        unsigned = np.where(deltas < 0, deltas + (1 << width), deltas).reshape(-1, 1)
+        bits = ((unsigned >> np.arange(width)) & 1).astype(np.uint8).reshape(-1)
+
+        frame += bytearray([width, len(deltas)])
+        frame += np.packbits(bits, bitorder='little').tobytes()
+
+    return frame
+
+
+def encode_raw_frame(measurement, timestamp, samples, size):
+    '''
+    Encode samples as an uncompressed notification of the PMD data characteristic
+
+    Parameters:
+        measurement (int): measurement type;
+        timestamp (int): sensor timestamp (ns);
+        samples (numpy.ndarray): (n_samples, channels) integer samples;
+        size (int): size (bytes) of each value.
+    '''
+
+    frame_type = 0x00 if measurement == PMD_ECG else size - 1
+
+    frame = bytearray([measurement]) + timestamp.to_bytes(8, byteorder='little') + bytearray([frame_type])
+
+    for value in np.asarray(samples).reshape(-1):
+        frame += int(value).to_bytes(size, byteorder='little', signed=True)
+
+    return frame
+
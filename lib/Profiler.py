@@ -0,0 +1,444 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time as ts
+import tracemalloc
+
+from lib.Data import Data
+
+
+# Environment variable that enables the profiling of the sessions: words separated by commas,
+# "sample" (stack sampling), "cprofile" (deterministic profiling) and "memory" (tracemalloc snapshots)
+PROFILE_ENV = 'HRC_PROFILE'
+# Environment variable with the interval (s) between two stack samples
+PROFILE_INTERVAL_ENV = 'HRC_PROFILE_INTERVAL'
+# Environment variable with the interval (s) between two tracemalloc snapshots
+SNAPSHOT_INTERVAL_ENV = 'HRC_PROFILE_SNAPSHOT'
+# Environment variable with the time (s) tracemalloc traces before each snapshot
+MEMORY_WINDOW_ENV = 'HRC_PROFILE_MEMORY_WINDOW'
+
+# Profiling used when it is enabled from the interface
+DEFAULT_MODES = {'sample', 'memory'}
+# Default interval (s) between two stack samples
+SAMPLE_INTERVAL = 0.01
+# Default interval (s) between two tracemalloc snapshots
+SNAPSHOT_INTERVAL = 60
+# Default time (s) traced before each snapshot, tracemalloc slows the allocations down only in this window
+MEMORY_WINDOW = 5
+# Interval (s) of the sampler thread when the stacks are not sampled
+MEMORY_TICK = 0.5
+# Frames kept by tracemalloc for each allocation, more frames cost more memory and time
+TRACEMALLOC_FRAMES = 1
+# Lines of each table of the reports
+REPORT_TOP = 25
+# From Python 3.12 cProfile runs on sys.monitoring, shared by all the threads: only one Profile
+# can be enabled in the process and it counts the calls of every thread
+SHARED_PROFILE = sys.version_info >= (3, 12)
+# Name of the single Profile in the reports when it is shared
+SHARED_PROFILE_NAME = 'All threads'
+
+
+def modes(setting_values=None):
+    '''
+    Return the profiling modes enabled by the environment or by the "profile" setting
+    '''
+
+    words = {word.strip().lower() for word in os.environ.get(PROFILE_ENV, '').split(',') if word.strip() != ''}
+
+    # Any other value (as "1") enables the default profiling
+    if words - {'sample', 'cprofile', 'memory'}:
+        words = (words & {'sample', 'cprofile', 'memory'}) | DEFAULT_MODES
+
+    if not words and setting_values is not None and setting_values.get('profile', False):
+        words = set(DEFAULT_MODES)
+
+    return words
+
+
+class Profiler:
+    '''
+    Profiler of a collection session.
+
+    The stack sampler is a daemon thread that reads the stack of every thread (bluetooth loop,
+    workers, interface) at a fixed interval and counts the functions running, its cost does not
+    depend on the amount of Python code executed. The deterministic profiler (cProfile) counts
+    every call of the threads it is enabled in, it is exact but slows the Python code down.
+    From Python 3.12 a single Profile, enabled at the start, counts the calls of all the threads.
+
+    The memory profiler traces the allocations with tracemalloc during a window before each
+    snapshot, so each snapshot shows the memory allocated in the window and still alive (what
+    grows). When the window is as long as the interval, tracemalloc is always on and the
+    snapshots are also compared with the first one.
+
+    The reports are written next to the output files of the session when it is stopped.
+    '''
+
+    def __init__(self, output_filename, modes):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            output_filename (string): prefix of the output files of the session;
+            modes (set): profiling enabled, "sample", "cprofile" and/or "memory".
+        '''
+
+        self.output_filename = output_filename
+        self.modes = modes
+
+        self.sample_interval = float(os.environ.get(PROFILE_INTERVAL_ENV, SAMPLE_INTERVAL))
+        self.snapshot_interval = float(os.environ.get(SNAPSHOT_INTERVAL_ENV, SNAPSHOT_INTERVAL))
+        self.memory_window = min(float(os.environ.get(MEMORY_WINDOW_ENV, MEMORY_WINDOW)), self.snapshot_interval)
+        self.continuous_tracing = self.memory_window >= self.snapshot_interval
+        self.tracing = False
+
+        # Samples of each (thread, stack of code objects)
+        self.stacks = collections.Counter()
+        self.thread_names = {}
+        self.n_samples = 0
+        self.sampling_time = 0.0
+
+        # cProfile of each thread, by the name given when it was enabled (only one when shared)
+        self.profiles = {}
+        self.enabled = set()
+
+        # Top allocations and traced memory of each snapshot
+        self.first_snapshot = None
+        self.snapshots = []
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = None
+
+
+    @classmethod
+    def start_session(cls, output_filename, setting_values=None):
+        '''
+        Start the profiling of a session if it is enabled, in the calling thread for cProfile
+
+        Returns:
+            the running Profiler, or None when the profiling is disabled
+        '''
+
+        enabled = modes(setting_values)
+
+        if not enabled:
+            return None
+
+        profiler = cls(output_filename, enabled)
+        profiler.start()
+
+        return profiler
+
+
+    def start(self):
+        '''
+        Start the sampler and the memory tracing, and cProfile in the calling thread
+        '''
+
+        self.start_time = ts.perf_counter()
+
+        if 'memory' in self.modes and self.continuous_tracing:
+            self.start_tracing()
+
+        if 'sample' in self.modes or 'memory' in self.modes:
+            self.thread = threading.Thread(target=self.run, name='Profiler', daemon=True)
+            self.thread.start()
+
+        try:
+            self.enable_thread()
+        except Exception as e:
+            # Another profiler (a debugger, coverage) is running, the other modes still work
+            print(f'Error: Unable to start cProfile ({e})')
+
+        print(f'------ Profiling the session ({", ".join(sorted(self.modes))}) ------')
+
+
+    def profile_name(self, name=None):
+        '''
+        Return the name of the Profile of a thread, the calling thread by default
+        '''
+
+        return SHARED_PROFILE_NAME if SHARED_PROFILE else name or threading.current_thread().name
+
+
+    def enable_thread(self, name=None):
+        '''
+        Enable cProfile in the calling thread, when the deterministic profiling is enabled
+
+        When the Profile is shared, it is enabled once for all the threads.
+
+        Raises:
+            ValueError when another profiler is already running (Python 3.12 and later)
+        '''
+
+        if 'cprofile' not in self.modes:
+            return
+
+        name = self.profile_name(name)
+
+        if name in self.enabled:
+            return
+
+        # Kept only once enabled, a Profile never enabled has no statistics to report
+        profile = self.profiles.get(name) or cProfile.Profile()
+        profile.enable()
+        self.profiles[name] = profile
+        self.enabled.add(name)
+
+
+    def disable_thread(self, name=None):
+        '''
+        Disable cProfile in the calling thread, the shared Profile of all the threads when it is shared
+        '''
+
+        name = self.profile_name(name)
+
+        if name in self.enabled:
+            self.profiles[name].disable()
+            self.enabled.discard(name)
+
+
+    def call(self, function, name):
+        '''
+        Call a function with cProfile enabled in the calling thread, used for the work sent to executors
+
+        The shared Profile already counts the calls of the executor. The function is called without
+        profiling when cProfile cannot be enabled, so the profiling never stops the work.
+
+        Returns:
+            the value returned by the function
+        '''
+
+        if SHARED_PROFILE:
+            return function()
+
+        try:
+            self.enable_thread(name)
+        except Exception as e:
+            print(f'Error: Unable to profile "{name}" ({e})')
+            return function()
+
+        try:
+            return function()
+        finally:
+            self.disable_thread(name)
+
+
+    def start_tracing(self):
+        '''
+        Start tracemalloc, unless it is already tracing for someone else
+        '''
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.tracing = True
+
+
+    def stop_tracing(self):
+        '''
+        Stop tracemalloc, if it was started by the profiler
+        '''
+
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+
+    def run(self):
+        '''
+        Function of the sampler thread, it samples the stacks and takes the memory snapshots
+        '''
+
+        next_snapshot = self.start_time + self.snapshot_interval
+        interval = self.sample_interval if 'sample' in self.modes else MEMORY_TICK
+
+        while not self.stop_event.wait(interval):
+            if 'sample' in self.modes:
+                self.sample()
+
+            if 'memory' not in self.modes:
+                continue
+
+            now = ts.perf_counter()
+
+            if now >= next_snapshot - self.memory_window:
+                self.start_tracing()
+
+            if now >= next_snapshot:
+                self.snapshot()
+                next_snapshot += self.snapshot_interval
+
+                if not self.continuous_tracing:
+                    self.stop_tracing()
+
+
+    def sample(self):
+        '''
+        Count the stack of each thread, except the sampler
+        '''
+
+        t = ts.perf_counter()
+
+        for ident, frame in sys._current_frames().items():
+            if ident == self.thread.ident:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+
+            self.stacks[ident, tuple(stack)] += 1
+
+            if ident not in self.thread_names:
+                self.thread_names.update({thread.ident: thread.name for thread in threading.enumerate()})
+
+        self.n_samples += 1
+        self.sampling_time += ts.perf_counter() - t
+
+
+    def snapshot(self):
+        '''
+        Take a tracemalloc snapshot and keep its top allocations and the difference to the first one
+        '''
+
+        if not tracemalloc.is_tracing():
+            return
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        current, peak = tracemalloc.get_traced_memory()
+        growth = []
+
+        # Only the snapshots of a continuous tracing can be compared
+        if self.continuous_tracing and self.first_snapshot is None:
+            self.first_snapshot = snapshot
+        elif self.continuous_tracing:
+            growth = snapshot.compare_to(self.first_snapshot, 'lineno')[:REPORT_TOP]
+
+        self.snapshots.append({'time': ts.perf_counter() - self.start_time,
+                               'current': current,
+                               'peak': peak,
+                               'top': snapshot.statistics('lineno')[:REPORT_TOP],
+                               'growth': growth,
+        })
+
+
+    def stop(self):
+        '''
+        Stop the profiling and write the reports next to the output files
+
+        Returns:
+            list of the files written
+        '''
+
+        self.disable_thread()
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        duration = ts.perf_counter() - self.start_time
+
+        if 'memory' in self.modes:
+            self.snapshot()
+            self.stop_tracing()
+
+        time = Data().get_time()
+        files = []
+
+        filename = self.output_filename + '-profile-' + time + '.txt'
+        with open(filename, 'w') as outfile:
+            outfile.write(self.report(duration))
+        files.append(filename)
+
+        if self.stacks:
+            filename = self.output_filename + '-profile-' + time + '.folded'
+            with open(filename, 'w') as outfile:
+                outfile.write(self.folded())
+            files.append(filename)
+
+        for name, profile in self.profiles.items():
+            filename = self.output_filename + '-profile-' + name.replace(' ', '_') + '-' + time + '.pstats'
+            profile.dump_stats(filename)
+            files.append(filename)
+
+        print(f'------ Save profile in \"{files[0]}\" ------\n\n')
+
+        return files
+
+
+    def thread_name(self, ident):
+        return self.thread_names.get(ident, f'Thread {ident}')
+
+
+    def function_name(self, code):
+        return f'{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})'
+
+
+    def report(self, duration):
+        '''
+        Return the text report: top functions of each thread, cProfile statistics and memory snapshots
+        '''
+
+        lines = [f'Session profiled for {duration:.1f} s, modes: {", ".join(sorted(self.modes))}', '']
+
+        if self.n_samples > 0:
+            lines.append(f'Stack sampling: {self.n_samples} samples every {1000 * self.sample_interval:.1f} ms, '
+                         f'{1000 * self.sampling_time / self.n_samples:.3f} ms per sample '
+                         f'({100 * self.sampling_time / duration:.2f}% of the session)')
+
+        # Samples where each function is running (self) and where it is in the stack (total), by thread
+        threads = collections.defaultdict(lambda: [0, collections.Counter(), collections.Counter()])
+        for (ident, stack), count in self.stacks.items():
+            thread = threads[ident]
+            thread[0] += count
+            thread[1][stack[0]] += count
+
+            for code in set(stack):
+                thread[2][code] += count
+
+        for ident, (total, own, inclusive) in sorted(threads.items(), key=lambda item: -item[1][0]):
+            lines += ['', f'Thread "{self.thread_name(ident)}": {total} samples',
+                      f'    {"self %":>8} {"total %":>8}  function']
+
+            for code, count in inclusive.most_common(REPORT_TOP):
+                lines.append(f'    {100 * own[code] / total:8.1f} {100 * count / total:8.1f}  {self.function_name(code)}')
+
+        for name, profile in self.profiles.items():
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(REPORT_TOP)
+            title = 'cProfile of all the threads:' if SHARED_PROFILE else f'cProfile of thread "{name}":'
+            lines += ['', title, stream.getvalue()]
+
+        if self.snapshots != []:
+            lines += ['', 'Memory snapshots: ' + ('allocations since the start of the session' if self.continuous_tracing else
+                                                 f'allocations of the last {self.memory_window:.1f} s still alive')
+                          + f', every {self.snapshot_interval:.1f} s']
+
+        for snapshot in self.snapshots:
+            lines += ['', f'Memory snapshot at {snapshot["time"]:.1f} s: {snapshot["current"] / 2 ** 20:.1f} MB traced '
+                          f'(peak {snapshot["peak"] / 2 ** 20:.1f} MB)']
+            lines += [f'    {statistic}' for statistic in snapshot['top']]
+
+            if snapshot['growth'] != []:
+                lines.append('  Growth since the first snapshot:')
+                lines += [f'    {statistic}' for statistic in snapshot['growth']]
+
+        return '\n'.join(lines) + '\n'
+
+
+    def folded(self):
+        '''
+        Return the sampled stacks in the folded format of the flame graph tools
+        '''
+
+        lines = collections.Counter()
+        for (ident, stack), count in self.stacks.items():
+            names = [self.thread_name(ident).replace(' ', '_')] + [self.function_name(code).replace(' ', '_') for code in reversed(stack)]
+            lines[';'.join(names)] += count
+
+        return ''.join(f'{line} {count}\n' for line, count in lines.items())
@@ -0,0 +1,402 @@
+import asyncio
+import collections
+import json
+import os
+import struct
+import time as ts
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+# Environment variable with the addresses where the samples are published, separated by commas:
+# tcp://host:port, udp://host:port or unix:///path/of/the/socket
+PUBLISH_ENV = 'HRC_PUBLISH'
+
+# First byte and version of every frame
+FRAME_MAGIC = 0xB7
+FRAME_VERSION = 1
+# Header of a frame: magic, version, stream, device, sequence, time of the last sample (ns, time.time_ns) and samples
+FRAME_HEADER = struct.Struct('<BBBBIqH')
+
+# Streams of the frames, the information frame has a JSON payload that describes a device
+STREAM_INFO = 0
+STREAM_HR = 1
+STREAM_ECG = 2
+STREAM_ACC = 3
+
+# Type and channels of the samples of each stream: HR (bpm, RR ms), ECG (uV) and accelerometer (X, Y, Z mG)
+SAMPLE_DTYPES = {STREAM_HR: np.dtype('<u2'), STREAM_ECG: np.dtype('<i4'), STREAM_ACC: np.dtype('<i2')}
+SAMPLE_CHANNELS = {STREAM_HR: 2, STREAM_ECG: 1, STREAM_ACC: 3}
+
+# Bytes buffered for each subscriber, the frames are dropped while its buffer is full
+SUBSCRIBER_BUFFER = 256 * 1024
+# A subscriber that keeps its buffer full for this time (s) is disconnected
+SLOW_CONSUMER_TIMEOUT = 10.0
+# A UDP subscriber that sends no datagram for this time (s) is unsubscribed, it sends one again periodically to stay
+UDP_SUBSCRIPTION_TIMEOUT = 30.0
+# Devices published at the same time, the index of a device is one byte of the header
+MAX_DEVICES = 256
+
+
+def endpoints():
+    '''
+    Return the addresses where the samples are published, an empty list when it is disabled
+    '''
+
+    return [url.strip() for url in os.environ.get(PUBLISH_ENV, '').split(',') if url.strip() != '']
+
+
+def encode_frame(stream, device, sequence, time_ns, payload, n_samples):
+    '''
+    Return a frame: the header followed by the payload
+
+    Parameters:
+        stream (int): stream of the frame (STREAM_*);
+        device (int): index of the device, described by its information frame;
+        sequence (int): number of the frame in its device and stream, a gap means frames lost;
+        time_ns (int): time of the last sample (ns since the epoch);
+        payload (bytes): samples, little-endian, channels interleaved;
+        n_samples (int): number of samples, or the size of the payload of the information frames.
+    '''
+
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, stream, device, sequence & 0xFFFFFFFF, time_ns, n_samples) + payload
+
+
+def decode_frames(buffer):
+    '''
+    Decode the complete frames at the start of a buffer, used by the subscribers
+
+    Returns:
+        list of (stream, device, sequence, time_ns, samples or information dict), the bytes not decoded yet
+    '''
+
+    frames = []
+    offset = 0
+
+    while len(buffer) - offset >= FRAME_HEADER.size:
+        magic, version, stream, device, sequence, time_ns, n = FRAME_HEADER.unpack_from(buffer, offset)
+
+        if magic != FRAME_MAGIC:
+            raise ValueError(f'Invalid frame at byte {offset}')
+
+        size = n if stream == STREAM_INFO else n * SAMPLE_CHANNELS[stream] * SAMPLE_DTYPES[stream].itemsize
+        end = offset + FRAME_HEADER.size + size
+
+        if end > len(buffer):
+            break
+
+        payload = buffer[offset + FRAME_HEADER.size : end]
+
+        if stream == STREAM_INFO:
+            frames.append((stream, device, sequence, time_ns, json.loads(bytes(payload))))
+        else:
+            frames.append((stream, device, sequence, time_ns, np.frombuffer(payload, SAMPLE_DTYPES[stream]).reshape(n, SAMPLE_CHANNELS[stream])))
+
+        offset = end
+
+    return frames, buffer[offset:]
+
+
+class Subscriber:
+    '''
+    Connection of one subscriber and its counters
+    '''
+
+    def __init__(self, transport, address=None):
+        self.transport = transport
+        self.address = address
+        self.frames = 0
+        self.dropped = 0
+        self.dropping_since = None
+        # Time (s) of the last datagram of a UDP subscriber
+        self.last_seen = ts.perf_counter()
+
+
+    def buffered(self):
+        return self.transport.get_write_buffer_size()
+
+
+    def write(self, frame):
+        if self.address is None:
+            self.transport.write(frame)
+        else:
+            self.transport.sendto(frame, self.address)
+
+
+class Stream_protocol(asyncio.Protocol):
+    '''
+    Protocol of the TCP and Unix socket subscribers, they only receive
+    '''
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.subscriber = None
+
+
+    def connection_made(self, transport):
+        self.subscriber = Subscriber(transport)
+        self.publisher.subscribe(self.subscriber)
+
+
+    def connection_lost(self, exc):
+        self.publisher.unsubscribe(self.subscriber)
+
+
+class Datagram_protocol(asyncio.DatagramProtocol):
+    '''
+    Protocol of the UDP subscribers: any datagram subscribes its sender, "UNSUB" unsubscribes it
+
+    UDP has no connection, so a subscriber that stops without "UNSUB" is only noticed by its
+    silence: it must send a datagram again (as its first one) at least every
+    UDP_SUBSCRIPTION_TIMEOUT seconds, or it is unsubscribed.
+    '''
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.transport = None
+        self.subscribers = {}
+        self.expiry = None
+
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.expiry = asyncio.get_running_loop().call_later(UDP_SUBSCRIPTION_TIMEOUT / 2, self.expire)
+
+
+    def connection_lost(self, exc):
+        if self.expiry is not None:
+            self.expiry.cancel()
+
+
+    def datagram_received(self, data, address):
+        if data.startswith(b'UNSUB'):
+            if address in self.subscribers:
+                self.publisher.unsubscribe(self.subscribers.pop(address))
+        elif address not in self.subscribers:
+            self.subscribers[address] = Subscriber(self.transport, address)
+            self.publisher.subscribe(self.subscribers[address])
+        else:
+            self.subscribers[address].last_seen = ts.perf_counter()
+
+
+    def expire(self):
+        '''
+        Unsubscribe the subscribers silent for more than UDP_SUBSCRIPTION_TIMEOUT, checked every half of it
+        '''
+
+        now = ts.perf_counter()
+
+        for address, subscriber in list(self.subscribers.items()):
+            if now - subscriber.last_seen > UDP_SUBSCRIPTION_TIMEOUT:
+                print(f'------ UDP subscriber {address[0]}:{address[1]} expired: no datagram for {UDP_SUBSCRIPTION_TIMEOUT:.0f} s ------')
+
+                self.publisher.unsubscribe(self.subscribers.pop(address))
+
+        self.expiry = asyncio.get_running_loop().call_later(UDP_SUBSCRIPTION_TIMEOUT / 2, self.expire)
+
+
+class Publisher:
+    '''
+    Publisher of the decoded samples of the collections to local subscribers.
+
+    It runs on the bluetooth service loop: the parsers publish each frame of samples as soon as
+    it is decoded, it is encoded once and written to every subscriber without waiting. Each
+    subscriber has a bounded buffer, when a slow subscriber fills it, its frames are dropped
+    (the sequence numbers show the gap) and it is disconnected if it does not recover, so it
+    never delays the collection or the other subscribers.
+
+    The publisher is shared by all the collections of the process and is closed when the last
+    one ends.
+    '''
+
+    # Publisher of the running collections
+    _instance = None
+
+
+    def __init__(self, urls):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            urls (list): addresses where the samples are published.
+        '''
+
+        self.urls = urls
+        self.servers = []
+        self.subscribers = []
+        self.devices = {}
+        self.sequences = collections.Counter()
+        self.frames = 0
+        self.dropped = 0
+        self.started = None
+
+
+    @classmethod
+    async def register(cls, info):
+        '''
+        Register a device that will publish its samples, starting the publisher when needed
+
+        Parameters:
+            info (dict): description of the device, sent to the subscribers in its information frame.
+
+        Returns:
+            (publisher, index of the device), or (None, None) when the publication is disabled
+        '''
+
+        if cls._instance is None:
+            urls = endpoints()
+
+            if urls == []:
+                return None, None
+
+            # The devices of a multiple collection register at the same time, they wait for the same start
+            cls._instance = cls(urls)
+            cls._instance.started = asyncio.get_running_loop().create_task(cls._instance.start())
+
+        publisher = cls._instance
+
+        try:
+            await publisher.started
+        except Exception:
+            if cls._instance is publisher:
+                cls._instance = None
+                publisher.close()
+            raise
+
+        device = next((index for index in range(MAX_DEVICES) if index not in publisher.devices), None)
+        if device is None:
+            raise ValueError(f'{MAX_DEVICES} devices are already published')
+
+        publisher.devices[device] = info
+
+        # The subscribers already connected learn about the new device
+        frame = publisher.info_frame(device)
+        for subscriber in list(publisher.subscribers):
+            publisher.send(subscriber, frame)
+
+        return publisher, device
+
+
+    def unregister(self, device):
+        '''
+        Remove a device, the publisher is closed after the last one
+        '''
+
+        self.devices.pop(device, None)
+
+        if self.devices == {} and Publisher._instance is self:
+            Publisher._instance = None
+            self.close()
+
+
+    async def start(self):
+        '''
+        Start listening on all the addresses
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        for url in self.urls:
+            parsed = urlparse(url)
+
+            if parsed.scheme == 'tcp':
+                server = await loop.create_server(lambda: Stream_protocol(self), parsed.hostname, parsed.port)
+            elif parsed.scheme == 'unix':
+                if os.path.exists(parsed.path):
+                    os.unlink(parsed.path)
+                server = await loop.create_unix_server(lambda: Stream_protocol(self), parsed.path)
+            elif parsed.scheme == 'udp':
+                server, _ = await loop.create_datagram_endpoint(lambda: Datagram_protocol(self), local_addr=(parsed.hostname, parsed.port))
+            else:
+                raise ValueError(f'Unknown publication address "{url}"')
+
+            self.servers.append(server)
+
+            print(f'------ Publishing the samples on {url} ------')
+
+
+    def close(self):
+        '''
+        Close the servers and the connections of the subscribers
+        '''
+
+        for server in self.servers:
+            server.close()
+
+        for subscriber in list(self.subscribers):
+            if subscriber.address is None:
+                subscriber.transport.close()
+
+        print(f'------ Publisher closed: {self.frames} frames published, {self.dropped} dropped for slow subscribers ------')
+
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+        for device in self.devices:
+            self.send(subscriber, self.info_frame(device))
+
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+
+    def info_frame(self, device):
+        payload = json.dumps(self.devices[device]).encode()
+
+        return encode_frame(STREAM_INFO, device, 0, ts.time_ns(), payload, len(payload))
+
+
+    def publish(self, device, stream, time_ns, samples):
+        '''
+        Publish a frame of samples to all the subscribers
+
+        Parameters:
+            device (int): index of the device, returned by register;
+            stream (int): stream of the samples (STREAM_HR, STREAM_ECG or STREAM_ACC);
+            time_ns (int): time of the last sample (ns since the epoch);
+            samples (numpy.ndarray): samples of the frame, one row per sample.
+        '''
+
+        sequence = self.sequences[device, stream]
+        self.sequences[device, stream] += 1
+
+        if self.subscribers == []:
+            return
+
+        payload = np.ascontiguousarray(samples, dtype=SAMPLE_DTYPES[stream]).tobytes()
+        frame = encode_frame(stream, device, sequence, time_ns, payload, len(samples))
+
+        self.frames += 1
+
+        for subscriber in list(self.subscribers):
+            self.send(subscriber, frame)
+
+
+    def send(self, subscriber, frame):
+        '''
+        Write a frame to a subscriber, or drop it when its buffer is full
+        '''
+
+        if subscriber.buffered() + len(frame) <= SUBSCRIBER_BUFFER:
+            subscriber.write(frame)
+            subscriber.frames += 1
+            subscriber.dropping_since = None
+            return
+
+        subscriber.dropped += 1
+        self.dropped += 1
+
+        now = ts.perf_counter()
+
+        if subscriber.dropping_since is None:
+            subscriber.dropping_since = now
+        # The UDP subscribers share the buffer of one socket, a full buffer is not the fault of one
+        # of them, they are removed by their expiry instead
+        elif now - subscriber.dropping_since > SLOW_CONSUMER_TIMEOUT and subscriber.address is None:
+            print(f'------ Subscriber disconnected, too slow: {subscriber.dropped} frames dropped ------')
+
+            self.unsubscribe(subscriber)
+            subscriber.transport.abort()
@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+
+
+class Quantile_sketch:
+    '''
+    Fixed-bin histogram that summarizes a stream of values.
+
+    The state is a constant number of counters, so adding a value, merging two sketches
+    and querying a quantile do not depend on how many values were already seen.
+    '''
+
+    def __init__(self, lower, upper, bin_width):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            lower (float): lower edge of the first bin;
+            upper (float): upper edge of the last bin;
+            bin_width (float): width of each bin.
+        '''
+
+        self.lower = lower
+        self.upper = upper
+        self.bin_width = bin_width
+        self.n_bins = int(math.ceil((upper - lower) / bin_width))
+
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def add(self, value):
+        '''
+        Add a new value to the sketch. NaN values are ignored.
+        '''
+
+        value = float(value)
+
+        if math.isnan(value):
+            return
+
+        index = int((value - self.lower) // self.bin_width)
+
+        if index < 0:
+            self.underflow += 1
+        elif index >= self.n_bins:
+            self.overflow += 1
+        else:
+            self.counts[index] += 1
+
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+    def merge(self, other):
+        '''
+        Add the counters of another sketch with the same bins to this one.
+        '''
+
+        if (self.lower, self.upper, self.bin_width) != (other.lower, other.upper, other.bin_width):
+            raise ValueError('Only sketches with the same bins can be merged')
+
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+    def edges(self):
+        '''
+        Return the edges of the bins
+        '''
+
+        return self.lower + self.bin_width * np.arange(self.n_bins + 1)
+
+
+    def quantile(self, q):
+        '''
+        Estimate the q-th quantile (0 <= q <= 1), interpolating inside the bin.
+
+        Returns NaN when the sketch is empty.
+        '''
+
+        if self.count == 0:
+            return math.nan
+
+        target = q * self.count
+
+        if target <= self.underflow:
+            return self.min
+
+        cumulative = self.underflow + np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, target))
+
+        if index >= self.n_bins:
+            return self.max
+
+        before = cumulative[index] - self.counts[index]
+        fraction = (target - before) / self.counts[index]
+        value = self.lower + self.bin_width * (index + fraction)
+
+        return min(max(value, self.min), self.max)
+
+
+    def to_dict(self):
+        '''
+        Return the sketch state as a JSON serializable dictionary
+        '''
+
+        return {'lower': self.lower,
+                'upper': self.upper,
+                'bin_width': self.bin_width,
+                'counts': self.counts.tolist(),
+                'underflow': self.underflow,
+                'overflow': self.overflow,
+                'count': self.count,
+                'min': self.min if self.count else None,
+                'max': self.max if self.count else None,
+                'median': self.quantile(0.5) if self.count else None,
+                'p5': self.quantile(0.05) if self.count else None,
+                'p95': self.quantile(0.95) if self.count else None,
+        }
+
+
+    @classmethod
+    def from_dict(cls, state):
+        '''
+        Rebuild a sketch from the dictionary produced by to_dict
+        '''
+
+        sketch = cls(state['lower'], state['upper'], state['bin_width'])
+        sketch.counts = np.array(state['counts'], dtype=np.int64)
+        sketch.underflow = state['underflow']
+        sketch.overflow = state['overflow']
+        sketch.count = state['count']
+        sketch.min = state['min'] if state['min'] is not None else math.inf
+        sketch.max = state['max'] if state['max'] is not None else -math.inf
+
+        return sketch
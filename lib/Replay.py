@@ -0,0 +1,243 @@
+import glob
+import json
+import math
+import os
+import time as ts
+
+import numpy as np
+
+from lib import Pmd
+
+
+# Environment variable with the output filenames of the recordings to replay, separated by commas
+REPLAY_ENV = 'HRC_REPLAY'
+# Environment variable with the speed of the replay: 1 is real time, N is N times faster and 0 is as fast as possible
+REPLAY_SPEED_ENV = 'HRC_REPLAY_SPEED'
+
+# Samples in each replayed ECG and accelerometer notification
+ECG_FRAME = 73
+ACC_FRAME = 36
+
+
+def is_enabled():
+    '''
+    Return True when recorded sessions must be replayed instead of bluetooth
+    '''
+
+    return os.environ.get(REPLAY_ENV, '') != ''
+
+
+def replay_speed():
+    '''
+    Return the speed of the replay, infinite for the maximum speed
+    '''
+
+    speed = float(os.environ.get(REPLAY_SPEED_ENV, '1'))
+
+    return math.inf if speed <= 0 else speed
+
+
+def last_file(prefix, pattern):
+    '''
+    Return the last file (by the time in its name) of a recording, or None
+    '''
+
+    files = sorted(glob.glob(glob.escape(prefix) + pattern))
+
+    return files[-1] if files != [] else None
+
+
+class Replay_device:
+    '''
+    Device that streams a recorded session again.
+
+    The RR, ECG and accelerometer files are re-encoded as Heart Rate Measurement and PMD
+    notifications, at their recorded time divided by the speed. It has the interface of the
+    Simulated_device, so it is connected through the Simulated_client and the whole
+    collection path (parsing, features, plot and files) runs as with a real strap.
+    '''
+
+    # Replayed devices by address
+    devices = {}
+
+
+    def __init__(self, index, prefix, speed):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            index (int): index of the device, it changes its name and address;
+            prefix (string): output filename of the recording;
+            speed (float): speed of the replay, infinite for the maximum speed.
+        '''
+
+        self.name = f'Polar H10 REPLAY{index:04d}'
+        self.address = '00:00:00:01:' + f'{index:04X}'[:2] + ':' + f'{index:04X}'[2:]
+        self.prefix = prefix
+        self.speed = speed
+        self.battery = 100
+
+        self.settings = {'burst': 1, 'drop': 0.0, 'link_loss': 0.0, 'ecg_rate': 0.0}
+        self.rng = np.random.default_rng(index)
+
+        self.data = {name: self.load(name) for name in ['rr', 'ecg', 'acc']}
+
+        # Align the streams with the time origins of the session, when it was saved
+        session_file = last_file(prefix, '-session-*.json')
+        origin = {}
+        if session_file is not None:
+            with open(session_file) as infile:
+                origin = json.load(infile).get('time_origin', {})
+
+        self.offset = {name: origin.get(name, 0.0) - min(origin.values(), default=0.0) for name in self.data}
+
+        first = [data['time'].iloc[0] + self.offset[name] for name, data in self.data.items() if data is not None and len(data) > 0]
+        if first == []:
+            raise FileNotFoundError(f'No recording found for "{prefix}"')
+
+        for name in self.offset:
+            self.offset[name] -= min(first)
+
+        self.start = None
+        self.active = 0
+        self.samples = 0
+
+
+    def load(self, name):
+        '''
+        Load the file of one stream of the recording, None when it was not recorded
+        '''
+
+        # pandas is loaded only when a recording is replayed
+        import pandas as pd
+
+        filename = last_file(self.prefix, f'-{name}-2*.csv')
+
+        return pd.read_csv(filename, index_col=0) if filename is not None else None
+
+
+    @classmethod
+    def all(cls):
+        '''
+        Return all the replayed devices, created on the first call
+        '''
+
+        if cls.devices == {}:
+            speed = replay_speed()
+
+            for index, prefix in enumerate(os.environ.get(REPLAY_ENV, '').split(','), start=1):
+                device = cls(index, prefix.strip(), speed)
+                cls.devices[device.address] = device
+
+        return list(cls.devices.values())
+
+
+    @classmethod
+    def get(cls, address):
+        '''
+        Return the replayed device with the address, or None
+        '''
+
+        cls.all()
+
+        return cls.devices.get(address)
+
+
+    def now(self):
+        '''
+        Return the time (s) of the recording being replayed
+        '''
+
+        if self.start is None:
+            self.start = ts.perf_counter()
+
+        if math.isinf(self.speed):
+            return math.inf
+
+        return (ts.perf_counter() - self.start) * self.speed
+
+
+    def stream_finished(self, uuid):
+        '''
+        Report the throughput of the replay when all its streams are finished
+        '''
+
+        self.active -= 1
+
+        if self.active > 0:
+            return
+
+        elapsed = ts.perf_counter() - self.start
+
+        print(f'------ Replay of {self.name} finished: {self.samples} samples in {elapsed:.2f} s '
+              f'({self.samples / elapsed:.0f} samples/s) ------')
+
+
+    def hr_frames(self):
+        '''
+        Return the generator of the Heart Rate Measurement notifications: (due time, payload)
+        '''
+
+        self.active += 1
+
+        return self.generate_hr()
+
+
+    def generate_hr(self):
+        data = self.data['rr']
+
+        if data is None:
+            return
+
+        times = data['time'].to_numpy(dtype=float) + self.offset['rr']
+        hr = np.clip(data['heart rate'].to_numpy(), 0, 255).astype(int)
+        rr = np.clip(data['rr interval'].to_numpy(), 0, 65535).astype(int)
+
+        for t, hr_value, rr_value in zip(times, hr, rr):
+            # Flags 0x16: UINT8 heart rate, sensor contact detected and RR intervals present
+            payload = bytearray([0x16, hr_value]) + int(rr_value).to_bytes(2, byteorder='little')
+            self.samples += 1
+
+            yield t, payload
+
+
+    def pmd_frames(self, measurement, sample_rate):
+        '''
+        Return the generator of the PMD data notifications of a measurement type: (due time, payload)
+
+        The recorded sample rate is kept, whatever is requested.
+        '''
+
+        self.active += 1
+
+        return self.generate_pmd(measurement)
+
+
+    def generate_pmd(self, measurement):
+        name = 'ecg' if measurement == Pmd.PMD_ECG else 'acc'
+        data = self.data[name]
+
+        if data is None or len(data) == 0:
+            return
+
+        n = ECG_FRAME if measurement == Pmd.PMD_ECG else ACC_FRAME
+        times = data['time'].to_numpy(dtype=float) + self.offset[name]
+        samples = data[['ecg']].to_numpy(dtype=np.int64) if measurement == Pmd.PMD_ECG else data[['x', 'y', 'z']].to_numpy(dtype=np.int64)
+
+        if 'timestamp' in data:
+            timestamps = data['timestamp'].to_numpy(dtype=np.int64)
+        else:
+            timestamps = (times * 1e9).astype(np.int64)
+
+        for start in range(0, len(samples), n):
+            end = min(start + n, len(samples))
+
+            # The timestamp and the arrival of a frame are the ones of its last sample
+            if measurement == Pmd.PMD_ECG:
+                payload = Pmd.encode_raw_frame(Pmd.PMD_ECG, int(timestamps[end - 1]), samples[start:end], 3)
+            else:
+                payload = Pmd.encode_delta_frame(Pmd.PMD_ACC, int(timestamps[end - 1]), samples[start:end])
+
+            self.samples += end - start
+
+            yield times[end - 1], payload
@@ -1,36 +1,45 @@
 import asyncio
 
-from bleak import BleakScanner
-from PyQt5.QtCore import QThread, pyqtSignal
+from lib import Ble_backend
+from lib.Ble_task import Ble_task
+from lib.Connection_manager import Connection_manager
+from lib.Signals import Signal
 
-class Scan(QThread):
+
+# Maximum duration (s) of a scan
+SCAN_TIMEOUT = 10.0
+
+
+class Scan(Ble_task):
     '''
     Class responsible for performing scan task.
     '''
 
     # Variables that connect this thread with the main thread
-    log_signal = pyqtSignal(str, str)
-    finished_signal = pyqtSignal()
+    log_signal = Signal(str, str)
+    finished_signal = Signal()
 
-    def __init__(self):
+    def __init__(self, expected=None):
         '''
         Initialize the class variables
+
+        Parameters:
+            expected (list): names of the devices expected nearby. The scan stops as soon as
+                all of them are found, otherwise it lasts SCAN_TIMEOUT seconds.
         '''
 
         super().__init__()
+        self.expected = set(expected or [])
 
 
-    def run(self):
+    async def run(self):
         '''
-        Function that are started when this WorkerThread are startd
+        Coroutine that are started on the bluetooth service when this task are started
 
         This function perform the scan task
         '''
 
-        # Run the events
-        loop = asyncio.new_event_loop()
-
-        loop.run_until_complete(self.scan())
+        await self.scan()
 
         self.finished_signal.emit()
 
@@ -40,22 +49,45 @@ class Scan(QThread):
         This function scan for nearby bluetooth devices and print their
         characteristics.
 
+        Each Polar device is sent to the main thread as soon as its advertisement is received.
+
         Note: You can use this function to identify the MAC Address of the device.
         '''
 
         print('------ Scanning for devices -------')
 
-        devices = await BleakScanner.discover()
-        for d in devices:
-            name = d.name
-            address = d.address
+        found = {}
+        all_expected_found = asyncio.Event()
+
+        def detection_callback(device, advertisement_data):
+            name = device.name or advertisement_data.local_name
+            address = device.address
+
+            if name is None or "Polar" not in name:
+                return
+
+            # The RSSI of the connection has no public API, the one of the advertisements is reported instead
+            if getattr(advertisement_data, 'rssi', None) is not None:
+                Connection_manager.advertised_rssi[address] = advertisement_data.rssi
+
+            if name in found:
+                return
+
+            found[name] = address
+
             print('Device name: ', name)
             print('MAC Address: ', address)
-            #print('Metadata: ')
-            #print(d.metadata)
             print('\n')
 
-            if "Polar" in name:
-                self.log_signal.emit(name, address)
+            self.log_signal.emit(name, address)
+
+            if self.expected and self.expected.issubset(found):
+                all_expected_found.set()
+
+        async with Ble_backend.new_scanner(detection_callback=detection_callback):
+            try:
+                await asyncio.wait_for(all_expected_found.wait(), SCAN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
 
         print('\n\n')
@@ -0,0 +1,87 @@
+import os
+
+
+# Environment variable that runs the bluetooth tasks without Qt, set by the command line interface
+HEADLESS_ENV = 'HRC_HEADLESS'
+
+
+def is_headless():
+    '''
+    Return True when the bluetooth tasks must not import Qt
+    '''
+
+    return os.environ.get(HEADLESS_ENV, '') not in ('', '0')
+
+
+class Bound_signal:
+    '''
+    Signal of one object: the slots connected to it are called, in order, by each emit
+    '''
+
+    def __init__(self):
+        self.slots = []
+
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+
+    def disconnect(self, slot=None):
+        self.slots = [] if slot is None else [s for s in self.slots if s != slot]
+
+
+    def emit(self, *args):
+        for slot in list(self.slots):
+            slot(*args)
+
+
+class Python_signal:
+    '''
+    Replacement of pyqtSignal without Qt, with the same connect/emit interface.
+
+    The slots are called in the thread that emits (the bluetooth loop), so they must be
+    thread-safe. Only the headless interface uses them, the windows keep the Qt signals, which
+    are delivered in the main thread.
+    '''
+
+    def __init__(self, *types):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            types (list): types of the arguments, kept for documentation only.
+        '''
+
+        self.types = types
+        self.name = None
+
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        # Each object has its own slots, created on the first access
+        bound = instance.__dict__.get(self.name)
+        if bound is None:
+            bound = instance.__dict__[self.name] = Bound_signal()
+
+        return bound
+
+
+class Python_object:
+    '''
+    Base class of the objects with signals when Qt is not used
+    '''
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+if is_headless():
+    Signal, Signal_object = Python_signal, Python_object
+else:
+    from PyQt5.QtCore import QObject as Signal_object, pyqtSignal as Signal
@@ -0,0 +1,587 @@
+import asyncio
+import math
+import os
+import time as ts
+from types import SimpleNamespace
+
+import numpy as np
+
+from lib import Pmd
+
+
+# UUID for battery level
+BATTERY_LEVEL_UUID = '00002a19-0000-1000-8000-00805f9b34fb'
+# UUID for model number
+MODEL_NBR_UUID = '00002a24-0000-1000-8000-00805f9b34fb'
+# UUID for manufacturer name
+MANUFACTURER_NAME_UUID = '00002a29-0000-1000-8000-00805f9b34fb'
+# UUID for Heart Rate Measurement
+HEART_RATE = '00002a37-0000-1000-8000-00805f9b34fb'
+# UUID of the PMD control point and data characteristics
+PMD_CONTROL = 'FB005C81-02E7-F387-1CAD-8ACD2D8DF0C8'
+PMD_DATA = 'FB005C82-02E7-F387-1CAD-8ACD2D8DF0C8'
+
+# Environment variable with the number of simulated devices, the simulator is used when it is set
+SIMULATOR_ENV = 'HRC_SIMULATE'
+
+# Settings of the simulation, each one can be changed by its environment variable
+SIMULATOR_SETTINGS = {
+    # Heart rate notifications per second, 0 sends one notification per beat like the real device
+    'hr_rate': ('HRC_SIM_HR_RATE', 0.0),
+    # ECG sample rate (Hz), 0 uses the rate requested by the collector
+    'ecg_rate': ('HRC_SIM_ECG_RATE', 0.0),
+    # Samples in each ECG notification
+    'ecg_frame': ('HRC_SIM_ECG_FRAME', 73),
+    # Samples in each accelerometer notification
+    'acc_frame': ('HRC_SIM_ACC_FRAME', 36),
+    # PMD notifications delivered back to back in each connection event
+    'burst': ('HRC_SIM_BURST', 1),
+    # Probability of losing each notification
+    'drop': ('HRC_SIM_DROP', 0.0),
+    # Mean time (s) between two losses of the link, 0 never loses it
+    'link_loss': ('HRC_SIM_LINK_LOSS', 0.0),
+    # Drift (ppm) of the sensor clock
+    'drift_ppm': ('HRC_SIM_DRIFT_PPM', 0.0),
+    # Mean heart rate (bpm) of the first device, the next ones are a little faster
+    'heart_rate': ('HRC_SIM_HEART_RATE', 70.0),
+}
+
+# Settings offered by the PMD control point for each measurement type
+PMD_AVAILABLE_SETTINGS = {
+    Pmd.PMD_ECG: {Pmd.PMD_SAMPLE_RATE: [130], Pmd.PMD_RESOLUTION: [14]},
+    Pmd.PMD_ACC: {Pmd.PMD_SAMPLE_RATE: [25, 50, 100, 200], Pmd.PMD_RESOLUTION: [16], Pmd.PMD_RANGE: [2, 4, 8]},
+}
+
+# Seconds between 1970-01-01 and 2000-01-01, the epoch of the Polar timestamps
+POLAR_EPOCH = 946684800
+
+# Time (s) spent to connect to a simulated device
+CONNECT_DELAY = 0.05
+
+
+def is_enabled():
+    '''
+    Return True when the simulated devices must be used instead of bluetooth
+    '''
+
+    return os.environ.get(SIMULATOR_ENV, '') not in ('', '0')
+
+
+def settings():
+    '''
+    Return the settings of the simulation, read from the environment
+    '''
+
+    values = {}
+
+    for name, (variable, default) in SIMULATOR_SETTINGS.items():
+        values[name] = type(default)(os.environ.get(variable, default))
+
+    return values
+
+
+class Simulated_device:
+    '''
+    State of a simulated Polar H10: its heart and its sensor clock.
+
+    The state is kept between connections, so the heart beats and the sensor clock keep
+    running during a link loss like on the real device.
+    '''
+
+    # Simulated devices by address
+    devices = {}
+
+    # Speed of the time of the device relative to the host time
+    speed = 1.0
+
+
+    def __init__(self, index, settings):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            index (int): index of the device, it changes its name, address and heart rate;
+            settings (dict): settings of the simulation.
+        '''
+
+        self.name = f'Polar H10 SIM{index:04d}'
+        self.address = '00:00:00:00:' + f'{index:04X}'[:2] + ':' + f'{index:04X}'[2:]
+        self.settings = settings
+        self.battery = 100 - index % 50
+
+        self.rng = np.random.default_rng(index)
+
+        # Host time (s, time.perf_counter) and sensor time (ns) of the start of the device
+        self.start = ts.perf_counter()
+        self.sensor_start = int((ts.time() - POLAR_EPOCH) * 1e9)
+
+        # Beat times (s since the start), generated ahead as needed
+        self.mean_rr = 60 / (settings['heart_rate'] + index)
+        self.beats = np.array([self.rng.uniform(0, self.mean_rr)])
+
+
+    @classmethod
+    def all(cls):
+        '''
+        Return all the simulated devices, created on the first call
+        '''
+
+        if cls.devices == {}:
+            simulation = settings()
+
+            for index in range(1, int(os.environ.get(SIMULATOR_ENV, '1')) + 1):
+                device = cls(index, simulation)
+                cls.devices[device.address] = device
+
+        return list(cls.devices.values())
+
+
+    @classmethod
+    def get(cls, address):
+        '''
+        Return the simulated device with the address, or None
+        '''
+
+        cls.all()
+
+        return cls.devices.get(address)
+
+
+    def now(self):
+        '''
+        Return the time (s) since the start of the device
+        '''
+
+        return ts.perf_counter() - self.start
+
+
+    def sensor_time(self, t):
+        '''
+        Return the sensor timestamp (ns) of a time (s since the start of the device)
+        '''
+
+        return self.sensor_start + int(round(t * (1 + self.settings['drift_ppm'] / 1e6) * 1e9))
+
+
+    def beat_times(self, until):
+        '''
+        Return the beat times (s since the start), generated at least until the given time
+        '''
+
+        while self.beats[-1] < until + 2:
+            # Respiratory sinus arrhythmia and some noise around the mean RR interval
+            t = self.beats[-1]
+            n = 256
+            rr = self.mean_rr * (1 + 0.05 * np.sin(2 * math.pi * 0.25 * (t + np.arange(n) * self.mean_rr))) + self.rng.normal(0, 0.01, n)
+            self.beats = np.concatenate([self.beats[-8:], t + np.cumsum(rr)])
+
+        return self.beats
+
+
+    def ecg(self, times):
+        '''
+        Return the ECG (uV) at the given times (s since the start), a P-QRS-T complex on each beat
+        '''
+
+        beats = self.beat_times(times[-1])
+        index = np.searchsorted(beats, times, side='right') - 1
+        phase = times - beats[np.maximum(index, 0)]
+
+        waves = [(0.10, 0.020, 150), (0.20, 0.008, 1200), (0.22, 0.006, -300), (0.45, 0.040, 300)]
+        ecg = sum(amplitude * np.exp(-(phase - center) ** 2 / (2 * width ** 2)) for center, width, amplitude in waves)
+
+        return (ecg + self.rng.normal(0, 10, len(times))).astype(np.int64)
+
+
+    def acc(self, times):
+        '''
+        Return the accelerometer (mG) at the given times (s since the start), a slow sway around the gravity
+        '''
+
+        sway = np.stack([30 * np.sin(0.3 * times), 30 * np.cos(0.2 * times), 1000 + 10 * np.sin(2 * math.pi * 0.25 * times)], axis=1)
+
+        return (sway + self.rng.normal(0, 5, (len(times), 3))).astype(np.int64)
+
+
+    def stream_finished(self, uuid):
+        '''
+        Function called when a stream has no more notifications, the simulated ones never end
+        '''
+
+        pass
+
+
+    def hr_frames(self):
+        '''
+        Generate the Heart Rate Measurement notifications: (due time, payload)
+
+        Flags 0x16: UINT8 heart rate, sensor contact detected and RR intervals present.
+        The RR intervals are in 1/1024 s, as in the Bluetooth specification and as a real H10 sends them.
+        '''
+
+        rate = self.settings['hr_rate']
+        t = self.now()
+
+        while True:
+            beats = self.beat_times(t)
+
+            if rate > 0:
+                t += 1 / rate
+                index = max(1, int(np.searchsorted(beats, t, side='right')) - 1)
+            else:
+                index = max(1, int(np.searchsorted(beats, t, side='right')))
+                t = beats[index]
+
+            rr = beats[index] - beats[index - 1]
+
+            payload = bytearray([0x16, min(255, int(round(60 / rr)))]) + int(round(rr * 1024)).to_bytes(2, byteorder='little')
+
+            yield t, payload
+
+
+    def pmd_frames(self, measurement, sample_rate):
+        '''
+        Generate the PMD data notifications of a measurement type: (due time, payload)
+        '''
+
+        n = self.settings['ecg_frame'] if measurement == Pmd.PMD_ECG else self.settings['acc_frame']
+        k = int(self.now() * sample_rate)
+
+        while True:
+            times = (k + np.arange(n)) / sample_rate
+            k += n
+
+            timestamp = self.sensor_time(times[-1])
+
+            if measurement == Pmd.PMD_ECG:
+                yield times[-1], Pmd.encode_raw_frame(Pmd.PMD_ECG, timestamp, self.ecg(times).reshape(-1, 1), 3)
+            else:
+                yield times[-1], Pmd.encode_delta_frame(Pmd.PMD_ACC, timestamp, self.acc(times))
+
+
+class Simulated_client:
+    '''
+    Stand-in of the BleakClient for a simulated device.
+
+    It implements the part of the BleakClient used by the collector: connect, disconnect,
+    read_gatt_char, write_gatt_char, start_notify and stop_notify.
+    '''
+
+    def __init__(self, address, disconnected_callback=None, device=None, **kwargs):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            address (str): MAC address of the simulated device;
+            disconnected_callback (function): function called with the client when the link is lost;
+            device (Simulated_device): device that generates the notifications, found by the address by default.
+        '''
+
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self.device = device if device is not None else Simulated_device.get(address)
+
+        self.is_connected = False
+        self.mtu_size = 232
+
+        self.callbacks = {}
+        self.tasks = {}
+
+        # Measurement type -> sample rate of the PMD streams started
+        self.measurements = {}
+
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+
+    async def __aexit__(self, *args):
+        await self.disconnect()
+
+
+    async def connect(self, **kwargs):
+        '''
+        Connect to the simulated device
+        '''
+
+        await asyncio.sleep(CONNECT_DELAY)
+
+        if self.device is None:
+            raise Exception(f'Device with address {self.address} was not found.')
+
+        self.is_connected = True
+
+        if self.device.settings['link_loss'] > 0:
+            self.tasks['link_loss'] = asyncio.create_task(self.lose_link())
+
+        return True
+
+
+    async def disconnect(self):
+        '''
+        Disconnect from the simulated device
+        '''
+
+        was_connected = self.is_connected
+        self.close()
+
+        if was_connected and self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+        return True
+
+
+    def close(self):
+        '''
+        Stop all the streams of the connection
+        '''
+
+        self.is_connected = False
+
+        current = asyncio.current_task()
+        for task in self.tasks.values():
+            if task is not current:
+                task.cancel()
+
+        self.tasks = {}
+        self.callbacks = {}
+        self.measurements = {}
+
+
+    async def lose_link(self):
+        '''
+        Drop the link after a random time, as when the strap goes out of range
+        '''
+
+        await asyncio.sleep(self.device.rng.exponential(self.device.settings['link_loss']))
+
+        print(f'------ Simulated link loss of {self.device.name} ------')
+
+        self.close()
+
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+
+    def check_connected(self):
+        if not self.is_connected:
+            raise Exception('Not connected')
+
+
+    async def read_gatt_char(self, uuid, **kwargs):
+        '''
+        Return the value of a characteristic
+        '''
+
+        self.check_connected()
+
+        uuid = str(uuid).lower()
+
+        if uuid == BATTERY_LEVEL_UUID:
+            return bytearray([self.device.battery])
+        if uuid == MODEL_NBR_UUID:
+            return bytearray(b'H10')
+        if uuid == MANUFACTURER_NAME_UUID:
+            return bytearray(b'Polar Electro Oy')
+        if uuid == PMD_CONTROL.lower():
+            # Feature read: ECG and accelerometer
+            return bytearray([0x0F, (1 << Pmd.PMD_ECG) | (1 << Pmd.PMD_ACC), 0x00])
+
+        raise Exception(f'Characteristic {uuid} was not found')
+
+
+    async def write_gatt_char(self, uuid, data, response=None):
+        '''
+        Handle a write in the PMD control point
+        '''
+
+        self.check_connected()
+
+        if str(uuid).lower() != PMD_CONTROL.lower():
+            return
+
+        op_code, measurement = data[0], data[1]
+        error = 0x00 if measurement in PMD_AVAILABLE_SETTINGS else 0x01
+        reply = bytearray([Pmd.PMD_CONTROL_RESPONSE, op_code, measurement, error, 0x00])
+
+        if op_code == Pmd.PMD_GET_SETTINGS and not error:
+            for setting, values in PMD_AVAILABLE_SETTINGS[measurement].items():
+                reply += bytearray([setting, len(values)])
+                for value in values:
+                    reply += value.to_bytes(Pmd.PMD_SETTING_SIZE[setting], byteorder='little')
+
+        elif op_code == Pmd.PMD_START_MEASUREMENT and not error:
+            requested = {}
+            offset = 2
+            while offset + 1 < len(data):
+                setting, size = data[offset], Pmd.PMD_SETTING_SIZE[data[offset]]
+                requested[setting] = int.from_bytes(data[offset + 2 : offset + 2 + size], byteorder='little')
+                offset += 2 + size
+
+            sample_rate = requested.get(Pmd.PMD_SAMPLE_RATE, PMD_AVAILABLE_SETTINGS[measurement][Pmd.PMD_SAMPLE_RATE][0])
+
+            if measurement == Pmd.PMD_ECG and self.device.settings['ecg_rate'] > 0:
+                sample_rate = self.device.settings['ecg_rate']
+
+            self.measurements[measurement] = sample_rate
+            self.start_streams()
+
+        # The response is an indication, it arrives after the write
+        callback = self.callbacks.get(PMD_CONTROL.lower())
+        if callback is not None:
+            asyncio.get_running_loop().call_soon(callback, PMD_CONTROL, reply)
+
+
+    async def start_notify(self, uuid, callback, **kwargs):
+        '''
+        Start the notifications of a characteristic
+        '''
+
+        self.check_connected()
+
+        uuid = str(uuid).lower()
+        self.callbacks[uuid] = callback
+
+        if uuid == HEART_RATE:
+            self.tasks[uuid] = asyncio.create_task(self.stream(HEART_RATE, self.device.hr_frames(), 1))
+        elif uuid == PMD_DATA.lower():
+            self.start_streams()
+
+
+    async def stop_notify(self, uuid):
+        '''
+        Stop the notifications of a characteristic
+        '''
+
+        uuid = str(uuid).lower()
+        self.callbacks.pop(uuid, None)
+
+        for key in [key for key in self.tasks if key == uuid or (uuid == PMD_DATA.lower() and key in self.measurements)]:
+            self.tasks.pop(key).cancel()
+
+
+    def start_streams(self):
+        '''
+        Start the PMD measurements requested, once the notifications of the data are enabled
+        '''
+
+        if PMD_DATA.lower() not in self.callbacks:
+            return
+
+        for measurement, sample_rate in self.measurements.items():
+            if measurement not in self.tasks:
+                self.tasks[measurement] = asyncio.create_task(self.stream(PMD_DATA, self.device.pmd_frames(measurement, sample_rate), self.device.settings['burst']))
+
+
+    async def stream(self, uuid, frames, burst):
+        '''
+        Deliver the notifications of a generator at their due time
+
+        The frames due while the task slept are sent at once, so the rates above the
+        resolution of the event loop are kept. Frames are lost with the drop probability and
+        grouped in bursts of notifications.
+
+        Parameters:
+            uuid (str): characteristic of the notifications;
+            frames (generator): (due time, payload) of each notification;
+            burst (int): number of notifications delivered together.
+        '''
+
+        settings = self.device.settings
+        pending = []
+
+        for due, payload in frames:
+            delay = due - self.device.now()
+
+            # Always yield to the loop, even when the frames are late
+            await asyncio.sleep(max(0.0, delay) / self.device.speed)
+
+            if self.device.rng.random() < settings['drop']:
+                continue
+
+            pending.append(payload)
+
+            if len(pending) >= burst:
+                callback = self.callbacks.get(uuid.lower())
+
+                for payload in pending:
+                    if callback is not None:
+                        callback(uuid, payload)
+
+                pending = []
+
+        for payload in pending:
+            if uuid.lower() in self.callbacks:
+                self.callbacks[uuid.lower()](uuid, payload)
+
+        self.device.stream_finished(uuid)
+
+
+class Simulated_scanner:
+    '''
+    Stand-in of the BleakScanner that discovers the simulated devices.
+    '''
+
+    def __init__(self, detection_callback=None, devices=None, **kwargs):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            detection_callback (function): function called with each device found;
+            devices (list): devices advertised, the simulated ones by default.
+        '''
+
+        self.detection_callback = detection_callback
+        self.devices = devices if devices is not None else Simulated_device.all()
+        self.task = None
+
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+
+    async def start(self):
+        '''
+        Start to advertise the simulated devices
+        '''
+
+        self.task = asyncio.create_task(self.advertise())
+
+
+    async def stop(self):
+        '''
+        Stop the advertisements
+        '''
+
+        if self.task is not None:
+            self.task.cancel()
+
+
+    async def advertise(self):
+        '''
+        Send one advertisement of each device to the detection callback
+        '''
+
+        for device in self.devices:
+            await asyncio.sleep(0.01)
+
+            if self.detection_callback is not None:
+                self.detection_callback(SimpleNamespace(name=device.name, address=device.address),
+                                        SimpleNamespace(local_name=device.name, rssi=-60))
+
+
+    @classmethod
+    async def discover(cls, timeout=5.0, devices=None, **kwargs):
+        '''
+        Return all the simulated devices
+        '''
+
+        devices = devices if devices is not None else Simulated_device.all()
+
+        return [SimpleNamespace(name=device.name, address=device.address) for device in devices]
@@ -0,0 +1,152 @@
+import math
+
+
+# A frame is late when the interval to the previous one exceeds its expected duration by this factor
+GAP_TOLERANCE = 1.5
+
+
+class Stream_stats:
+    '''
+    Incremental statistics of one notification stream.
+
+    The sensor timestamps and the number of samples of each frame give the effective sample
+    rate and the gaps (dropped frames) of the stream. The host arrival times give the
+    notification inter-arrival jitter. Every update is O(1).
+    '''
+
+    def __init__(self, sample_rate=None, nominal_interval=None):
+        '''
+        Initialize the class variables
+
+        Parameters:
+            sample_rate (float): nominal sample rate (Hz) of the streams with sensor timestamps;
+            nominal_interval (float): expected interval (s) between notifications of the streams
+                without sensor timestamps, used to detect their gaps.
+        '''
+
+        self.sample_rate = sample_rate
+        self.nominal_interval = nominal_interval
+
+        self.frames = 0
+        self.samples = 0
+        self.bytes = 0
+        self.gaps = 0
+        self.missing = 0
+
+        self.first_timestamp = None
+        self.first_samples = 0
+        self.last_timestamp = None
+
+        self.first_arrival = None
+        self.last_arrival = None
+
+        # Running mean and variance (Welford) of the inter-arrival interval
+        self.interval_count = 0
+        self.interval_mean = 0.0
+        self.interval_m2 = 0.0
+        self.interval_max = 0.0
+
+
+    def add_frame(self, arrival, n_samples, n_bytes, timestamp=None):
+        '''
+        Update the statistics with a new notification
+
+        Parameters:
+            arrival (float): host arrival time (s, monotonic clock);
+            n_samples (int): number of samples in the frame;
+            n_bytes (int): size of the notification;
+            timestamp (int): sensor timestamp (ns) of the last sample of the frame, if available.
+        '''
+
+        self.frames += 1
+        self.samples += n_samples
+        self.bytes += n_bytes
+
+        if self.last_arrival is not None:
+            interval = arrival - self.last_arrival
+
+            self.interval_count += 1
+            delta = interval - self.interval_mean
+            self.interval_mean += delta / self.interval_count
+            self.interval_m2 += delta * (interval - self.interval_mean)
+            self.interval_max = max(self.interval_max, interval)
+
+            # Streams without sensor time are checked against their nominal interval
+            if timestamp is None and self.nominal_interval and interval > GAP_TOLERANCE * self.nominal_interval:
+                self.gaps += 1
+                self.missing += int(round(interval / self.nominal_interval)) - 1
+        else:
+            self.first_arrival = arrival
+
+        self.last_arrival = arrival
+
+        if timestamp is None:
+            return
+
+        if self.last_timestamp is not None and self.sample_rate:
+            expected = n_samples / self.sample_rate * 1e9
+            elapsed = timestamp - self.last_timestamp
+
+            if elapsed > GAP_TOLERANCE * expected:
+                self.gaps += 1
+                self.missing += max(0, int(round(elapsed * self.sample_rate / 1e9)) - n_samples)
+        elif self.first_timestamp is None:
+            self.first_timestamp = timestamp
+            self.first_samples = n_samples
+
+        self.last_timestamp = timestamp
+
+
+    def effective_rate(self):
+        '''
+        Return the effective sample rate (Hz), from the sensor time when available
+        '''
+
+        if self.first_timestamp is not None and self.last_timestamp > self.first_timestamp:
+            return (self.samples - self.first_samples) / ((self.last_timestamp - self.first_timestamp) / 1e9)
+
+        if self.first_arrival is not None and self.last_arrival > self.first_arrival:
+            return (self.samples - 1) / (self.last_arrival - self.first_arrival)
+
+        return math.nan
+
+
+    def jitter(self):
+        '''
+        Return the standard deviation (s) of the notification inter-arrival interval
+        '''
+
+        if self.interval_count < 2:
+            return math.nan
+
+        return math.sqrt(self.interval_m2 / (self.interval_count - 1))
+
+
+    def summary(self):
+        '''
+        Return a short description of the stream for the interface
+        '''
+
+        return (f'{self.effective_rate():.1f} Hz, {self.gaps} gaps ({self.missing} missing), '
+                f'jitter {1000 * self.jitter():.1f} ms')
+
+
+    def to_dict(self):
+        '''
+        Return the statistics as a JSON serializable dictionary
+        '''
+
+        rate = self.effective_rate()
+        jitter = self.jitter()
+
+        return {'nominal_rate': self.sample_rate,
+                'effective_rate': None if math.isnan(rate) else rate,
+                'frames': self.frames,
+                'samples': self.samples,
+                'bytes': self.bytes,
+                'gaps': self.gaps,
+                'missing_samples': self.missing,
+                'interval_mean': self.interval_mean if self.interval_count else None,
+                'interval_max': self.interval_max if self.interval_count else None,
+                'jitter': None if math.isnan(jitter) else jitter,
+        }
@@ -1,34 +1,46 @@
-import asyncio
-import datetime
+import json
+import threading
 import time as ts
 
-import pandas as pd
-from pynput.keyboard import Key, Listener, KeyCode, Controller
+from pynput.keyboard import Listener, KeyCode
 from PyQt5.QtCore import QThread, pyqtSignal
 
+from lib.Clock_model import Clock_model
+from lib.Data import Data
+from lib.Quantile_sketch import Quantile_sketch
+from lib.Stream_stats import Stream_stats
+
 
 class Tapping_thread(QThread):
     '''
     Class responsible for performing tapping experiment.
+
+    The presses are stamped with time.perf_counter_ns, the host time base of the RR, ECG and
+    accelerometer streams, and each one is appended to the output file as soon as it happens.
+    The timestamp column is the time since the first beat of the collection, as the time of
+    the RR file (NaN for the presses before it), host_ns is the host time of the press.
     '''
 
     # Variables that connect this thread with the main thread
+    tap_signal = pyqtSignal(float)
     stop_signal = pyqtSignal()
     finished_signal = pyqtSignal()
 
 
-    def __init__(self, save_current_time, output_filename):
+    def __init__(self, save_current_time, output_filename, collector):
         '''
         Initialize the class variables
 
         Parameters:
             save_current_time (boolean): flag that decides if the current PC time will be saved;
-            output_filename (string): filename of the ouput file.
+            output_filename (string): filename of the ouput file;
+            collector (Data_collector): collection of the RR intervals, their time 0 is the time 0 of the taps.
         '''
 
         super().__init__()
         self.save_current_time = save_current_time
         self.output_filename = output_filename
+        self.collector = collector
 
 
     def run(self):
@@ -38,21 +50,34 @@ class Tapping_thread(QThread):
         This function perform the tapping experiment
         '''
 
-        self.t0 = None
+        # Name of the thread in the profiling reports
+        threading.current_thread().name = 'Tapping'
+
         self.tapping_timestamp = []
-        self.tapping_machine_timestamp = []
+        self.tapping_host_ns = []
+
+        # Anchor of the time of day, the presses only read the monotonic clock
+        self.clock = Clock_model()
+
+        # Interval between the presses and time spent (ms) to store each one
+        self.tap_stats = Stream_stats()
+        self.handling_sketch = Quantile_sketch(0, 10, 0.01)
+
+        filename = self.output_filename + '-tapping-' + Data().get_time() + '.csv'
+
+        print (f'------ Save tapping in \"{filename}\" ------\n\n')
+
+        self.outfile = open(filename, 'w')
+        self.outfile.write(',timestamp,host_ns' + (',current_time' if self.save_current_time else '') + '\n')
+        self.outfile.flush()
 
         # Setting the listener to always catch the keyboard input
         self.listener = Listener(on_press=self.on_press)
 
-        # Listenning to all keyboard input
+        # Listenning to all keyboard input until the listener is stopped
         with self.listener:
             self.listener.join()
 
-        # Release the RIGHT key after listener was unlock
-        key = Controller()
-        key.release(Key.right)
-
         print('------ Tapping experiment was stopped. ------\n\n')
 
         self.save()
@@ -67,42 +92,58 @@ class Tapping_thread(QThread):
         key (KeyCode): represents the key pressed
         '''
 
+        # Stamp before anything else, so the handling of the key does not delay it
+        host_ns = ts.perf_counter_ns()
+
         if key == KeyCode.from_char('b'):
-            if self.tapping_timestamp == []:
-                # Sets t0 to current time
-                self.t0 = ts.time()
-                t = 0
-            else:
-                t = ts.time() - self.t0
+            # Same time 0 as the RR intervals, set by the collector at the first beat
+            data_rr = self.collector.data_rr
+            t = host_ns / 1e9 - data_rr.t0 if data_rr.time != [] else float('nan')
 
             self.tapping_timestamp.append(t)
+            self.tapping_host_ns.append(host_ns)
+
+            row = f'{len(self.tapping_timestamp) - 1},{t},{host_ns}'
 
             if self.save_current_time:
-                cur_t = datetime.datetime.now().time()
-                self.tapping_machine_timestamp.append(cur_t)
+                row += f',{self.clock.wall_time(host_ns / 1e9)}'
+
+            self.outfile.write(row + '\n')
+            self.outfile.flush()
+
+            self.tap_signal.emit(host_ns / 1e9)
+
+            self.tap_stats.add_frame(host_ns / 1e9, 1, 0)
+            self.handling_sketch.add((ts.perf_counter_ns() - host_ns) / 1e6)
 
             print('\'B\' was pressed in: ', t)
 
 
     def save(self):
         '''
-        Save the timestamps when the \'B\' key was pressed.
+        Close the file with the timestamps when the \'B\' key was pressed and save the timing
+        statistics of the presses.
         '''
 
-        current_time = datetime.datetime.now()
+        self.outfile.close()
 
-        filename = self.output_filename + '-tapping-' + str(current_time) + '.csv'
+        stats = {'taps': self.tap_stats.frames,
+                 'interval_mean': self.tap_stats.interval_mean if self.tap_stats.interval_count else None,
+                 'interval_sd': self.tap_stats.to_dict()['jitter'],
+                 'handling_ms': self.handling_sketch.to_dict(),
+        }
 
-        print (f'------ Save tapping in \"{filename}\" ------\n\n')
+        filename = self.output_filename + '-tapping-stats-' + Data().get_time() + '.json'
 
-        if not self.save_current_time:
-            df = pd.DataFrame(data={'timestamp': self.tapping_timestamp,})
-        else:
-            df = pd.DataFrame(data={'timestamp': self.tapping_timestamp,
-                                    'current_time': self.tapping_machine_timestamp,
-            })
+        with open(filename, 'w') as outfile:
+            json.dump(stats, outfile)
 
-        df.to_csv(filename, sep=',', header=True)
+        if self.tap_stats.frames > 0:
+            print(f'Taps: {self.tap_stats.frames}   '
+                  f'Interval SD: {1000 * self.tap_stats.jitter():.1f} ms   '
+                  f'Handling p50/p99: {self.handling_sketch.quantile(0.5):.3f}/{self.handling_sketch.quantile(0.99):.3f} ms')
+
+        print (f'------ Save tapping statistics in \"{filename}\" ------\n\n')
 
 
     def stop(self):
@@ -112,9 +153,5 @@ class Tapping_thread(QThread):
         This method will be connected to the stop_signal
         '''
 
-        # Stop the listener
+        # Stop the listener, this also releases the join in run()
         self.listener.stop()
-
-        # Force a pressing on RIGHT key just to unlock the listener
-        key = Controller()
-        key.press(Key.right)
\ No newline at end of file
@@ -0,0 +1,203 @@
+import numpy as np
+
+
+# Relative difference of the scores accepted as the same when comparing with the reference
+SCORE_TOLERANCE = 1e-9
+
+
+def mutual_information_curve(values, labels):
+    '''
+    Mutual information between the labels and the split "value > threshold", for every threshold
+
+    The values are sorted once, then the cumulative count of each class gives the contingency
+    table of all the splits at the same time, so the search is O(n log n) instead of scoring
+    each split separately. The candidate thresholds are the midpoints between consecutive
+    distinct values, the scores are in nats as sklearn.metrics.mutual_info_score.
+
+    Parameters:
+        values (array): feature of each window (as the sdNN);
+        labels (array): class of each window (as the real state).
+
+    Returns:
+        numpy.ndarray with the thresholds, numpy.ndarray with the score of each threshold
+    '''
+
+    values = np.asarray(values, dtype=float)
+    classes, labels = np.unique(np.asarray(labels), return_inverse=True)
+
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    labels = labels[order]
+
+    n = len(values)
+
+    # The splits are only between different values
+    boundaries = np.flatnonzero(values[1:] != values[:-1])
+    if len(boundaries) == 0:
+        return np.array([]), np.array([])
+
+    thresholds = (values[boundaries] + values[boundaries + 1]) / 2
+
+    # Number of windows of each class up to (and including) each boundary: the "value <= threshold" side
+    one_hot = np.zeros((n, len(classes)))
+    one_hot[np.arange(n), labels] = 1
+    below = np.cumsum(one_hot, axis=0)[boundaries]
+    totals = one_hot.sum(axis=0)
+    above = totals - below
+
+    # Contingency tables of all the splits: (thresholds, side, class)
+    joint = np.stack([below, above], axis=1)
+    sides = joint.sum(axis=2, keepdims=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = joint / n * np.log(n * joint / (sides * totals))
+
+    scores = np.nansum(np.where(joint > 0, terms, 0), axis=(1, 2))
+
+    return thresholds, np.maximum(scores, 0)
+
+
+def best_thresholds(matrix, labels):
+    '''
+    Return the best threshold of each feature (column) of a matrix and its score
+
+    Each column is searched by best_threshold without its missing values (NaN, as the windows
+    before the first complete one).
+
+    Parameters:
+        matrix (array): windows x features;
+        labels (array): class of each window.
+
+    Returns:
+        numpy.ndarray with the threshold of each feature (NaN when it cannot be split), numpy.ndarray with its score
+    '''
+
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+
+    labels = np.asarray(labels)
+
+    thresholds = np.full(matrix.shape[1], np.nan)
+    scores = np.zeros(matrix.shape[1])
+
+    for column in range(matrix.shape[1]):
+        valid = ~np.isnan(matrix[:, column])
+        threshold, score = best_threshold(matrix[valid, column], labels[valid])
+
+        if threshold is not None:
+            thresholds[column], scores[column] = threshold, score
+
+    return thresholds, scores
+
+
+def best_threshold(values, labels):
+    '''
+    Return the threshold with the highest mutual information and its score
+
+    The lowest threshold is returned when several have the same score, None when the values
+    cannot be split (all equal).
+    '''
+
+    thresholds, scores = mutual_information_curve(values, labels)
+
+    if len(thresholds) == 0:
+        return None, 0.0
+
+    best = np.argmax(scores)
+
+    return float(thresholds[best]), float(scores[best])
+
+
+def side_states(values, labels, threshold):
+    '''
+    Return the most frequent state of each side of a threshold: [below or equal, above]
+    '''
+
+    values = np.asarray(values, dtype=float)
+    labels = np.asarray(labels)
+    above = values > threshold
+
+    sides = []
+    for side in (~above, above):
+        states, counts = np.unique(labels[side], return_counts=True)
+        sides.append(states[np.argmax(counts)] if len(states) > 0 else labels[0])
+
+    return sides
+
+
+def agreement(values, labels, threshold, sides):
+    '''
+    Return the fraction of the windows whose side of the threshold predicts their state
+
+    Parameters:
+        values (array): feature of each window;
+        labels (array): state of each window;
+        threshold (float): decision boundary;
+        sides (list): state predicted below (or equal) and above the threshold, from side_states.
+    '''
+
+    values = np.asarray(values, dtype=float)
+
+    if len(values) == 0:
+        return float('nan')
+
+    predicted = np.where(values > threshold, sides[1], sides[0])
+
+    return float(np.mean(predicted == np.asarray(labels)))
+
+
+def brute_force_threshold(values, labels):
+    '''
+    Reference of best_threshold: score each midpoint separately with scikit-learn, O(n^2)
+
+    Only used to check the vectorized search on small datasets.
+    '''
+
+    from sklearn.metrics import mutual_info_score
+
+    values = np.asarray(values, dtype=float)
+    ordered = np.sort(values)
+    midpoints = np.unique((ordered[1:] + ordered[:-1]) / 2)
+
+    best_threshold, best_score = None, 0.0
+
+    for midpoint in midpoints:
+        # Midpoints equal to a value (between two equal values) are not splits between values
+        if np.any(values == midpoint):
+            continue
+
+        score = mutual_info_score(labels, (values > midpoint).astype(int))
+
+        if best_threshold is None or score > best_score * (1 + SCORE_TOLERANCE) + SCORE_TOLERANCE:
+            best_threshold, best_score = float(midpoint), score
+
+    return best_threshold, best_score
+
+
+def check_against_reference(values, labels):
+    '''
+    Compare the vectorized search with the brute force reference
+
+    The thresholds may differ only when their scores are the same (up to the rounding).
+
+    Returns:
+        True when they agree, the result of the search and the result of the reference
+    '''
+
+    threshold, score = best_threshold(values, labels)
+    reference, reference_score = brute_force_threshold(values, labels)
+
+    same_score = abs(score - reference_score) <= SCORE_TOLERANCE * max(1.0, abs(reference_score))
+
+    if threshold is None or reference is None:
+        return threshold == reference, (threshold, score), (reference, reference_score)
+
+    if threshold == reference:
+        return same_score, (threshold, score), (reference, reference_score)
+
+    # A tie: the reference threshold must have the same score in the vectorized curve
+    thresholds, scores = mutual_information_curve(values, labels)
+    tied = abs(scores[np.searchsorted(thresholds, reference)] - score) <= SCORE_TOLERANCE * max(1.0, score)
+
+    return same_score and tied, (threshold, score), (reference, reference_score)